@@ -0,0 +1,252 @@
+"""
+autosave.py
+Author: Russell Johnson
+Date 11 Dec 2025
+SER416 Final Project
+Saves changes in the background as they are made. The main loop hands each set of changes to a writer
+thread through a queue and goes straight back to the user. The writer first appends the changes to a
+journal file, then writes them to the database in small transactions. Once the database has everything,
+the journal is deleted. If the program stops before that, whatever is left in the journal is written the
+next time it starts
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+import database
+
+# ------------------
+# Constants
+# ------------------
+
+# max number of households written in one transaction. Small transactions keep the database free for
+# reads, and a bigger batch of changes is split across several of them
+TRANSACTION_ROWS = 5000
+
+
+# ------------------
+# Writing
+# ------------------
+
+def _pieces(batch: dict):
+    """
+    Splits a batch of changes into pieces no bigger than a transaction. An overwrite is never split, since
+    the table would be left half replaced in between
+    :param batch: dict from HouseholdStore.take_changes
+    :return: generator of (removed addresses, rows, replace_all)
+    """
+    rows = batch['rows']
+    if batch['replace_all']:
+        yield [], rows, True
+        return
+    yield batch['removed'], rows[:TRANSACTION_ROWS], False
+    for start in range(TRANSACTION_ROWS, len(rows), TRANSACTION_ROWS):
+        yield [], rows[start:start + TRANSACTION_ROWS], False
+
+
+def write_batches(conn: sqlite3.Connection, batches: list[dict]) -> None:
+    """
+    Writes batches of changes in order, putting small batches together in one transaction and splitting
+    big ones. Writing a batch again gives the same result, so a write that failed part way can be retried
+    from the first batch
+    :param conn: open database connection
+    :param batches: list of dicts from HouseholdStore.take_changes
+    """
+    written = 0
+    try:
+        for batch in batches:
+            for removed, rows, replace_all in _pieces(batch):
+                database.write_changes(conn, removed, rows, replace_all)
+                written += len(removed) + len(rows)
+                if written >= TRANSACTION_ROWS:
+                    conn.commit()
+                    written = 0
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def _read_journal(journal_filename: str) -> list[dict]:
+    """
+    :param journal_filename: journal file to read
+    :return: list of the batches in the journal, in the order they were made
+    """
+    batches = []
+    with open(journal_filename, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                batches.append(json.loads(line))
+            except json.JSONDecodeError:
+                # the program stopped part way through writing this line, so it never reached the database
+                break
+    return batches
+
+
+def replay(conn: sqlite3.Connection, journal_filename: str) -> int:
+    """
+    Writes the changes left in the journal by a session that did not finish saving, then deletes the
+    journal. Run this before an AutoSaver is started with the same journal
+    :param conn: open database connection
+    :param journal_filename: journal file of the AutoSaver
+    :return: number of batches of changes written. 0 if there was no journal
+    """
+    if not os.path.exists(journal_filename):
+        return 0
+    batches = _read_journal(journal_filename)
+    write_batches(conn, batches)  # raises before the journal is deleted if the write fails
+    os.remove(journal_filename)
+    return len(batches)
+
+
+# ------------------
+# AutoSaver class
+# ------------------
+
+class AutoSaver:
+    """
+    Writes changes to the database from a background thread. Changes handed to submit are confirmed in the
+    store by settle once they are in the database
+    """
+
+    def __init__(self, filename: str, journal_filename: str, wal: bool = False) -> None:
+        """
+        Starts the writer thread. It opens its own connection, since a connection can only be used by the
+        thread that opened it
+        :param filename: sqlite file to write to
+        :param journal_filename: file to keep changes in until they are in the database
+        :param wal: true to switch the database to write-ahead logging, so reads never wait for a write. The
+            switch is stored in the file, which keeps -wal and -shm files next to it from then on
+        """
+        self.filename = filename
+        self.journal_filename = journal_filename
+        self.wal = wal
+        self.error = None  # message of the last failed write, None once a write works again
+        self._next_batch = 1
+        self._queue = queue.Queue()  # batches, events to set once the queue is written, or None to stop
+        self._done = queue.SimpleQueue()  # numbers of the batches that are in the database
+        self._lock = threading.Lock()  # held while writing, so a reader can wait for the database to settle
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+
+    def submit(self, store) -> bool:
+        """
+        Hands everything that changed in a store since the last submit to the writer thread. Does not wait
+        :param store: HouseholdStore
+        :return: true if there were changes to hand off
+        """
+        batch = store.take_changes(self._next_batch)
+        if batch is None:
+            return False
+        self._next_batch += 1
+        self._queue.put(batch)
+        return True
+
+    def settle(self, store) -> None:
+        """
+        Confirms the batches that have been written since the last call. Does not wait
+        :param store: HouseholdStore the batches were taken from
+        """
+        while True:
+            try:
+                store.confirm(self._done.get_nowait())
+            except queue.Empty:
+                return
+
+    @contextmanager
+    def settled(self, store):
+        """
+        Keeps the writer from changing the database while the caller reads it, so what the store still
+        tracks as unsaved and what the database holds add up exactly. Only waits for a write in progress
+        :param store: HouseholdStore the batches were taken from
+        """
+        with self._lock:
+            self.settle(store)
+            yield
+
+    def save(self, store) -> bool:
+        """
+        Hands off the latest changes and waits until everything handed off is in the database
+        :param store: HouseholdStore
+        :return: true if every change was written
+        """
+        if not self._thread.is_alive():  # nothing would ever answer, so don't wait
+            self.error = self.error or "the autosave writer has stopped"
+            return False
+        self.submit(store)
+        written = threading.Event()
+        self._queue.put(written)
+        while not written.wait(timeout=1):
+            if not self._thread.is_alive():
+                self.error = self.error or "the autosave writer has stopped"
+                return False
+        self.settle(store)
+        return self.error is None
+
+    def close(self) -> None:
+        """
+        Stops the writer thread once it has written what it was given. The journal is deleted if
+        everything made it into the database, otherwise it is kept to be replayed on the next start
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    # ------------------
+    # Writer thread
+    # ------------------
+
+    def _append_journal(self, batches: list[dict]) -> None:
+        """
+        Adds batches to the end of the journal and makes sure they are on disk
+        :param batches: list of dicts from HouseholdStore.take_changes
+        """
+        with open(self.journal_filename, 'a', encoding='utf-8') as file:
+            for batch in batches:
+                file.write(json.dumps(batch) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _run(self) -> None:
+        """
+        Writer thread. Takes everything waiting in the queue at once, journals it, then writes it along with
+        any batches an earlier write failed on
+        """
+        conn = None
+        pending = []  # batches in the journal that are not in the database yet
+        running = True
+        while running:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batches = [item for item in items if isinstance(item, dict)]
+            waiting = [item for item in items if isinstance(item, threading.Event)]
+            running = None not in items
+
+            pending += batches
+            try:
+                if batches:
+                    self._append_journal(batches)
+                if pending:
+                    if conn is None:
+                        conn = database.open_database(self.filename)
+                        if self.wal:  # readers see the last commit instead of waiting for a write to finish
+                            conn.execute("PRAGMA journal_mode = WAL")
+                    with self._lock:
+                        write_batches(conn, pending)
+                        for batch in pending:
+                            self._done.put(batch['batch'])
+                    pending = []
+                    os.remove(self.journal_filename)  # nothing in it that the database does not have now
+                self.error = None
+            except Exception as e:  # anything that goes wrong must not stop the writer, or save would wait forever
+                self.error = str(e) or type(e).__name__  # the batches stay pending, and are tried again
+            finally:
+                for event in waiting:
+                    event.set()
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,335 @@
+"""
+batch.py
+Author: Russell Johnson
+Date 14 Dec 2025
+SER416 Final Project
+Runs the tracker's bulk operations from the command line with no menus, so they can be scheduled or
+scripted. Each command uses the same functions as the menu and works on the database in the current
+folder. Data goes to stdout as CSV, progress and errors go to stderr, and the exit code is 0 if it worked,
+1 if something failed and 2 if the command line was wrong.
+
+    python main.py import north.csv south.csv
+    python main.py merge feeds/*.csv --workers 4
+    python main.py export contacts.csv.gz --filter "contact and news_ltr"
+    python main.py validate
+    python main.py stats --by city
+    python main.py query --zip 85001 --filter "dogs" --limit 100
+"""
+from __future__ import annotations
+import argparse
+import contextlib
+import os
+import sqlite3
+import sys
+import household as hh
+import flags
+import database
+import csv_import
+import csv_export
+import columnar_io
+import autosave
+import rollups
+import triage
+import main
+from repository import HouseholdRepository
+
+# ------------------
+# Constants
+# ------------------
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # the command ran but something failed, such as a file that could not be read or invalid rows
+
+
+# ------------------
+# Helpers
+# ------------------
+
+def _filter(parser: argparse.ArgumentParser, args: argparse.Namespace) -> tuple:
+    """
+    :param parser: parser to report a bad filter with, which exits
+    :param args: parsed arguments with a filter
+    :return: parsed filter from triage.parse
+    """
+    try:
+        return triage.parse(args.filter or "")
+    except triage.TriageError as e:
+        parser.error(f"bad filter: {e}")
+
+
+def _add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options that pick which saved households a command works on
+    :param parser: subcommand parser
+    """
+    parser.add_argument("--filter", help="triage filter, such as \"contact and news_ltr\" or \"children > 0\"")
+    parser.add_argument("--zip", help="only households in this zip code")
+    parser.add_argument("--city", help="only households in this city. Case does not matter")
+
+
+def _print_counts(name: str, totals: dict) -> None:
+    """
+    Prints the counts of one imported file
+    :param name: file that was imported
+    :param totals: counts from csv_import
+    """
+    print(f"FILE OPERATION: {name} - {totals['added']} of {totals['rows']} rows added, {totals['duplicates']} "
+          f"duplicates, {totals['rejected']} rejected, {totals['possible_duplicates']} possible duplicates",
+          file=sys.stderr)
+
+
+# ------------------
+# Commands
+# ------------------
+
+def run_import(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    """
+    Streams files straight into the database one after another, each in its own transaction, so memory use
+    stays the same however big the files are. A file that fails changes nothing and the rest still run
+    :return: exit code
+    """
+    overwrite = args.overwrite
+    status = EXIT_OK
+    for name in args.files:
+        try:
+            # the chunk counts would mix with the command's own output, so they go to stderr too
+            with contextlib.redirect_stdout(sys.stderr):
+                totals = csv_import.import_csv(
+                    name, db_conn=conn, overwrite=overwrite, chunk_size=args.chunk_size,
+                    quarantine_file=None if args.no_quarantine else csv_import.quarantine_filename(name),
+                    duplicate_file=None if args.no_duplicates else csv_import.duplicate_filename(name))
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Error: could not import {name} - {e}", file=sys.stderr)
+            status = EXIT_FAILED
+            continue
+        overwrite = False  # only the first file that imports replaces what was saved
+        _print_counts(name, totals)
+    return status
+
+
+def run_merge(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    """
+    Reads files at the same time in worker processes, merges them into the saved households in the order
+    given, then saves. Faster than import for many files on a machine with several CPUs
+    :return: exit code
+    """
+    store = main.open_store(HouseholdRepository(conn))
+    with contextlib.redirect_stdout(sys.stderr):
+        totals = csv_import.import_many(args.files, store, workers=args.workers, chunk_size=args.chunk_size,
+                                        quarantine=not args.no_quarantine,
+                                        report_duplicates=not args.no_duplicates)
+        saved = main.save_to_sql(store)
+    print(f"FILE OPERATION: {totals['added']} of {totals['rows']} rows from {len(args.files)} files added, "
+          f"{totals['duplicates']} duplicates, {totals['rejected']} rejected, in {totals['seconds']:.1f}s "
+          f"({totals['rows_per_second']:,.0f} rows/s)", file=sys.stderr)
+    failed = any(counts['error'] is not None for counts in totals['files'])
+    return EXIT_FAILED if failed or not saved else EXIT_OK
+
+
+def run_export(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    """
+    Writes the saved households to a file. CSV files are streamed from the database and can be filtered,
+    Parquet and Arrow files hold every household
+    :return: exit code
+    """
+    if columnar_io.is_columnar(args.file):
+        if args.filter or args.zip or args.city:
+            args.parser.error("Parquet and Arrow exports hold every household, so they can't be filtered")
+        with contextlib.redirect_stdout(sys.stderr):
+            store = main.open_store(HouseholdRepository(conn))
+            columnar_io.write_store(store, args.file)
+        count = len(store)
+    elif csv_export.extension(args.file) is None:
+        extensions = list(csv_export.FORMATS) + list(columnar_io.FORMATS)
+        args.parser.error(f"the file must end in one of {', '.join(extensions)}")
+    else:
+        count = csv_export.export_csv(conn, args.file, _filter(args.parser, args), zip_code=args.zip,
+                                      city=args.city, chunk_size=args.chunk_size)
+    print(f"FILE OPERATION: {count} households exported to {args.file}", file=sys.stderr)
+    return EXIT_OK
+
+
+def _validate_chunks(chunks) -> dict:
+    """
+    Validates dataframes one at a time and adds up what was wrong
+    :param chunks: iterator of dataframes of household data
+    :return: dict with the number of 'rows', 'invalid_rows', and 'errors' (dict of column name to number
+        of invalid values)
+    """
+    totals = {'rows': 0, 'invalid_rows': 0, 'errors': {}}
+    for chunk in chunks:
+        _, summary = hh.validate_dataframe(chunk)
+        totals['rows'] += summary['rows']
+        totals['invalid_rows'] += summary['invalid_rows']
+        for col, count in summary['errors'].items():
+            totals['errors'][col] = totals['errors'].get(col, 0) + count
+    return totals
+
+
+def _saved_chunks(conn: sqlite3.Connection, chunk_size: int):
+    """
+    :return: iterator of dataframes of the saved households, a chunk at a time
+    """
+    import pandas as pd
+
+    for rows in HouseholdRepository(conn).chunks(chunk_size=chunk_size):
+        # object columns keep the values as they were read, so one empty number can't turn the rest into floats
+        packed = pd.DataFrame(rows, columns=flags.PACKED_COLUMNS, dtype=object)
+        # the same values database.record_from_row gives, made a column at a time
+        columns = {col: packed[col].astype(str) if col in database.INT_COLUMNS else packed[col]
+                   for col in flags.PLAIN_COLUMNS}
+        columns.update(flags.unpack_frame(packed['flag_values'].astype('uint16').to_numpy(),
+                                          packed['flag_known'].astype('uint16').to_numpy()))
+        yield pd.DataFrame(columns, columns=hh.COLUMNS)
+
+
+def run_validate(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    """
+    Checks the saved households, or the given files, with the same rules as an import, a chunk at a time.
+    Prints a line for each field that has invalid values
+    :return: exit code. EXIT_FAILED if anything is invalid or a file could not be read
+    """
+    sources = args.files or [main.SQLITE_FILENAME]
+    status = EXIT_OK
+    for name in sources:
+        try:
+            chunks = csv_import.read_chunks(name, args.chunk_size) if args.files else \
+                _saved_chunks(conn, args.chunk_size)
+            totals = _validate_chunks(chunks)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Error: could not read {name} - {e}", file=sys.stderr)
+            status = EXIT_FAILED
+            continue
+        print(f"{name}: {totals['rows']} rows, {totals['invalid_rows']} invalid")
+        for col, count in totals['errors'].items():
+            if count > 0:
+                print(f"  {col}: {count} invalid")
+        if totals['invalid_rows'] > 0:
+            status = EXIT_FAILED
+    return status
+
+
+def run_stats(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    """
+    Prints the saved totals by zip code or city as CSV. Read from the rollups table, so this costs the
+    number of zip codes instead of the number of households
+    :return: exit code
+    """
+    totals = rollups.summarize(HouseholdRepository(conn).rollups(), args.by, args.value)
+    totals.to_csv(sys.stdout, index=False, lineterminator='\n')
+    return EXIT_OK
+
+
+def run_query(conn: sqlite3.Connection, args: argparse.Namespace) -> int:
+    """
+    Prints the saved households that match a filter, or a full text search, as CSV
+    :return: exit code
+    """
+    if args.search is not None:
+        if args.filter or args.zip or args.city:
+            args.parser.error("--search can't be combined with --filter, --zip or --city")
+        found = HouseholdRepository(conn).search(args.search, args.limit)
+        if args.count:
+            print(len(found))
+        else:
+            found.to_csv(sys.stdout, index=False, lineterminator='\n')
+        return EXIT_OK
+    node = _filter(args.parser, args)
+    if args.count:
+        count = HouseholdRepository(conn).count(zip_code=args.zip, city=args.city, node=node)
+        print(count if args.limit is None else min(count, args.limit))
+    else:
+        csv_export.write_csv(conn, sys.stdout, node, zip_code=args.zip, city=args.city, chunk_size=args.chunk_size,
+                             limit=args.limit)
+    return EXIT_OK
+
+
+# ------------------
+# Command line
+# ------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: parser with a subcommand for each of the run_* functions
+    """
+    parser = argparse.ArgumentParser(prog="main.py", description="Run CERT household tracker operations "
+                                     "without the menus. Start with no arguments for the menus.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    def command(name: str, function, help_text: str) -> argparse.ArgumentParser:
+        sub = commands.add_parser(name, help=help_text, description=help_text)
+        sub.set_defaults(function=function, parser=sub)
+        return sub
+
+    for name, function, help_text in [
+        ("import", run_import, "stream files straight into the database, one after another"),
+        ("merge", run_merge, "read files in parallel, merge them into the saved households, then save"),
+    ]:
+        sub = command(name, function, help_text)
+        sub.add_argument("files", nargs="+", help="CSV, Parquet or Arrow files")
+        sub.add_argument("--chunk-size", type=int, default=csv_import.DEFAULT_CHUNK_SIZE,
+                         help="rows read at a time")
+        sub.add_argument("--no-quarantine", action="store_true",
+                         help=f"don't write invalid rows to *{csv_import.QUARANTINE_SUFFIX}")
+        sub.add_argument("--no-duplicates", action="store_true",
+                         help=f"don't list possible duplicates in *{csv_import.DUPLICATE_SUFFIX}")
+        if name == "import":
+            sub.add_argument("--overwrite", action="store_true", help="replace the saved households")
+        else:
+            sub.add_argument("--workers", type=int, help="max worker processes. Defaults to the number of CPUs")
+
+    sub = command("export", run_export, "write the saved households to a CSV, Parquet or Arrow file")
+    sub.add_argument("file", help="file to write. .csv.gz and .csv.zst are compressed")
+    _add_filter_arguments(sub)
+    sub.add_argument("--chunk-size", type=int, default=csv_export.DEFAULT_CHUNK_SIZE, help="rows read at a time")
+
+    sub = command("validate", run_validate, "check the saved households, or files, for invalid rows")
+    sub.add_argument("files", nargs="*", help="CSV, Parquet or Arrow files. The database if not given")
+    sub.add_argument("--chunk-size", type=int, default=csv_import.DEFAULT_CHUNK_SIZE, help="rows read at a time")
+
+    sub = command("stats", run_stats, "print the totals by zip code or city as CSV")
+    sub.add_argument("--by", choices=list(rollups.GROUPINGS), default="zip", help="group the totals by")
+    sub.add_argument("--value", help="only this zip code or city")
+
+    sub = command("query", run_query, "print the saved households that match as CSV")
+    _add_filter_arguments(sub)
+    sub.add_argument("--search", help="words to find in the address, email or phone, instead of a filter")
+    sub.add_argument("--limit", type=int, help="max number of households")
+    sub.add_argument("--count", action="store_true", help="only print the number of households")
+    sub.add_argument("--chunk-size", type=int, default=csv_export.DEFAULT_CHUNK_SIZE, help="rows read at a time")
+    return parser
+
+
+def main_batch(argv: list[str] = None) -> int:
+    """
+    Runs one command from the command line
+    :param argv: command line arguments, not including the program name
+    :return: exit code
+    """
+    args = build_parser().parse_args(argv)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):  # upgrading an old database prints what it is doing
+            conn = database.open_database(main.SQLITE_FILENAME)
+    except sqlite3.Error as e:
+        print(f"Error: could not load database - {e}", file=sys.stderr)
+        return EXIT_FAILED
+    try:
+        # an interactive session that stopped before autosave finished leaves its changes in the journal
+        recovered = autosave.replay(conn, main.JOURNAL_FILENAME)
+        if recovered > 0:
+            print(f"Starting Up: Recovered {recovered} sets of changes that were not saved last time",
+                  file=sys.stderr)
+        return args.function(conn, args)
+    except BrokenPipeError:
+        # the reader of stdout stopped early, such as head. Anything still buffered is dropped
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return EXIT_OK
+    except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+        print(f"Error: could not complete {args.command} - {e}", file=sys.stderr)
+        return EXIT_FAILED
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main_batch())
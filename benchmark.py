@@ -0,0 +1,389 @@
+"""
+benchmark.py
+Author: Russell Johnson
+Date 6 Dec 2025
+SER416 Final Project
+Times the tracker's busiest operations on made up household data so changes can be checked for slowdowns.
+The made up data is the same every run for a given seed, and the results are written to a JSON file that
+can be compared against the results of an older version of the program.
+
+    python benchmark.py --sizes 1000 10000 --output before.json
+    python benchmark.py --sizes 1000 10000 --output after.json --compare before.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import household as hh
+from household import Household
+from household_store import HouseholdStore
+from repository import HouseholdRepository
+import database
+import csv_import
+import csv_export
+import columnar_io
+import autosave
+import main
+
+# ------------------
+# Constants
+# ------------------
+
+SIZES = [1000, 10000, 100000, 1000000]  # number of households in each round of benchmarks
+SEED = 416
+OPERATIONS = 200  # adds, gets and removes timed on each round
+LEGACY_OPERATIONS = 20  # the old dataframe helpers copy the whole table on each call, so time fewer of them
+RESULTS_FILENAME = "benchmark_results.json"
+SLOWER_THRESHOLD = 1.5  # a benchmark this many times slower than before is flagged when comparing
+# run in a new python process to time a cold start: importing the program, opening the database and the
+# household store, up to where the first menu is drawn. Prints the slow libraries that got imported on the way
+COLD_START_CODE = """
+import sys
+import main
+conn = main.database.open_database(main.SQLITE_FILENAME)
+main.open_store(main.HouseholdRepository(conn))
+print("imported:", *(name for name in ("pandas", "numpy") if name in sys.modules))
+"""
+
+# made up places the households are spread across, as (city, state, zip code prefix)
+PLACES = [
+    ("Portland", "OR", "972"), ("Salem", "OR", "973"), ("Eugene", "OR", "974"), ("Denver", "CO", "802"),
+    ("Boulder", "CO", "803"), ("Phoenix", "AZ", "850"), ("Tempe", "AZ", "852"), ("Tucson", "AZ", "857"),
+    ("Seattle", "WA", "981"), ("Spokane", "WA", "992"), ("Boise", "ID", "837"), ("Reno", "NV", "895"),
+]
+STREETS = [
+    "Main St", "Oak Ave", "Pine Rd", "Maple Dr", "Cedar Ln", "Elm St", "Birch Way", "Evergreen Terrace",
+    "Lakeview Blvd", "Hillcrest Ave", "Sunset Dr", "River Rd", "Park Pl", "Willow Ct", "Aspen Loop", "Juniper St",
+]
+REQUIRED_FLAGS = ["pets", "dogs", "crit_meds", "ref_meds", "special_needs", "gas_tank", "gas_line"]
+OPTIONAL_FLAGS = ["med_training", "know_nbr", "key_nbr", "news_ltr", "contact"]
+
+
+# ------------------
+# Made up data
+# ------------------
+
+def synthetic_households(count: int, seed: int = SEED, first: int = 0) -> pd.DataFrame:
+    """
+    Makes a dataframe of valid households. The same arguments always make the same households, and every
+    household has a different address
+    :param count: number of households to make
+    :param seed: random seed
+    :param first: number of the first household, so more unique households can be made later
+    :return: dataframe with the same columns as household.empty_dataframe()
+    """
+    rng = np.random.default_rng([seed, first])
+    numbers = np.arange(first, first + count)
+    places = rng.integers(0, len(PLACES), count)
+    zip_suffixes = rng.integers(0, 100, count)
+    cities, states, zip_prefixes = (np.array(values, dtype=object) for values in zip(*PLACES))
+
+    data = {
+        "adults": rng.integers(1, 6, count).astype(str).astype(object),
+        "children": rng.integers(0, 5, count).astype(str).astype(object),
+        # number and street together are unique, so the whole address is too
+        "adrs_number": (numbers // len(STREETS) + 1).astype(str).astype(object),
+        "adrs_street": np.array(STREETS, dtype=object)[numbers % len(STREETS)],
+        "adrs_city": cities[places],
+        "adrs_state": states[places],
+        "adrs_zip": [f"{prefix}{suffix:02d}" for prefix, suffix in zip(zip_prefixes[places], zip_suffixes)],
+    }
+    for col in REQUIRED_FLAGS:
+        data[col] = np.array(['t', 'f'], dtype=object)[rng.integers(0, 2, count)]
+    for col in OPTIONAL_FLAGS:
+        data[col] = np.array(['t', 'f', hh.NA], dtype=object)[rng.integers(0, 3, count)]
+    has_email = rng.random(count) < 0.7
+    has_phone = rng.random(count) < 0.8
+    phones = rng.integers(2000000000, 9999999999, count)
+    data["email"] = [f"resident{n}@example.com" if wanted else hh.NA for n, wanted in zip(numbers, has_email)]
+    data["phone"] = [str(phone) if wanted else hh.NA for phone, wanted in zip(phones, has_phone)]
+
+    df = pd.DataFrame(data)
+    df["address"] = hh.build_address(df)
+    return df[hh.COLUMNS]
+
+
+def synthetic_household_objects(count: int, seed: int = SEED, first: int = 0) -> list[Household]:
+    """
+    Makes Household objects the same way synthetic_households makes rows
+    :param count: number of households to make
+    :param seed: random seed
+    :param first: number of the first household
+    :return: list of Household objects
+    """
+    df = synthetic_households(count, seed, first)
+    return [Household(**{col: row[col] for col in hh.COLUMNS if col != "address"})
+            for row in df.to_dict('records')]
+
+
+# ------------------
+# Timing
+# ------------------
+
+def cold_start() -> float:
+    """
+    Times starting the program in a new python process, in the current folder. Warns if pandas or numpy
+    were imported, since startup is meant to work without them
+    :return: run time in seconds
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    start = time.perf_counter()
+    finished = subprocess.run([sys.executable, "-c", COLD_START_CODE], env=env, capture_output=True, text=True,
+                              check=True)
+    elapsed = time.perf_counter() - start
+    imported = finished.stdout.rsplit("imported:", 1)[-1].strip()
+    if imported:
+        print(f"  warning: startup imported {imported}")
+    return elapsed
+
+
+def time_call(function, repeat: int = 1) -> float:
+    """
+    Times a function. Anything it prints is thrown away so the printing is not part of the timing
+    :param function: function taking no arguments
+    :param repeat: number of times to run it
+    :return: fastest run time in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_size(rows: int, operations: int, seed: int, repeat: int) -> list[dict]:
+    """
+    Runs every benchmark on one number of households. Files are written in a temporary folder
+    :param rows: number of households
+    :param operations: number of adds, gets and removes to time
+    :param seed: random seed for the made up data
+    :param repeat: number of times to run each of the bulk benchmarks
+    :return: list of results
+    """
+    results = []
+
+    def record(name: str, seconds: float, ops: int = 1) -> None:
+        results.append({"name": name, "rows": rows, "ops": ops, "seconds": round(seconds, 6),
+                        "seconds_per_op": round(seconds / ops, 9)})
+        print(f"  {name:<24} {seconds:>10.4f}s" + (f"  ({seconds / ops * 1e6:,.1f} us/op)" if ops > 1 else ""))
+
+    print(f"{rows:,} households")
+    start = time.perf_counter()
+    df = synthetic_households(rows, seed)
+    record("generate", time.perf_counter() - start)
+    record("validate_dataframe", time_call(lambda: hh.validate_dataframe(df), repeat))
+
+    # single households, using the store the program uses and the old dataframe helpers it replaced
+    new_households = synthetic_household_objects(operations, seed, first=rows)
+    existing = df['address'].sample(n=min(operations, rows), random_state=seed).tolist()
+    store = HouseholdStore(df)
+    record("store_add", time_call(lambda: [store.add(h) for h in new_households]), len(new_households))
+    record("store_get", time_call(lambda: [store.get(a) for a in existing]), len(existing))
+    record("store_remove", time_call(lambda: [store.remove(a) for a in existing]), len(existing))
+
+    legacy = {"df": df}
+    legacy_adds = new_households[:LEGACY_OPERATIONS]
+    legacy_existing = existing[:LEGACY_OPERATIONS]
+
+    def legacy_add():
+        for household in legacy_adds:
+            legacy["df"] = main.add_household_to_df(household, legacy["df"])
+
+    def legacy_remove():
+        for address in legacy_existing:
+            legacy["df"] = main.remove_household_from_df(address, legacy["df"])
+
+    record("df_add", time_call(legacy_add), len(legacy_adds))
+    record("df_get", time_call(lambda: [main.get_household_from_df(a, legacy["df"]) for a in legacy_existing]),
+           len(legacy_existing))
+    record("df_remove", time_call(legacy_remove), len(legacy_existing))
+
+    # merging a file where half the households are already stored
+    incoming = pd.concat([df.iloc[:rows // 2], synthetic_households(rows // 2, seed, first=2 * rows)],
+                         ignore_index=True)
+    record("merge_dataframes", time_call(lambda: main.merge_dataframes(df, incoming), repeat))
+    record("store_merge", time_call(lambda: HouseholdStore(df).merge(incoming), repeat))
+
+    previous_folder = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            csv_name = "benchmark.csv"
+            record("csv_export", time_call(lambda: HouseholdStore(df).to_dataframe().to_csv(csv_name, index=False),
+                                           repeat))
+            record("csv_import_store", time_call(lambda: csv_import.import_csv(csv_name, store=HouseholdStore()),
+                                                 repeat))
+            if columnar_io.available():  # the same export and import in the typed, compressed formats
+                for extension in columnar_io.FORMATS:
+                    name = "benchmark" + extension
+                    kind = extension[1:]
+                    record(f"{kind}_export", time_call(lambda: columnar_io.write_store(HouseholdStore(df), name),
+                                                        repeat))
+                    record(f"{kind}_import_store",
+                           time_call(lambda: csv_import.import_csv(name, store=HouseholdStore()), repeat))
+
+            def import_to_database():
+                if os.path.exists(main.SQLITE_FILENAME):
+                    os.remove(main.SQLITE_FILENAME)
+                conn = database.open_database(main.SQLITE_FILENAME)
+                csv_import.import_csv(csv_name, db_conn=conn)
+                conn.close()
+
+            record("csv_import_database", time_call(import_to_database, repeat))
+
+            def save_everything():
+                if os.path.exists(main.SQLITE_FILENAME):
+                    os.remove(main.SQLITE_FILENAME)
+                full = HouseholdStore()
+                full.overwrite(df)
+                main.save_to_sql(full)
+
+            record("save_full", time_call(save_everything, repeat))
+
+            def export_from_database():
+                export_conn = database.open_database(main.SQLITE_FILENAME)
+                csv_export.export_csv(export_conn, "benchmark_export.csv")
+                export_conn.close()
+
+            record("csv_export_database", time_call(export_from_database, repeat))
+
+            # saving a session where a few households changed
+            conn = database.open_database(main.SQLITE_FILENAME)
+            session = main.open_store(HouseholdRepository(conn))
+            for household in new_households:
+                session.add(household)
+            for address in existing:
+                session.remove(address)
+            record("save_changes", time_call(lambda: main.save_to_sql(session)),
+                   len(new_households) + len(existing))
+
+            # what the user waits for when every change is handed to autosave as it is made
+            saver = autosave.AutoSaver(main.SQLITE_FILENAME, main.JOURNAL_FILENAME)
+            added = [household.get_adrs_str() for household in new_households]
+            record("autosave_remove", time_call(lambda: [(session.remove(a), saver.submit(session)) for a in added]),
+                   len(added))
+            saver.save(session)
+            saver.close()
+            conn.close()
+
+            def start_up():
+                startup_conn = database.open_database(main.SQLITE_FILENAME)
+                main.open_store(HouseholdRepository(startup_conn))
+                startup_conn.close()
+
+            def load_everything():
+                load_conn = database.open_database(main.SQLITE_FILENAME)
+                main.load_saved_households(load_conn)
+                load_conn.close()
+
+            def show_first_page():
+                page_conn = database.open_database(main.SQLITE_FILENAME)
+                main.display_dataframe(database.fetch_page(page_conn, main.pager.PAGE_SIZE))
+                page_conn.close()
+
+            record("startup", time_call(start_up, repeat))
+            record("cold_start", min(cold_start() for _ in range(repeat)))
+            record("load_all", time_call(load_everything, repeat))
+            record("display_page", time_call(show_first_page, repeat))
+        finally:
+            os.chdir(previous_folder)
+
+    record("display_all", time_call(lambda: main.display_dataframe(df), repeat))
+    return results
+
+
+# ------------------
+# Results
+# ------------------
+
+def git_commit() -> str:
+    """
+    :return: the git commit being benchmarked, or None if it cannot be found
+    """
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(old: dict, new: dict) -> int:
+    """
+    Prints how each benchmark changed between two result files
+    :param old: results loaded from an older run
+    :param new: results of this run
+    :return: number of benchmarks that got noticeably slower
+    """
+    old_times = {(r["name"], r["rows"]): r["seconds_per_op"] for r in old["results"]}
+    slower = 0
+    print(f"Compared to {old['meta'].get('commit') or 'previous run'}:")
+    for result in new["results"]:
+        before = old_times.get((result["name"], result["rows"]))
+        if not before:
+            continue
+        ratio = result["seconds_per_op"] / before
+        flag = ""
+        if ratio >= SLOWER_THRESHOLD:
+            flag = "  SLOWER"
+            slower += 1
+        print(f"  {result['name']:<24} {result['rows']:>9,} rows  {ratio:6.2f}x{flag}")
+    return slower
+
+
+def main_benchmark(argv: list[str] = None) -> int:
+    """
+    Runs the benchmarks from the command line
+    :param argv: command line arguments, not including the program name
+    :return: exit code. 1 if a compared benchmark got slower
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the CERT household tracker on made up data")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of households to test")
+    parser.add_argument("--ops", type=int, default=OPERATIONS, help="adds, gets and removes timed each round")
+    parser.add_argument("--repeat", type=int, default=1, help="runs of each bulk benchmark, fastest is kept")
+    parser.add_argument("--seed", type=int, default=SEED, help="random seed for the made up data")
+    parser.add_argument("--output", default=RESULTS_FILENAME, help="JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON results of an older run to compare against")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "ops": args.ops,
+            "repeat": args.repeat,
+        },
+        "results": [],
+    }
+    for rows in args.sizes:
+        report["results"].extend(run_size(rows, args.ops, args.seed, args.repeat))
+
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"FILE OPERATION: Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            if compare_results(json.load(file), report) > 0:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark())
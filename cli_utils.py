@@ -5,95 +5,215 @@ SER416 Final Project
 This library handles prompting the user for responses and ensuring those responses are properly formated
 """
 import os
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
 
 NA = "n/a"
 
+# ------------------
+# Terminal output
+# ------------------
+# Screens are built up as one string and sent to the terminal in a single write. Clearing is done with
+# escape sequences rather than by running the clear/cls command, so no new process is started
+
+CLEAR_SEQUENCE = "\033[H\033[2J\033[3J"  # move the cursor home, clear the screen, clear the scrollback
+
+_escape_sequences_ready = False
+
+
+def is_terminal() -> bool:
+    """
+    :return: true if output is going to an interactive terminal rather than a file or pipe
+    """
+    try:
+        return sys.stdout.isatty()
+    except (AttributeError, ValueError):  # stdout replaced or closed
+        return False
+
+
+def _enable_escape_sequences():
+    """Windows consoles only follow escape sequences once asked to. Running an empty command once does that"""
+    global _escape_sequences_ready
+    if not _escape_sequences_ready:
+        if os.name == 'nt':
+            os.system('')
+        _escape_sequences_ready = True
+
+
+def clear_sequence() -> str:
+    """
+    :return: the text that clears the screen, or an empty string if output is not going to a terminal
+    """
+    if not is_terminal():
+        return ""
+    _enable_escape_sequences()
+    return CLEAR_SEQUENCE
+
+
+def write(text, clear=False):
+    """
+    Sends text to the terminal in a single write
+    :param text: text to show
+    :param clear: clear the screen before showing the text
+    """
+    if clear:
+        text = clear_sequence() + text
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
 def clear_screen():
-    """Clears the console output. Should work on win and mac/unix/linx"""
-    # Windows systems
-    print("Note: Attempting to clear screen. Please use a standard terminal emulator.")
-    if os.name == 'nt':
-        _ = os.system('cls')
-    # Unix-like systems such as Linux or macOS
-    else:
-        _ = os.system('clear')
+    """Clears the console output. Does nothing if output is not going to a terminal"""
+    write("", clear=True)
 
 
-def line_split(text, max_length):
+# ------------------
+# Layout
+# ------------------
+# Screens are made of the same few pieces over and over, so each piece is built once and kept. Wrapped
+# text is kept per (text, width), frame rows per width, the top of a frame per (query, width, header) and
+# the numbered option rows per (options, width)
+
+WRAP_CACHE_SIZE = 1024  # number of different (text, width) pairs kept wrapped
+FRAME_CACHE_SIZE = 256  # number of different frame pieces kept
+OPTIONS_CACHE_SIZE = 32  # number of different option lists kept, these can be long
+
+
+@lru_cache(maxsize=WRAP_CACHE_SIZE)
+def _wrap(text, max_length):
     """
-    Splits text into given length lines while trying not to cut words in half
+    Splits text into lines in a single pass over the text. Each line only looks back over its own
+    characters for a space, so the work grows with the length of the text rather than its square
     :param text: text to split
     :param max_length: max length of a line
-    :return: list of lines of split text
+    :return: tuple of lines of split text
     """
-
-    # Make new lines of a fixed length until there is not enough text to fill a lone
     lines = []
-    remaining_text = text
-    while len(remaining_text) > max_length:
-        split_point = max_length
+    start = 0  # start of the text not yet put in a line
+    while len(text) - start > max_length:
+        split_point = start + max_length
         # Start at the max length and seek back until a space is found
-        while not remaining_text[split_point].isspace():
+        while not text[split_point].isspace():
             split_point -= 1
             # If there is not a convent space to split the line then just split a word
-            if split_point == 0:
-                split_point = max_length
-                break # Halt trying to find a space because we have used up the entire string
-        # Create new line with text up to split point
-        lines.append(remaining_text[:split_point])
-        # Remove used text
-        remaining_text = remaining_text[split_point:]
+            if split_point == start:
+                split_point = start + max_length
+                break  # Halt trying to find a space because we have used up the entire line
+        lines.append(text[start:split_point])
+        start = split_point
     # Make a final line with any remaining text
-    lines.append(remaining_text)
-    return lines
+    lines.append(text[start:])
+    return tuple(lines)
 
 
-def display_table(df):
-    # TODO: I might need the ability to display a table and integrate that into the user prompt
-    pass
+def line_split(text, max_length):
+    """
+    Splits text into given length lines while trying not to cut words in half
+    :param text: text to split
+    :param max_length: max length of a line
+    :return: list of lines of split text
+    """
+    return list(_wrap(text, max_length))
 
 
-def display_menu(query, options, row_max, header=None):
+@lru_cache(maxsize=FRAME_CACHE_SIZE)
+def _frame_rows(row_max):
     """
-    Displays a question for the user with pre-defined response choices
+    :param row_max: horizontal size limitation
+    :return: (row of dashes, empty row with borders) for a frame of this width
+    """
+    dash_row = '-' * row_max
+    blank_row = '|' + ' ' * (row_max - 2) + '|'
+    return dash_row, blank_row
+
+
+@lru_cache(maxsize=FRAME_CACHE_SIZE)
+def _frame_top(query, row_max, header):
+    """
+    Builds the part of a screen every question has: the header, the question and the rows around them
     :param query: question to be ask
-    :param options: list of options for the user
     :param row_max: horizontal size limitation
     :param header: optional line above question
-    :return:
+    :return: text of the top of the screen, ending with a new line
     """
-    #clear_screen()
     max_l = row_max - 4  # max size of content in a row
-    dash_row_list = ['-' for i in range(row_max)]
-    dash_row = ''.join(pair for pair in dash_row_list)
-    blank_row_list = [' ' for i in range(row_max - 2)]
-    blank_row = ''.join(pair for pair in blank_row_list)
-    blank_row = '|' + blank_row + '|'
-
-    # display menu
-    print(dash_row)
+    dash_row, blank_row = _frame_rows(row_max)
+
+    lines = [dash_row]
     # display the header if there is one
     if header:
-        print(f"| {header:<{max_l}} |")
-        print(blank_row)
+        lines.append(f"| {header:<{max_l}} |")
+        lines.append(blank_row)
     # display the query to the user
-    question_lines = line_split(query, max_l)
-    for line in question_lines:
-        print(f"| {line:<{max_l}} |")
-    print(dash_row)
+    for line in _wrap(query, max_l):
+        lines.append(f"| {line:<{max_l}} |")
+    lines.append(dash_row)
+    return '\n'.join(lines) + '\n'
 
-    # print the options
-    max_l -= 4  # cut the length of the display by 4 to allow for option numbering
+
+@lru_cache(maxsize=OPTIONS_CACHE_SIZE)
+def _option_rows(options, row_max):
+    """
+    Builds the numbered rows of a menu and the row of dashes under them
+    :param options: tuple of options for the user
+    :param row_max: horizontal size limitation
+    :return: text of the option rows, ending with a new line
+    """
+    max_l = row_max - 8  # room for the borders and the option numbering
+    lines = []
     for i, option in enumerate(options):
         chunks = [option[i:i + max_l] for i in range(0, len(option), max_l)]
         # print the 1st line of the option
-        print(f"| {i + 1} - {chunks[0]:<{max_l}} |")
+        lines.append(f"| {i + 1} - {chunks[0]:<{max_l}} |")
         # print any additional lines
         for j in range(1, len(chunks)):
-            print(f"|     {chunks[j]:<{max_l}} |")
-    print(dash_row)
+            lines.append(f"|     {chunks[j]:<{max_l}} |")
+    lines.append(_frame_rows(row_max)[0])
+    return '\n'.join(lines) + '\n'
+
+
+def display_table(df):
+    # TODO: I might need the ability to display a table and integrate that into the user prompt
+    pass
+
+
+def render_menu(query, options, row_max, header=None):
+    """
+    Builds the screen for a question with pre-defined response choices
+    :param query: question to be ask
+    :param options: list of options for the user
+    :param row_max: horizontal size limitation
+    :param header: optional line above question
+    :return: text of the screen
+    """
+    return _frame_top(query, row_max, header) + _option_rows(tuple(options), row_max) + \
+        "Enter your selection number:\n"
+
+
+def display_menu(query, options, row_max, header=None):
+    """
+    Displays a question for the user with pre-defined response choices
+    :param query: question to be ask
+    :param options: list of options for the user
+    :param row_max: horizontal size limitation
+    :param header: optional line above question
+    :return:
+    """
+    write(render_menu(query, options, row_max, header))
 
-    print("Enter your selection number:")
+
+def render_text_input(query, row_max, header=None):
+    """
+    Builds the screen for a question with open ended responses
+    :param query: question to be ask
+    :param row_max: horizontal size limitation
+    :param header: optional line above question
+    :return: text of the screen
+    """
+    return _frame_top(query, row_max, header)
 
 
 def display_text_input(query, row_max, header=None):
@@ -104,24 +224,18 @@ def display_text_input(query, row_max, header=None):
     :param header: optional line above question
     :return:
     """
-    max_l = row_max - 4  # max size of content in a row
-    dash_row_list = ['-' for i in range(row_max)]
-    dash_row = ''.join(pair for pair in dash_row_list)
-    blank_row_list = [' ' for i in range(row_max - 2)]
-    blank_row = ''.join(pair for pair in blank_row_list)
-    blank_row = '|' + blank_row + '|'
-
-    # display menu
-    print(dash_row)
-    # display the header if there is one
-    if header:
-        print(f"| {header:<{max_l}} |")
-        print(blank_row)
-    # display the query to the user
-    question_lines = line_split(query, max_l)
-    for line in question_lines:
-        print(f"| {line:<{max_l}} |")
-    print(dash_row)
+    write(render_text_input(query, row_max, header))
+
+
+def render_yes_no(query, row_max, header=None):
+    """
+    Builds the screen for a yes or no question
+    :param query: string of question to ask user
+    :param row_max: horizontal size limitation
+    :param header: optional line above question
+    :return: text of the screen
+    """
+    return _frame_top(query, row_max, header) + "Make selection: <yes/no>\n"
 
 
 def display_yes_no(query, row_max, header=None):
@@ -132,27 +246,12 @@ def display_yes_no(query, row_max, header=None):
     :param header: optional line above question
     :return:
     """
-    max_l = row_max - 4  # max size of content in a row
-    dash_row_list = ['-' for i in range(row_max)]
-    dash_row = ''.join(pair for pair in dash_row_list)
-    blank_row_list = [' ' for i in range(row_max - 2)]
-    blank_row = ''.join(pair for pair in blank_row_list)
-    blank_row = '|' + blank_row + '|'
-
-    # display menu
-    print(dash_row)
-    # display the header if there is one
-    if header:
-        print(f"| {header:<{max_l}} |")
-        print(blank_row)
-    # display the query to the user
-    question_lines = line_split(query, max_l)
-    for line in question_lines:
-        print(f"| {line:<{max_l}} |")
-    print(dash_row)
+    write(render_yes_no(query, row_max, header))
 
-    print("Make selection: <yes/no>")
 
+# ------------------
+# Prompting
+# ------------------
 
 def prompt_user(query, user_options=None, input_format=None, input_length=None, row_limit=60, header=None, required=True, table=None):
     """
@@ -167,19 +266,22 @@ def prompt_user(query, user_options=None, input_format=None, input_length=None,
     :return: the response of the user. Type will be determined by 'format' parameter. Defaults to string
     """
     # TODO: add format checkers for email, phone
-    clear_screen()
     if table:
         display_table(table)
+    # Prompt the user with the correct display type
+    if user_options:  # if there is a limited list of responses, display a menu
+        screen = render_menu(query, options=user_options, row_max=row_limit, header=header)
+    else:
+        if input_format == "y/n":  # if asking a true false question
+            screen = render_yes_no(query, row_max=row_limit, header=header)
+        else:  # asking a free-form question
+            screen = render_text_input(query, row_max=row_limit, header=header)
+    # the screen is cleared, any message about the last response shown, and the question drawn in one write
+    clear = True
+    message = ""
     # Repeat question loop until user responds appropriately
     while True:
-        # Prompt the user with the correct display type
-        if user_options:  # if there is a limited list of responses, display a menu
-            display_menu(query, options=user_options, row_max=row_limit, header=header)
-        else:
-            if input_format == "y/n":  # if asking a true false question
-                display_yes_no(query, row_max=row_limit, header=header)
-            else:  # asking a free-form question
-                display_text_input(query, row_max=row_limit, header=header)
+        write(message + screen, clear=clear)
 
         # Check response acceptability & strip out any lead/trailing whitespace
         user_response = input().strip()
@@ -188,12 +290,13 @@ def prompt_user(query, user_options=None, input_format=None, input_length=None,
             return NA
         # required questions cannot be blank
         if user_response == "":
-            clear_screen()
-            print("This is a required question.")
+            clear = True
+            message = "This is a required question.\n"
             continue
         # if response is not the proper length
         if len(user_response) != input_length and input_length:
-            print(f"Response must be {input_length} characters long.")
+            clear = False  # keep the earlier screens and show the question again below them
+            message = f"Response must be {input_length} characters long.\n"
             continue
         # int format questions must be answered with a integer with no symbols
         if input_format == "int":
@@ -201,8 +304,8 @@ def prompt_user(query, user_options=None, input_format=None, input_length=None,
                 # Return the properly formatted response
                 return user_response
             else:
-                clear_screen()
-                print("Please respond with digits only. No letters, commas, or other symbols.")
+                clear = True
+                message = "Please respond with digits only. No letters, commas, or other symbols.\n"
                 continue
         # int format questions must be answered with just numbers
         if input_format == "numeric":
@@ -210,8 +313,8 @@ def prompt_user(query, user_options=None, input_format=None, input_length=None,
                 # Return the properly formatted response
                 return user_response
             else:
-                clear_screen()
-                print("Please respond with digits only. No dashes, commas, or other symbols.")
+                clear = True
+                message = "Please respond with digits only. No dashes, commas, or other symbols.\n"
                 continue
         # Yes/No questions must have a response that either starts with a 'y' or a 'n'. Case does not matter
         if input_format == "y/n":
@@ -221,8 +324,8 @@ def prompt_user(query, user_options=None, input_format=None, input_length=None,
                 elif user_response[0].lower() == 'n':
                     return 'f'
                 else:
-                    clear_screen()
-                    print("Please respond with \"yes\" or \"no\" only. No other letters")
+                    clear = True
+                    message = "Please respond with \"yes\" or \"no\" only. No other letters\n"
                     continue
         # Menu questions must have a response that matches an available option
         if user_options:
@@ -231,13 +334,276 @@ def prompt_user(query, user_options=None, input_format=None, input_length=None,
                 if sel_number > 0 and sel_number <= len(user_options):
                     #return sel_number
                     return user_options[ sel_number-1]
-            clear_screen()
-            print("Please enter only the number of your selection with no other input")
+            clear = True
+            message = "Please enter only the number of your selection with no other input\n"
             continue
         # Any remaining questions are free-form response, so just return the input
         return user_response
 
 
+# ------------------
+# Searchable picker
+# ------------------
+# For choosing from more options than fit on a screen. Every word of every option is kept in a sorted list
+# with the options it appears in, so the options matching a typed prefix are found with a binary search
+# instead of by checking every option
+
+PICK_SHOWN = 10  # matches shown on each screen of the picker
+PICK_HELP = ("Type words to narrow the list, or the number of a match to pick it. Start with / to search "
+             "for a number. Enter < to drop the last word. Leave blank to cancel.")
+PENDING_LIMIT = 1000  # options added since the index was built that are checked one by one before rebuilding
+MERGE_WORDS = 32  # a prefix covering more words than this has their postings merged into one array
+UNION_CACHE_SIZE = 64  # number of merged postings kept between searches
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def search_words(text):
+    """
+    Splits text into the lowercase words the picker searches on. Spaces and punctuation separate words
+    :param text: text to split
+    :return: list of words
+    """
+    return _WORD_PATTERN.findall(text.lower())
+
+
+class PrefixIndex:
+    """
+    Finds the options that have a word starting with each typed word. The words of every option are kept
+    in one sorted list, each with an array of the options it appears in (the options are numbered in
+    sorted order, so these arrays are sorted too). The words starting with a prefix are next to each other
+    in the sorted list, so they are found with a binary search and no option is checked one by one.
+    Options added later are kept on a short side list until there are enough of them to rebuild, and
+    removed options are just skipped
+    """
+
+    def __init__(self, options=()):
+        """
+        Builds the index
+        :param options: strings to search. Repeats are ignored
+        """
+        self._build(options)
+
+    def _build(self, options) -> None:
+        """
+        Replaces the indexed options
+        :param options: strings to search
+        """
+        self._options = sorted(set(options))
+        self._ids = {option: number for number, option in enumerate(self._options)}
+        self._removed = set()  # numbers of options that were removed since the index was built
+        self._pending = {}  # option added since the index was built -> its words
+        self._unions = {}  # (first, last) positions of the words under a prefix -> their merged postings
+
+        postings = {}
+        for number, option in enumerate(self._options):
+            for word in set(search_words(option)):
+                postings.setdefault(word, array('i')).append(number)
+        self._words = sorted(postings)
+        # the postings of every word one after another in word order. Word i's postings are
+        # _postings[_offsets[i]:_offsets[i + 1]], so all the words under a prefix are one slice
+        self._postings = array('i')
+        self._offsets = array('q', [0])
+        for word in self._words:
+            self._postings.extend(postings[word])
+            self._offsets.append(len(self._postings))
+
+    def __len__(self) -> int:
+        return len(self._options) - len(self._removed) + len(self._pending)
+
+    def __contains__(self, option) -> bool:
+        return option in self._pending or (option in self._ids and self._ids[option] not in self._removed)
+
+    def add(self, option) -> None:
+        """
+        Adds an option to the index
+        :param option: string to add
+        """
+        if option in self:
+            return
+        number = self._ids.get(option)
+        if number is not None:  # removed earlier, so it only has to stop being skipped
+            self._removed.discard(number)
+            return
+        self._pending[option] = search_words(option)
+        if len(self._pending) > PENDING_LIMIT:
+            self._build(list(self))
+
+    def discard(self, option) -> None:
+        """
+        Removes an option from the index if it is there
+        :param option: string to remove
+        """
+        if self._pending.pop(option, None) is not None:
+            return
+        number = self._ids.get(option)
+        if number is not None:
+            self._removed.add(number)
+
+    def __iter__(self):
+        """
+        :return: generator of every option in the index
+        """
+        for number, option in enumerate(self._options):
+            if number not in self._removed:
+                yield option
+        yield from self._pending
+
+    def _word_range(self, prefix) -> tuple:
+        """
+        :param prefix: start of a word
+        :return: (first, last + 1) positions in the sorted word list of the words starting with the prefix
+        """
+        # words are only letters and digits, so '~' sorts after every word that starts with the prefix
+        return bisect_left(self._words, prefix), bisect_left(self._words, prefix + '~')
+
+    def _cursor(self, first, last) -> list:
+        """
+        Makes a cursor over the postings of the words under a prefix. A short prefix like "1" can be the
+        start of thousands of words, so those postings are sorted together into one array, which is kept
+        since the user usually types the same prefix again with more words after it
+        :param first: position of the first word under the prefix
+        :param last: position after the last word under the prefix
+        :return: list of [sorted array of option numbers, position reached, end position]
+        """
+        if last - first <= MERGE_WORDS:
+            return [[self._postings, self._offsets[i], self._offsets[i + 1]] for i in range(first, last)]
+        union = self._unions.get((first, last))
+        if union is None:
+            import numpy as np
+
+            if len(self._unions) >= UNION_CACHE_SIZE:
+                self._unions.clear()
+            merged = np.sort(np.frombuffer(self._postings, dtype='i')[self._offsets[first]:self._offsets[last]])
+            union = array('i', merged.tobytes())
+            self._unions[(first, last)] = union
+        return [[union, 0, len(union)]]
+
+    def _matching_numbers(self, prefixes):
+        """
+        Finds the options with a word starting with each prefix. The sorted option numbers under each
+        prefix are walked together, skipping ahead with a binary search to the next number that could be
+        under all of them, so long runs of options that only match some of the prefixes are never visited
+        :param prefixes: typed words
+        :return: generator of option numbers in increasing (so sorted) order
+        """
+        if not prefixes:
+            yield from range(len(self._options))
+            return
+        spans = [self._word_range(prefix) for prefix in prefixes]
+        if any(first == last for first, last in spans):
+            return
+        # one cursor per prefix, starting with the prefix that has the fewest options under it
+        spans.sort(key=lambda span: self._offsets[span[1]] - self._offsets[span[0]])
+        cursors = [self._cursor(first, last) for first, last in spans]
+        number = 0
+        while True:
+            agreed = True
+            for cursor in cursors:
+                found = _seek(cursor, number)
+                if found is None:
+                    return
+                if found != number:  # nothing under this prefix until a later number, so start again there
+                    number = found
+                    agreed = False
+                    break
+            if agreed:
+                yield number
+                number += 1
+
+    def search(self, text, limit=PICK_SHOWN) -> list:
+        """
+        Finds the options with a word starting with each word of the text
+        :param text: typed search text
+        :param limit: max number of matches to return
+        :return: list of matching options in sorted order
+        """
+        prefixes = search_words(text)
+        matches = []
+        if limit > 0:
+            for number in self._matching_numbers(prefixes):
+                if number not in self._removed:
+                    matches.append(self._options[number])
+                    if len(matches) == limit:
+                        break
+        # options added since the index was built are few, so they are just checked one by one
+        matches.extend(option for option, words in self._pending.items() if _has_prefixes(words, prefixes))
+        return sorted(matches)[:limit]
+
+
+def _seek(cursor, number):
+    """
+    Moves a search cursor forward to a number
+    :param cursor: list of [sorted array of numbers, position reached, end position]
+    :param number: smallest number wanted
+    :return: the smallest number at least the given number in any of the arrays, or None
+    """
+    found = None
+    for part in cursor:
+        numbers, position, end = part
+        position = bisect_left(numbers, number, position, end)
+        part[1] = position
+        if position < end and (found is None or numbers[position] < found):
+            found = numbers[position]
+    return found
+
+
+def _has_prefixes(words, prefixes) -> bool:
+    """
+    :param words: words of an option
+    :param prefixes: typed words
+    :return: true if every typed word is the start of one of the option's words
+    """
+    return all(any(word.startswith(prefix) for word in words) for prefix in prefixes)
+
+
+def render_picker(query, search, matches, row_max, header=None):
+    """
+    Builds the screen for the searchable picker
+    :param query: question to be ask
+    :param search: words typed so far
+    :param matches: matches to show
+    :param row_max: horizontal size limitation
+    :param header: optional line above question
+    :return: text of the screen
+    """
+    lines = [f"Search: {search}" if search else "Search: (type to search)"]
+    if not matches:
+        lines.append("No matches.")
+    elif len(matches) > PICK_SHOWN:
+        lines.append(f"Showing the first {PICK_SHOWN} matches. Type more to narrow the list.")
+    lines.extend(line.strip() for line in line_split(PICK_HELP, row_max))
+    options = _option_rows(tuple(matches[:PICK_SHOWN]), row_max) if matches else ""
+    return _frame_top(query, row_max, header) + options + '\n'.join(lines) + '\n'
+
+
+def pick_option(query, index, row_limit=60, header=None):
+    """
+    Lets the user search for and pick one option. Useful when there are too many options for a menu
+    :param query: question to ask the user
+    :param index: PrefixIndex of the options
+    :param row_limit: row length of the display. Defaults to 60 chars
+    :param header: optional line to display above the question
+    :return: the option picked, or None if the user canceled
+    """
+    words = []
+    while True:
+        search = ' '.join(words)
+        matches = index.search(search, limit=PICK_SHOWN + 1)  # one extra to know if there are more
+        write(render_picker(query, search, matches, row_limit, header), clear=True)
+
+        user_response = input().strip()
+        if user_response == "":
+            return None
+        shown = matches[:PICK_SHOWN]
+        if user_response.isdigit() and 0 < int(user_response) <= len(shown):
+            return shown[int(user_response) - 1]
+        if user_response == "<":
+            words = words[:-1]
+        else:
+            words.extend(user_response.lstrip("/").split())
+
+
 def main():
     """
     This function is just used for dev demoing
@@ -0,0 +1,225 @@
+"""
+columnar_io.py
+Author: Russell Johnson
+Date 12 Dec 2025
+SER416 Final Project
+Reads and writes household data as Parquet or Arrow files. Unlike a CSV file the columns keep their types
+(the number of adults and children are integers and the yes/no questions are true/false, with no answer
+stored as null), the data is compressed, and a reader can skip the columns it does not need instead of
+parsing every line of text. These formats need the optional pyarrow package, everything else works without it
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import importlib.util
+import os
+import household as hh
+import flags
+from cli_utils import NA
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ------------------
+# Constants
+# ------------------
+
+# file extension -> name of the format shown to the user
+FORMATS = {".parquet": "Parquet", ".arrow": "Arrow"}
+COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 100000  # rows stored together. A reader reads at least this many at a time
+INT_COLUMNS = ["adults", "children"]
+OPTIONAL_COLUMNS = ["email", "phone"]  # n/a in these is stored as null
+
+
+# ------------------
+# Functions
+# ------------------
+
+def available() -> bool:
+    """
+    Checks for pyarrow without importing it, so startup does not wait on it
+    :return: true if Parquet and Arrow files can be read and written
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def is_columnar(filename: str) -> bool:
+    """
+    :param filename: name of a file
+    :return: true if the extension is one of the FORMATS
+    """
+    return os.path.splitext(filename)[1].lower() in FORMATS
+
+
+def _arrow():
+    """
+    :return: the pyarrow module
+    """
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow files need the pyarrow package (pip install pyarrow)") from e
+    return pyarrow
+
+
+def schema():
+    """
+    :return: pyarrow schema of a household file, with the columns in hh.COLUMNS order
+    """
+    pa = _arrow()
+    fields = []
+    for col in hh.COLUMNS:
+        if col in flags.FLAG_BITS:
+            fields.append(pa.field(col, pa.bool_()))
+        elif col in INT_COLUMNS:
+            fields.append(pa.field(col, pa.int16(), nullable=False))
+        else:
+            fields.append(pa.field(col, pa.string(), nullable=col in OPTIONAL_COLUMNS))
+    return pa.schema(fields)
+
+
+# ------------------
+# Writing
+# ------------------
+
+def store_table(store):
+    """
+    Builds a typed table straight from the columns of a HouseholdStore, without making a dataframe of strings
+    :param store: HouseholdStore
+    :return: pyarrow table of every stored household
+    """
+    pa = _arrow()
+    import pyarrow.compute as pc
+
+    _, values, known = store.flag_arrays()
+    columns = []
+    for field in schema():
+        if field.name in flags.FLAG_BITS:
+            bit = flags.FLAG_BITS[field.name]
+            columns.append(pa.array((values & bit) != 0, mask=(known & bit) == 0, type=pa.bool_()))
+            continue
+        column = pa.array(store.column_values(field.name), type=pa.string())
+        if field.name in INT_COLUMNS:
+            column = pc.cast(column, field.type)
+        elif field.name in OPTIONAL_COLUMNS:
+            column = pc.if_else(pc.equal(column, NA), pa.scalar(None, pa.string()), column)
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema())
+
+
+def write_store(store, filename: str) -> None:
+    """
+    Exports every stored household to a compressed Parquet or Arrow file, picked by the file extension
+    :param store: HouseholdStore
+    :param filename: file to write, ending in one of the FORMATS. Replaced if it exists
+    """
+    pa = _arrow()
+
+    table = store_table(store)
+    if filename.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, filename, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=COMPRESSION)
+        with pa.OSFile(filename, "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=ROW_GROUP_SIZE)
+
+
+# ------------------
+# Reading
+# ------------------
+
+def _column_names(filename: str) -> list[str]:
+    """
+    Reads the column names from the schema at the start or end of the file, without reading any rows
+    :param filename: Parquet or Arrow file
+    :return: list of column names
+    """
+    pa = _arrow()
+
+    if filename.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(filename, memory_map=True).names
+    with pa.memory_map(filename) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def has_household_columns(filename: str) -> bool:
+    """
+    :param filename: Parquet or Arrow file
+    :return: true if every household column is in the file
+    """
+    try:
+        names = _column_names(filename)
+    except (ImportError, OSError, ValueError):  # pyarrow raises an ArrowInvalid, a ValueError, for other files
+        return False
+    return set(hh.COLUMNS).issubset(names)
+
+
+def _record_batches(filename: str, chunk_size: int):
+    """
+    Reads only the household columns of a file, a piece at a time. The file is memory mapped, so only the
+    parts of it that are read are loaded from the disk
+    :param filename: Parquet or Arrow file
+    :param chunk_size: max number of rows in each piece
+    :return: iterator of pyarrow record batches
+    """
+    pa = _arrow()
+
+    if filename.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        with pq.ParquetFile(filename, memory_map=True) as file:
+            yield from file.iter_batches(batch_size=chunk_size, columns=hh.COLUMNS)
+        return
+    with pa.memory_map(filename) as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(hh.COLUMNS)
+            for start in range(0, batch.num_rows, chunk_size):
+                yield batch.slice(start, chunk_size)
+
+
+def _as_strings(batch) -> pd.DataFrame:
+    """
+    Turns typed columns back into the strings the rest of the program uses, the same as reading a CSV file.
+    Columns that are already strings, such as from a file written by another program, are kept as they are
+    :param batch: pyarrow record batch of household data
+    :return: dataframe of household data with every value as a string
+    """
+    pa = _arrow()
+    import pyarrow.compute as pc
+
+    columns = []
+    for column in batch.columns:
+        if pa.types.is_boolean(column.type):
+            column = pc.if_else(column, "t", "f")
+        elif not pa.types.is_string(column.type):
+            column = pc.cast(column, pa.string())
+        columns.append(pc.fill_null(column, NA))
+    return pa.Table.from_arrays(columns, names=batch.schema.names).to_pandas()
+
+
+def read_chunks(filename: str, chunk_size: int):
+    """
+    Reads a Parquet or Arrow household file a chunk at a time. Every value is turned into a string
+    :param filename: file to read
+    :param chunk_size: max number of rows in each chunk
+    :return: iterator of dataframes
+    """
+    for batch in _record_batches(filename, chunk_size):
+        yield _as_strings(batch)
+
+
+def read_file(filename: str) -> pd.DataFrame:
+    """
+    Reads every household in a Parquet or Arrow file at once
+    :param filename: file to read
+    :return: dataframe of household data with every value as a string
+    """
+    import pandas as pd
+
+    chunks = list(read_chunks(filename, ROW_GROUP_SIZE))
+    return pd.concat(chunks, ignore_index=True) if chunks else hh.empty_dataframe()
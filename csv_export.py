@@ -0,0 +1,150 @@
+"""
+csv_export.py
+Author: Russell Johnson
+Date 13 Dec 2025
+SER416 Final Project
+Streams saved households out of the database into a CSV file a chunk at a time, so an export never holds
+the whole table in memory. The households can be limited to a zip code or city and to a triage filter
+(see triage.py), such as only the ones that agreed to be contacted, and the file can be compressed with
+gzip or zstd. The rows are the same as the ones csv_import reads back in
+"""
+import csv
+import gzip
+import importlib.util
+import io
+import sqlite3
+from operator import itemgetter
+import household as hh
+import flags
+from repository import HouseholdRepository
+
+# ------------------
+# Constants
+# ------------------
+
+DEFAULT_CHUNK_SIZE = 50000  # rows read from the database at a time
+# file extension -> name of the format shown to the user
+FORMATS = {".csv": "CSV", ".csv.gz": "CSV (gzip)", ".csv.zst": "CSV (zstd)"}
+GZIP_LEVEL = 6  # gzip's usual trade of speed for size. 9 is a few percent smaller and several times slower
+ZSTD_LEVEL = 3
+
+
+# ------------------
+# Functions
+# ------------------
+
+def zstd_available() -> bool:
+    """
+    zstd compression comes from the zstandard package, or from pyarrow if that is installed instead. Checks
+    without importing either, so startup does not wait on them
+    :return: true if .csv.zst files can be written
+    """
+    return any(importlib.util.find_spec(name) is not None for name in ("zstandard", "pyarrow"))
+
+
+def formats() -> dict:
+    """
+    :return: dict of file extension to format name, for the formats that can be written here
+    """
+    return {ext: name for ext, name in FORMATS.items() if ext != ".csv.zst" or zstd_available()}
+
+
+def extension(filename: str) -> str:
+    """
+    :param filename: name of a file
+    :return: the FORMATS extension it ends with, or None
+    """
+    # longest first, so .csv.gz is not taken for .gz
+    return next((ext for ext in sorted(FORMATS, key=len, reverse=True) if filename.lower().endswith(ext)), None)
+
+
+def _open_zstd(filename: str):
+    """
+    :param filename: file to write
+    :return: text file that zstd compresses what is written to it
+    """
+    try:
+        import zstandard
+    except ImportError:
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError("zstd files need the zstandard or pyarrow package (pip install zstandard)") from e
+        # pyarrow's compressed stream is a binary file, so it is wrapped to take text like the others
+        return io.TextIOWrapper(pa.CompressedOutputStream(filename, "zstd"), encoding='utf-8', newline='')
+    return zstandard.open(filename, 'w', cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL), encoding='utf-8',
+                          newline='')
+
+
+def open_output(filename: str):
+    """
+    Opens a file to write CSV text to, compressed by its extension
+    :param filename: file to write, ending in one of the FORMATS. Replaced if it exists
+    :return: text file
+    """
+    ext = extension(filename)
+    if ext == ".csv.gz":
+        return gzip.open(filename, 'wt', compresslevel=GZIP_LEVEL, encoding='utf-8', newline='')
+    if ext == ".csv.zst":
+        return _open_zstd(filename)
+    return open(filename, 'w', encoding='utf-8', newline='')
+
+
+def _csv_rows(chunks):
+    """
+    Unpacks the flags of rows read from the database and puts the values in hh.COLUMNS order. Only a few
+    combinations of answers ever come up, so each one is unpacked once and reused
+    :param chunks: iterator of lists of tuples in flags.PACKED_COLUMNS order
+    :return: iterator of lists of tuples in hh.COLUMNS order
+    """
+    plain_count = len(flags.PLAIN_COLUMNS)
+    unpacked_columns = flags.PLAIN_COLUMNS + flags.FLAG_COLUMNS
+    in_order = itemgetter(*(unpacked_columns.index(col) for col in hh.COLUMNS))
+    answers = {}  # (value bits, known bits) -> tuple of answers in FLAG_COLUMNS order
+    for rows in chunks:
+        for key in {row[plain_count:] for row in rows}.difference(answers):
+            answers[key] = tuple(flags.unpack(*key).values())
+        yield [in_order(row[:plain_count] + answers[row[plain_count:]]) for row in rows]
+
+
+def write_csv(conn: sqlite3.Connection, file, node: tuple = None, zip_code: str = None, city: str = None,
+              chunk_size: int = DEFAULT_CHUNK_SIZE, limit: int = None) -> int:
+    """
+    Writes the saved households that match a filter to an open text file as CSV, reading them from the
+    database a chunk at a time
+    :param conn: open database connection
+    :param file: text file to write to, such as from open_output or sys.stdout
+    :param node: optional parsed filter from triage.parse. Every household if not given
+    :param zip_code: only include households in this zip code
+    :param city: only include households in this city. Case does not matter
+    :param chunk_size: number of rows read at a time
+    :param limit: max number of households to write. All of them if not given
+    :return: number of households written
+    """
+    chunks = HouseholdRepository(conn).chunks(zip_code=zip_code, city=city, node=node, chunk_size=chunk_size,
+                                              limit=limit)
+    written = 0
+    # the same layout pandas writes, so an export can be imported again
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(hh.COLUMNS)
+    for rows in _csv_rows(chunks):
+        writer.writerows(rows)
+        written += len(rows)
+    return written
+
+
+def export_csv(conn: sqlite3.Connection, filename: str, node: tuple = None, zip_code: str = None, city: str = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Writes the saved households that match a filter to a CSV file, reading them from the database a chunk
+    at a time. Households that have not been saved yet are not included
+    :param conn: open database connection
+    :param filename: file to write, ending in one of the FORMATS, which picks the compression
+    :param node: optional parsed filter from triage.parse. Every household if not given
+    :param zip_code: only include households in this zip code
+    :param city: only include households in this city. Case does not matter
+    :param chunk_size: number of rows read at a time
+    :return: number of households written
+    """
+    with open_output(filename) as file:
+        return write_csv(conn, file, node, zip_code, city, chunk_size)
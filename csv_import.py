@@ -0,0 +1,316 @@
+"""
+csv_import.py
+Author: Russell Johnson
+Date 3 Dec 2025
+SER416 Final Project
+Streams household data in from CSV files a chunk at a time so large files never have to fit in memory.
+Many files can also be imported at once, with each file read and validated in its own process. Parquet and
+Arrow files (see columnar_io.py) are imported the same way
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import household as hh
+import flags
+import database
+import columnar_io
+from dedupe import DuplicateIndex
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ------------------
+# Constants
+# ------------------
+
+DEFAULT_CHUNK_SIZE = 50000  # rows read from the file at a time
+# added to the name of an imported file, without its extension, to name the files its rows are set aside in
+QUARANTINE_SUFFIX = "_rejected.csv"
+DUPLICATE_SUFFIX = "_possible_duplicates.csv"
+
+
+# ------------------
+# Functions
+# ------------------
+
+def quarantine_filename(filename: str) -> str:
+    """
+    :param filename: CSV file being imported
+    :return: name of the CSV file its invalid rows are set aside in
+    """
+    return os.path.splitext(filename)[0] + QUARANTINE_SUFFIX
+
+
+def duplicate_filename(filename: str) -> str:
+    """
+    :param filename: CSV file being imported
+    :return: name of the CSV file its possible duplicates are listed in
+    """
+    return os.path.splitext(filename)[0] + DUPLICATE_SUFFIX
+
+
+def is_report(filename: str) -> bool:
+    """
+    :param filename: name of a file
+    :return: true if it is one of the files that rows are set aside or listed in by an import, which are
+        never imported themselves
+    """
+    return filename.lower().endswith((QUARANTINE_SUFFIX, DUPLICATE_SUFFIX))
+
+
+def read_csv_chunks(filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Reads a household CSV file a chunk at a time. Every value is kept as a string
+    :param filename: CSV file to read
+    :param chunk_size: number of rows in each chunk
+    :return: iterator of dataframes
+    """
+    import pandas as pd
+
+    return pd.read_csv(filename, dtype=str, keep_default_na=False, na_filter=False,
+                       usecols=hh.COLUMNS, chunksize=chunk_size)
+
+
+def read_chunks(filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Reads a household file a chunk at a time, as a CSV file or by the file extension as a Parquet or Arrow
+    file. Every value is kept as a string
+    :param filename: file to read
+    :param chunk_size: number of rows in each chunk
+    :return: iterator of dataframes
+    """
+    if columnar_io.is_columnar(filename):
+        return columnar_io.read_chunks(filename, chunk_size)
+    return read_csv_chunks(filename, chunk_size)
+
+
+def read_file(filename: str) -> pd.DataFrame:
+    """
+    Reads a whole household file at once, as a CSV file or by the file extension as a Parquet or Arrow file.
+    Every value is kept as a string
+    :param filename: file to read
+    :return: dataframe of household data
+    """
+    import pandas as pd
+
+    if columnar_io.is_columnar(filename):
+        return columnar_io.read_file(filename)
+    # supress converting "n/a" and zip codes from a string
+    return pd.read_csv(filename, keep_default_na=False, dtype=str, na_filter=False)
+
+
+def remove_report(filename: str) -> None:
+    """
+    Deletes a quarantine or duplicate file left by an earlier import of the same file, so the rows of
+    this import are not mixed in with the old ones. Does nothing if there is no such file
+    :param filename: file to delete
+    """
+    if filename and os.path.exists(filename):
+        os.remove(filename)
+
+
+def quarantine_rows(rows: pd.DataFrame, filename: str) -> None:
+    """
+    Appends rejected rows to a CSV file so they can be fixed and imported again later. An import calls
+    remove_report first, so the file only holds the rows of the latest import
+    :param rows: dataframe of rejected household data
+    :param filename: CSV file to append to. The header is written if the file is new or empty
+    """
+    append_csv(rows[hh.COLUMNS], filename)
+
+
+def append_csv(rows: pd.DataFrame, filename: str) -> None:
+    """
+    Appends rows to a CSV file
+    :param rows: dataframe to write
+    :param filename: CSV file to append to. The header is written if the file is new or empty
+    """
+    write_header = not os.path.exists(filename) or os.path.getsize(filename) == 0
+    rows.to_csv(filename, mode='a', header=write_header, index=False)
+
+
+def chunk_duplicates(conn: sqlite3.Connection, chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Finds possible duplicates for the rows of a chunk among the households in the database and the
+    earlier rows of the chunk. Only the saved households with the same zip code and house number as a row
+    are read, and nothing is kept afterwards, so memory use depends on the chunk and not the database
+    :param conn: open database connection
+    :param chunk: dataframe of valid rows about to be written to the database
+    :return: possible duplicates report with the columns in dedupe.REPORT_COLUMNS
+    """
+    duplicate_index = DuplicateIndex()
+    blocks = set(zip(chunk['adrs_zip'].tolist(), chunk['adrs_number'].tolist()))
+    duplicate_index.add_frame(database.load_block_parts(conn, blocks))
+    return duplicate_index.check_frame(chunk)
+
+
+def import_csv(filename: str, store=None, db_conn: sqlite3.Connection = None, overwrite: bool = False,
+               chunk_size: int = DEFAULT_CHUNK_SIZE, quarantine_file: str = None, duplicate_file: str = None) -> dict:
+    """
+    Imports a CSV file one chunk at a time. Each chunk is validated and checked against the addresses
+    already stored, then either merged into a HouseholdStore or written straight to the database.
+    Only one chunk is held in memory at a time. Progress is printed after each chunk
+    :param filename: CSV, Parquet or Arrow file to import
+    :param store: HouseholdStore to merge the rows into
+    :param db_conn: open database connection to write the rows to, used if no store is given
+    :param overwrite: true to throw away the current data before importing
+    :param chunk_size: number of rows read at a time
+    :param quarantine_file: optional CSV file that invalid rows are written to. The file is replaced on
+        each import
+    :param duplicate_file: optional CSV file to list possible duplicates in (see dedupe.py). Rows that are
+        probably the same place as a stored household, or an earlier row, are still imported but are
+        listed here so they can be checked. The file is replaced on each import
+    :return: dict of counts for 'rows', 'added', 'duplicates', 'rejected' and 'possible_duplicates'
+    """
+    totals = {'rows': 0, 'added': 0, 'duplicates': 0, 'rejected': 0, 'possible_duplicates': 0}
+    if store is None and db_conn is None:
+        raise ValueError("import_csv needs a store or a database connection to import into")
+
+    if store is not None and overwrite:
+        store.overwrite(hh.empty_dataframe())
+    remove_report(quarantine_file)
+    remove_report(duplicate_file)
+    # a store keeps one index of every address. When writing to the database the rows of earlier chunks are
+    # already in it, so each chunk is only checked against the saved households that share a block with it
+    duplicate_index = store.duplicate_index() if duplicate_file and store is not None else None
+    # when writing straight to the database the whole import is one transaction, so a bad file changes nothing
+    transaction = db_conn if store is None else None
+    if transaction is not None:
+        transaction.execute("BEGIN")
+    try:
+        # an overwrite makes every row new, so the rollups and search index are rebuilt once at the end
+        bulk = transaction is not None and overwrite
+        with database.triggers_paused(transaction) if bulk else nullcontext():
+            if bulk:
+                database.delete_all(transaction)
+            for chunk_number, chunk in enumerate(read_chunks(filename, chunk_size), start=1):
+                accepted, rejected = hh.split_valid(chunk)
+                if quarantine_file and len(rejected) > 0:
+                    quarantine_rows(rejected, quarantine_file)
+                if duplicate_file:
+                    if duplicate_index is not None:
+                        report = duplicate_index.check_frame(accepted)
+                    else:
+                        report = chunk_duplicates(transaction, accepted)
+                    if len(report) > 0:
+                        append_csv(report, duplicate_file)
+                    totals['possible_duplicates'] += len(report)
+                if store is not None:
+                    added = store.merge(accepted)
+                else:
+                    added = database.insert_new_rows(transaction, flags.packed_rows(accepted))
+                totals['rows'] += len(chunk)
+                totals['added'] += added
+                totals['duplicates'] += len(accepted) - added
+                totals['rejected'] += len(chunk) - len(accepted)
+                print(f"FILE OPERATION: Chunk {chunk_number} - {len(chunk)} rows read, {added} added, "
+                      f"{len(accepted) - added} duplicates, {len(chunk) - len(accepted)} rejected")
+        if transaction is not None:
+            transaction.execute("COMMIT")
+    except Exception:  # undo everything, then let the caller report the error
+        if transaction is not None:
+            transaction.execute("ROLLBACK")
+        raise
+    return totals
+
+
+# ------------------
+# Many files at once
+# ------------------
+
+def read_valid_rows(filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE, quarantine_file: str = None) -> tuple:
+    """
+    Reads and validates a whole CSV file. This is the part of a bulk import that runs in a worker process,
+    so it only reads files and never touches the store or the database
+    :param filename: CSV, Parquet or Arrow file to read
+    :param chunk_size: number of rows validated at a time
+    :param quarantine_file: optional CSV file that invalid rows are written to. The file is replaced
+    :return: (dataframe of the valid rows, number of rows read, number of rows rejected, error message or
+        None). If the file could not be read the dataframe is None
+    """
+    import pandas as pd
+
+    accepted_chunks = []
+    rows = 0
+    rejected_count = 0
+    remove_report(quarantine_file)
+    try:
+        for chunk in read_chunks(filename, chunk_size):
+            accepted, rejected = hh.split_valid(chunk)
+            if quarantine_file and len(rejected) > 0:
+                quarantine_rows(rejected, quarantine_file)
+            accepted_chunks.append(accepted)
+            rows += len(chunk)
+            rejected_count += len(rejected)
+    except (OSError, ValueError) as e:  # a parse error is a ValueError
+        return None, rows, rejected_count, str(e)
+    valid = pd.concat(accepted_chunks, ignore_index=True) if accepted_chunks else hh.empty_dataframe()
+    return valid, rows, rejected_count, None
+
+
+def import_many(filenames: list[str], store, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                quarantine: bool = True, report_duplicates: bool = True) -> dict:
+    """
+    Imports many CSV files into a HouseholdStore at once. The files are read and validated at the same
+    time in a pool of worker processes, while this process merges each finished file into the store in the
+    order the files were given. An address found in more than one file, or already stored, is only kept
+    the first time, the same as importing the files one after another. A line of counts is printed for each
+    file, then the totals
+    :param filenames: CSV, Parquet or Arrow files to import
+    :param store: HouseholdStore to merge the rows into
+    :param workers: max number of worker processes. Defaults to the number of CPUs
+    :param chunk_size: number of rows each worker validates at a time
+    :param quarantine: true to set invalid rows aside in a file named by quarantine_filename. It is
+        replaced on each import
+    :param report_duplicates: true to list possible duplicates (see dedupe.py) in a file named by
+        duplicate_filename. It is replaced on each import
+    :return: dict with 'files', a list with a dict of counts for each file ('file', 'rows', 'accepted',
+        'rejected', 'added', 'duplicates', 'possible_duplicates' and 'error'), the totals of those counts
+        over every file, 'seconds' and 'rows_per_second'
+    """
+    start = time.perf_counter()
+    totals = {'rows': 0, 'accepted': 0, 'rejected': 0, 'added': 0, 'duplicates': 0, 'possible_duplicates': 0}
+    results = []
+    duplicate_index = store.duplicate_index() if report_duplicates else None
+    workers = max(1, min(workers or os.cpu_count() or 1, len(filenames)))
+    quarantine_files = [quarantine_filename(name) if quarantine else None for name in filenames]
+    if report_duplicates:
+        for name in filenames:
+            remove_report(duplicate_filename(name))
+
+    # with only one worker, starting a process would just add the cost of sending the rows back
+    with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as pool:
+        # map gives the results back in file order, so which copy of a repeated address is kept never
+        # depends on which worker finished first
+        parsed = (map if pool is None else pool.map)(read_valid_rows, filenames, [chunk_size] * len(filenames),
+                                                     quarantine_files)
+        for name, (valid, rows, rejected, error) in zip(filenames, parsed):
+            counts = {'file': name, 'rows': rows, 'accepted': 0, 'rejected': rejected, 'added': 0, 'duplicates': 0,
+                      'possible_duplicates': 0, 'error': error}
+            if valid is not None:
+                if duplicate_index is not None:
+                    report = duplicate_index.check_frame(valid)
+                    if len(report) > 0:
+                        append_csv(report, duplicate_filename(name))
+                    counts['possible_duplicates'] = len(report)
+                counts['accepted'] = len(valid)
+                counts['added'] = store.merge(valid)
+                counts['duplicates'] = counts['accepted'] - counts['added']
+            for key in totals:
+                totals[key] += counts[key]
+            results.append(counts)
+            if error is not None:
+                print(f"FILE OPERATION: {name} - could not be read: {error}")
+            else:
+                print(f"FILE OPERATION: {name} - {rows} rows read, {counts['added']} added, "
+                      f"{counts['duplicates']} duplicates, {rejected} rejected")
+
+    seconds = time.perf_counter() - start
+    totals['files'] = results
+    totals['seconds'] = seconds
+    totals['rows_per_second'] = totals['rows'] / seconds if seconds > 0 else 0
+    return totals
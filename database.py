@@ -0,0 +1,838 @@
+"""
+database.py
+Author: Russell Johnson
+Date 2 Dec 2025
+SER416 Final Project
+Handles the sqlite database the households are stored in. Creates the table with an explicit schema,
+upgrades databases made by older versions of the program, and reads/writes household rows
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import sqlite3
+import sys
+from contextlib import contextmanager
+import household as hh
+import flags
+import rollups
+from household_store import ADDED, EDITED
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ------------------
+# Constants
+# ------------------
+
+TABLE_NAME = "households"
+ROLLUP_TABLE_NAME = "rollups"  # totals for each zip code and city pair, kept up to date by triggers
+SEARCH_TABLE_NAME = "households_search"  # full text index of the columns below, kept up to date by triggers
+# the address string already holds the number, street, city, state and zip, so indexing those columns
+# separately would only make the index bigger
+SEARCH_COLUMNS = ["address", "email", "phone"]
+# households that were saved before they had to pass validation, moved out of the households table so
+# nothing that reads it ever sees them
+QUARANTINE_TABLE_NAME = "households_quarantine"
+SEARCH_MIN_LENGTH = 3  # the index is made of 3 character pieces, so shorter words have to be scanned for
+
+# bump this and add a function to MIGRATIONS whenever the schema changes
+SCHEMA_VERSION = 5
+
+# columns stored as integers in the database. Everything else is text
+INT_COLUMNS = ["adults", "children"]
+
+# index name -> columns. The triage flags are packed into flag_values/flag_known (see flags.py), so
+# searching them scans these small indexes instead of the whole table
+INDEXES = {
+    "zip_flags": ["adrs_zip", "flag_values", "flag_known"],
+    "flags": ["flag_values", "flag_known"],
+    "zip_address": ["adrs_zip", "address"],  # lets paging through one zip code skip the other zips
+    "zip_number": ["adrs_zip", "adrs_number"],  # finds the households that could be duplicates (see dedupe.py)
+}
+
+
+# ------------------
+# Schema
+# ------------------
+
+def _create_table_sql(table_name: str) -> str:
+    """
+    Builds the create table statement for the households table
+    :param table_name: name to give the table
+    :return: sql statement
+    """
+    col_defs = ["id INTEGER PRIMARY KEY", "address TEXT NOT NULL UNIQUE"]
+    for col in flags.PLAIN_COLUMNS[1:]:  # address is already defined above
+        col_type = "INTEGER" if col in INT_COLUMNS else "TEXT"
+        col_defs.append(f"{col} {col_type}")
+    col_defs += ["flag_values INTEGER NOT NULL DEFAULT 0", "flag_known INTEGER NOT NULL DEFAULT 0"]
+    return f'CREATE TABLE "{table_name}" (\n    ' + ",\n    ".join(col_defs) + "\n)"
+
+
+def _create_v1_table_sql(table_name: str) -> str:
+    """
+    Builds the create table statement for version 1 of the households table, with a text column per flag
+    :param table_name: name to give the table
+    :return: sql statement
+    """
+    col_defs = ["id INTEGER PRIMARY KEY", "address TEXT NOT NULL UNIQUE"]
+    for col in hh.COLUMNS[1:]:  # address is already defined above
+        col_type = "INTEGER" if col in INT_COLUMNS else "TEXT"
+        col_defs.append(f"{col} {col_type}")
+    return f'CREATE TABLE "{table_name}" (\n    ' + ",\n    ".join(col_defs) + "\n)"
+
+
+def _create_rollup_table_sql() -> str:
+    """
+    :return: create table statement for the rollups table
+    """
+    col_defs = [f"{col} TEXT" for col in rollups.KEY_COLUMNS]
+    col_defs += [f"{col} INTEGER NOT NULL DEFAULT 0" for col in rollups.TOTAL_COLUMNS]
+    col_defs.append(f"PRIMARY KEY ({', '.join(rollups.KEY_COLUMNS)})")
+    return f'CREATE TABLE "{ROLLUP_TABLE_NAME}" (\n    ' + ",\n    ".join(col_defs) + "\n)"
+
+
+def _rollup_amounts(row: str) -> list[str]:
+    """
+    :param row: NEW or OLD, the row a trigger is adding to or taking away from the totals
+    :return: list of sql expressions for the amounts the row adds, in rollups.TOTAL_COLUMNS order
+    """
+    return (["1", f"COALESCE({row}.adults, 0)", f"COALESCE({row}.children, 0)"] +
+            [f"(({row}.flag_values & {bit}) != 0)" for bit in flags.FLAG_BITS.values()])
+
+
+def _rollup_add_sql() -> str:
+    """
+    :return: trigger statement that adds the NEW row to the totals of its zip code and city
+    """
+    cols = rollups.KEY_COLUMNS + rollups.TOTAL_COLUMNS
+    values = [f"NEW.{col}" for col in rollups.KEY_COLUMNS] + _rollup_amounts("NEW")
+    set_list = ", ".join(f"{col} = {col} + excluded.{col}" for col in rollups.TOTAL_COLUMNS)
+    return (f'INSERT INTO "{ROLLUP_TABLE_NAME}" ({", ".join(cols)}) VALUES ({", ".join(values)}) '
+            f'ON CONFLICT({", ".join(rollups.KEY_COLUMNS)}) DO UPDATE SET {set_list};')
+
+
+def _rollup_remove_sql() -> list[str]:
+    """
+    :return: trigger statements that take the OLD row away from the totals of its zip code and city, and
+        drop the totals once no households are left in them
+    """
+    key_match = " AND ".join(f"{col} IS OLD.{col}" for col in rollups.KEY_COLUMNS)
+    set_list = ", ".join(f"{col} = {col} - {amount}"
+                         for col, amount in zip(rollups.TOTAL_COLUMNS, _rollup_amounts("OLD")))
+    return [f'UPDATE "{ROLLUP_TABLE_NAME}" SET {set_list} WHERE {key_match};',
+            f'DELETE FROM "{ROLLUP_TABLE_NAME}" WHERE {key_match} AND households <= 0;']
+
+
+def _create_rollup_trigger_sql() -> list[str]:
+    """
+    Builds the triggers that keep the rollups table up to date. Every insert, delete and update of a
+    household adjusts the totals of just its own zip code and city, so they never have to be recounted
+    :return: list of create trigger statements
+    """
+    remove = "\n    ".join(_rollup_remove_sql())
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "{TABLE_NAME}_rollup_insert" AFTER INSERT ON "{TABLE_NAME}" BEGIN\n'
+        f'    {_rollup_add_sql()}\nEND',
+        f'CREATE TRIGGER IF NOT EXISTS "{TABLE_NAME}_rollup_delete" AFTER DELETE ON "{TABLE_NAME}" BEGIN\n'
+        f'    {remove}\nEND',
+        f'CREATE TRIGGER IF NOT EXISTS "{TABLE_NAME}_rollup_update" AFTER UPDATE ON "{TABLE_NAME}" BEGIN\n'
+        f'    {remove}\n    {_rollup_add_sql()}\nEND',
+    ]
+
+
+def _drop_rollup_trigger_sql() -> list[str]:
+    """
+    :return: list of drop trigger statements for the rollups triggers
+    """
+    return [f'DROP TRIGGER IF EXISTS "{TABLE_NAME}_rollup_{action}"' for action in ("insert", "delete", "update")]
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Recounts the rollups table from every saved household. Does not commit, so the caller controls the
+    transaction
+    :param conn: open database connection
+    """
+    keys = ", ".join(rollups.KEY_COLUMNS)
+    amounts = ", ".join(f"SUM({amount})" for amount in _rollup_amounts(f'"{TABLE_NAME}"'))
+    conn.execute(f'DELETE FROM "{ROLLUP_TABLE_NAME}"')
+    conn.execute(f'INSERT INTO "{ROLLUP_TABLE_NAME}" ({keys}, {", ".join(rollups.TOTAL_COLUMNS)}) '
+                 f'SELECT {keys}, {amounts} FROM "{TABLE_NAME}" GROUP BY {keys}')
+
+
+def _create_search_table_sql() -> str:
+    """
+    The search table is an FTS5 index that reads its text from the households table (external content),
+    so the text is not stored twice. The trigram tokenizer indexes every 3 character piece, which lets a
+    search match the middle of a word, like part of an email or the last digits of a phone number
+    :return: create virtual table statement for the search table
+    """
+    return (f'CREATE VIRTUAL TABLE "{SEARCH_TABLE_NAME}" USING fts5({", ".join(SEARCH_COLUMNS)}, '
+            f"content='{TABLE_NAME}', content_rowid='id', tokenize='trigram')")
+
+
+def _create_search_trigger_sql() -> list[str]:
+    """
+    Builds the triggers that keep the search table in step with the households table
+    :return: list of create trigger statements
+    """
+    cols = ", ".join(SEARCH_COLUMNS)
+    add = (f'INSERT INTO "{SEARCH_TABLE_NAME}" (rowid, {cols}) '
+           f'VALUES (NEW.id, {", ".join(f"NEW.{col}" for col in SEARCH_COLUMNS)});')
+    remove = (f'INSERT INTO "{SEARCH_TABLE_NAME}" ("{SEARCH_TABLE_NAME}", rowid, {cols}) '
+              f'VALUES (\'delete\', OLD.id, {", ".join(f"OLD.{col}" for col in SEARCH_COLUMNS)});')
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "{TABLE_NAME}_search_insert" AFTER INSERT ON "{TABLE_NAME}" BEGIN\n'
+        f'    {add}\nEND',
+        f'CREATE TRIGGER IF NOT EXISTS "{TABLE_NAME}_search_delete" AFTER DELETE ON "{TABLE_NAME}" BEGIN\n'
+        f'    {remove}\nEND',
+        f'CREATE TRIGGER IF NOT EXISTS "{TABLE_NAME}_search_update" AFTER UPDATE ON "{TABLE_NAME}" BEGIN\n'
+        f'    {remove}\n    {add}\nEND',
+    ]
+
+
+def _drop_search_trigger_sql() -> list[str]:
+    """
+    :return: list of drop trigger statements for the search triggers
+    """
+    return [f'DROP TRIGGER IF EXISTS "{TABLE_NAME}_search_{action}"' for action in ("insert", "delete", "update")]
+
+
+def search_available(conn: sqlite3.Connection) -> bool:
+    """
+    :param conn: open database connection
+    :return: true if the database has the search table. It is missing if sqlite was built without FTS5
+    """
+    return _table_exists(conn, SEARCH_TABLE_NAME)
+
+
+def rebuild_search(conn: sqlite3.Connection) -> None:
+    """
+    Rebuilds the search table from every saved household. Does not commit, so the caller controls the
+    transaction
+    :param conn: open database connection
+    """
+    if search_available(conn):
+        conn.execute(f'INSERT INTO "{SEARCH_TABLE_NAME}" ("{SEARCH_TABLE_NAME}") VALUES (\'rebuild\')')
+
+
+@contextmanager
+def search_triggers_paused(conn: sqlite3.Connection):
+    """
+    FTS5 writes out its pending changes at the end of every trigger, which makes keeping the search table
+    up to date from triggers about ten times slower than writing the same rows to it directly. This turns
+    the search triggers off so a write of many rows can update the search table itself with a few
+    statements (see _unindex, _index and _index_after)
+    :param conn: open database connection
+    :return: yields true if the caller has to update the search table, false if there is no search table
+        or the triggers are already off because everything is being rebuilt (see triggers_paused)
+    """
+    trigger = conn.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name=?",
+                           (f"{TABLE_NAME}_search_insert",)).fetchone()
+    if trigger is None:
+        yield False
+        return
+    if not conn.in_transaction:
+        conn.execute("BEGIN")  # sqlite3 does not start one on its own for DDL
+    for statement in _drop_search_trigger_sql():
+        conn.execute(statement)
+    yield True
+    for statement in _create_search_trigger_sql():
+        conn.execute(statement)
+
+
+def _search_rows(conn: sqlite3.Connection, addresses) -> list[tuple]:
+    """
+    :param conn: open database connection
+    :param addresses: iterable of addresses. Ones that are not saved are skipped
+    :return: list of (id, search column values...) of the saved households
+    """
+    sql = f'SELECT id, {", ".join(SEARCH_COLUMNS)} FROM "{TABLE_NAME}" WHERE address = ?'
+    rows = (conn.execute(sql, (address,)).fetchone() for address in addresses)
+    return [row for row in rows if row is not None]
+
+
+def _unindex(conn: sqlite3.Connection, addresses) -> None:
+    """
+    Takes saved households out of the search table. Must be done before they are deleted or changed
+    :param conn: open database connection
+    :param addresses: iterable of addresses. Ones that are not saved are skipped
+    """
+    values = ", ".join("?" * (len(SEARCH_COLUMNS) + 1))
+    conn.executemany(f'INSERT INTO "{SEARCH_TABLE_NAME}" ("{SEARCH_TABLE_NAME}", rowid, {", ".join(SEARCH_COLUMNS)}) '
+                     f"VALUES ('delete', {values})", _search_rows(conn, addresses))
+
+
+def _index(conn: sqlite3.Connection, addresses) -> None:
+    """
+    Adds saved households to the search table
+    :param conn: open database connection
+    :param addresses: iterable of addresses. Ones that are not saved are skipped
+    """
+    values = ", ".join("?" * (len(SEARCH_COLUMNS) + 1))
+    conn.executemany(f'INSERT INTO "{SEARCH_TABLE_NAME}" (rowid, {", ".join(SEARCH_COLUMNS)}) VALUES ({values})',
+                     _search_rows(conn, addresses))
+
+
+def _index_after(conn: sqlite3.Connection, last_id: int) -> None:
+    """
+    Adds every household saved after a given one to the search table. New rows always get a higher id
+    :param conn: open database connection
+    :param last_id: highest id before the new rows were inserted
+    """
+    cols = ", ".join(SEARCH_COLUMNS)
+    conn.execute(f'INSERT INTO "{SEARCH_TABLE_NAME}" (rowid, {cols}) '
+                 f'SELECT id, {cols} FROM "{TABLE_NAME}" WHERE id > ?', (last_id,))
+
+
+@contextmanager
+def triggers_paused(conn: sqlite3.Connection):
+    """
+    Turns the rollups and search triggers off for a change to most of the table, then rebuilds both tables
+    in one pass when it is done. Rebuilding is far cheaper than updating them once for every row.
+    A transaction is started if one is not already open, so the triggers come back if the change fails.
+    Pausing when already paused does nothing
+    :param conn: open database connection
+    """
+    trigger = conn.execute("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name=?",
+                           (f"{TABLE_NAME}_rollup_insert",)).fetchone()
+    if trigger is None:  # already paused further up
+        yield
+        return
+    if not conn.in_transaction:
+        conn.execute("BEGIN")  # sqlite3 does not start one on its own for DDL
+    search = search_available(conn)
+    for statement in _drop_rollup_trigger_sql() + _drop_search_trigger_sql():
+        conn.execute(statement)
+    yield
+    rebuild_rollups(conn)
+    rebuild_search(conn)
+    for statement in _create_rollup_trigger_sql() + (_create_search_trigger_sql() if search else []):
+        conn.execute(statement)
+
+
+def _create_index_sql() -> list[str]:
+    """
+    :return: list of create index statements for the households table
+    """
+    return [f'CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_{name} ON "{TABLE_NAME}" ({", ".join(cols)})'
+            for name, cols in INDEXES.items()]
+
+
+def _table_exists(conn: sqlite3.Connection, table_name: str) -> bool:
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+    return cursor.fetchone() is not None
+
+
+def _migrate_to_v1(conn: sqlite3.Connection) -> None:
+    """
+    Creates the keyed households table. If the database was made by an older version of the program
+    the old untyped table is copied over. Rows with a duplicate address are dropped, the first one is kept
+    :param conn: open database connection
+    """
+    if not _table_exists(conn, TABLE_NAME):
+        conn.execute(_create_v1_table_sql(TABLE_NAME))
+        return
+
+    print("Starting Up: Upgrading Database Table")
+    legacy_name = f"{TABLE_NAME}_legacy"
+    conn.execute(f'ALTER TABLE "{TABLE_NAME}" RENAME TO "{legacy_name}"')
+    conn.execute(_create_v1_table_sql(TABLE_NAME))
+
+    # copy every column the old table had. Columns it was missing are left as the default
+    legacy_cols = {row[1] for row in conn.execute(f'PRAGMA table_info("{legacy_name}")')}
+    copy_cols = ", ".join(f'"{col}"' for col in hh.COLUMNS if col in legacy_cols)
+    cursor = conn.execute(f'INSERT OR IGNORE INTO "{TABLE_NAME}" ({copy_cols}) '
+                          f'SELECT {copy_cols} FROM "{legacy_name}" WHERE address IS NOT NULL')
+    legacy_count = conn.execute(f'SELECT COUNT(*) FROM "{legacy_name}"').fetchone()[0]
+    conn.execute(f'DROP TABLE "{legacy_name}"')
+    if cursor.rowcount < legacy_count:
+        print(f"Starting Up: Dropped {legacy_count - cursor.rowcount} duplicate household(s) while upgrading",
+              file=sys.stderr)
+
+
+def _migrate_to_v2(conn: sqlite3.Connection) -> None:
+    """
+    Replaces the text column of each flag with the packed flag_values and flag_known columns.
+    A flag holding anything other than t or f is treated as unanswered
+    :param conn: open database connection
+    """
+    old_name = f"{TABLE_NAME}_v1"
+    conn.execute(f'ALTER TABLE "{TABLE_NAME}" RENAME TO "{old_name}"')
+    conn.execute(_create_table_sql(TABLE_NAME))
+
+    value_sql = " | ".join(f"(CASE WHEN lower({col}) = 't' THEN {bit} ELSE 0 END)"
+                           for col, bit in flags.FLAG_BITS.items())
+    known_sql = " | ".join(f"(CASE WHEN lower({col}) IN ('t', 'f') THEN {bit} ELSE 0 END)"
+                           for col, bit in flags.FLAG_BITS.items())
+    plain_cols = ", ".join(f'"{col}"' for col in flags.PLAIN_COLUMNS)
+    conn.execute(f'INSERT INTO "{TABLE_NAME}" (id, {plain_cols}, flag_values, flag_known) '
+                 f'SELECT id, {plain_cols}, {value_sql}, {known_sql} FROM "{old_name}"')
+    conn.execute(f'DROP TABLE "{old_name}"')  # also drops the old per-flag indexes
+
+
+def _migrate_to_v3(conn: sqlite3.Connection) -> None:
+    """
+    Adds the rollups table and the triggers that keep it up to date, and counts the households already saved
+    :param conn: open database connection
+    """
+    conn.execute(_create_rollup_table_sql())
+    for statement in _create_rollup_trigger_sql():
+        conn.execute(statement)
+    rebuild_rollups(conn)
+
+
+def _migrate_to_v4(conn: sqlite3.Connection) -> None:
+    """
+    Adds the full text search table and its triggers, and indexes the households already saved. If this
+    sqlite was built without FTS5 the table is left out and searches scan the households table instead
+    :param conn: open database connection
+    """
+    try:
+        conn.execute(_create_search_table_sql())
+    except sqlite3.OperationalError as e:
+        print(f"Starting Up: Full text search not available, searches will be slower - {e}", file=sys.stderr)
+        return
+    print("Starting Up: Building Search Index")
+    for statement in _create_search_trigger_sql():
+        conn.execute(statement)
+    rebuild_search(conn)
+
+
+def _migrate_to_v5(conn: sqlite3.Connection) -> None:
+    """
+    Checks every saved household with the same rules as a household that is typed in or imported, and
+    moves the ones that fail to the quarantine table. Everything written after this is checked first, so
+    pages, searches, exports and the store all see the same households. The table is read a chunk at a
+    time, and pandas is only needed if there is something to check
+    :param conn: open database connection
+    """
+    conn.execute(_create_table_sql(QUARANTINE_TABLE_NAME))
+    if conn.execute(f'SELECT 1 FROM "{TABLE_NAME}" LIMIT 1').fetchone() is None:
+        return
+    import pandas as pd
+
+    print("Starting Up: Checking Saved Households")
+    invalid = []
+    for rows in fetch_chunks(conn):
+        _, rejected = hh.split_valid(pd.DataFrame([record_from_row(row) for row in rows], columns=hh.COLUMNS))
+        invalid += rejected['address'].tolist()
+    if not invalid:
+        return
+    # moved after the read so the table is not changed under the cursor. The triggers take them out of
+    # the rollups and the search index
+    col_list = ", ".join(f'"{col}"' for col in ["id"] + flags.PACKED_COLUMNS)
+    conn.executemany(f'INSERT INTO "{QUARANTINE_TABLE_NAME}" ({col_list}) '
+                     f'SELECT {col_list} FROM "{TABLE_NAME}" WHERE address = ?', [(a,) for a in invalid])
+    conn.executemany(f'DELETE FROM "{TABLE_NAME}" WHERE address = ?', [(a,) for a in invalid])
+    print(f"Starting Up: Moved {len(invalid)} invalid household(s) out of the households table", file=sys.stderr)
+
+
+# MIGRATIONS[n] upgrades a database from schema version n to n + 1
+MIGRATIONS = [_migrate_to_v1, _migrate_to_v2, _migrate_to_v3, _migrate_to_v4, _migrate_to_v5]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """
+    Brings the database up to the current schema version. Each step runs in its own transaction so a
+    failed upgrade leaves the database as it was
+    :param conn: open database connection
+    """
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise sqlite3.DatabaseError(f"database schema version {version} is newer than this program supports")
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # manage the transaction by hand so the DDL is included in it
+    try:
+        for step in range(version, SCHEMA_VERSION):
+            conn.execute("BEGIN")
+            try:
+                MIGRATIONS[step](conn)
+                conn.execute(f"PRAGMA user_version = {step + 1}")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        for statement in _create_index_sql():
+            conn.execute(statement)
+    finally:
+        conn.isolation_level = isolation_level
+
+
+def open_database(filename: str) -> sqlite3.Connection:
+    """
+    Opens (creating if needed) the database and makes sure it uses the current schema
+    :param filename: sqlite file to open
+    :return: open database connection
+    """
+    conn = sqlite3.connect(filename)
+    try:
+        migrate(conn)
+    except sqlite3.Error:
+        conn.close()
+        raise
+    return conn
+
+
+# ------------------
+# Reading
+# ------------------
+
+def record_from_row(row: tuple) -> dict:
+    """
+    :param row: tuple of values in flags.PACKED_COLUMNS order, as read from the database
+    :return: dict of household column name to value, with the flags unpacked
+    """
+    record = dict(zip(flags.PLAIN_COLUMNS, row))
+    record.update(flags.unpack(row[-2], row[-1]))
+    for col in INT_COLUMNS:
+        record[col] = str(record[col])
+    return {col: record[col] for col in hh.COLUMNS}
+
+
+def load_dataframe(conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Reads every household from the database
+    :param conn: open database connection
+    :return: dataframe of household data, in the order the rows were first saved
+    """
+    import pandas as pd
+
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    packed = pd.read_sql(f'SELECT {col_list} FROM "{TABLE_NAME}" ORDER BY id', conn)
+    df = packed[flags.PLAIN_COLUMNS].copy()
+    # the rest of the program works with strings, the same as if the data was typed in
+    for col in INT_COLUMNS:
+        df[col] = df[col].astype(str)
+    for col, answers in flags.unpack_frame(packed['flag_values'].to_numpy(),
+                                           packed['flag_known'].to_numpy()).items():
+        df[col] = answers
+    return df[hh.COLUMNS]
+
+
+def fetch_quarantined(conn: sqlite3.Connection) -> list[dict]:
+    """
+    Reads the households the upgrade to schema version 5 found invalid and set aside
+    :param conn: open database connection
+    :return: list of dicts of column name to value, in the order the rows were first saved
+    """
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    rows = conn.execute(f'SELECT {col_list} FROM "{QUARANTINE_TABLE_NAME}" ORDER BY id')
+    return [record_from_row(row) for row in rows]
+
+
+def address_exists(conn: sqlite3.Connection, address: str) -> bool:
+    """
+    Uses the address key to check if a household is already saved
+    :param conn: open database connection
+    :param address: address string to look for
+    :return: true if there is a saved household with that address
+    """
+    cursor = conn.execute(f'SELECT 1 FROM "{TABLE_NAME}" WHERE address = ?', (address,))
+    return cursor.fetchone() is not None
+
+
+def fetch_record(conn: sqlite3.Connection, address: str) -> dict:
+    """
+    Uses the address key to read a single saved household
+    :param conn: open database connection
+    :param address: address string to look for
+    :return: dict of column name to value, None if there is no match
+    """
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    row = conn.execute(f'SELECT {col_list} FROM "{TABLE_NAME}" WHERE address = ?', (address,)).fetchone()
+    if row is None:
+        return None
+    return record_from_row(row)
+
+
+def fetch_block(conn: sqlite3.Connection, zip_code: str, number: str) -> list[dict]:
+    """
+    Reads the saved households with a given zip code and house number, which are the only ones that
+    need to be compared when looking for possible duplicates of an address
+    :param conn: open database connection
+    :param zip_code: zip code to look for
+    :param number: house number to look for
+    :return: list of dicts of column name to value
+    """
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    rows = conn.execute(f'SELECT {col_list} FROM "{TABLE_NAME}" WHERE adrs_zip = ? AND adrs_number = ?',
+                        (zip_code, number))
+    return [record_from_row(row) for row in rows]
+
+
+def load_block_parts(conn: sqlite3.Connection, blocks) -> pd.DataFrame:
+    """
+    Reads just the address columns of the saved households with any of the given zip codes and house
+    numbers. The blocks are put in a temporary table and joined with the households, so the lookup is one
+    query however many there are
+    :param conn: open database connection
+    :param blocks: iterable of (zip code, house number)
+    :return: dataframe with address, adrs_number, adrs_street and adrs_zip columns
+    """
+    import pandas as pd
+
+    columns = ["address", "adrs_number", "adrs_street", "adrs_zip"]
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS blocks (adrs_zip TEXT, adrs_number TEXT)")
+    conn.execute("DELETE FROM temp.blocks")
+    conn.executemany("INSERT INTO temp.blocks VALUES (?, ?)", blocks)
+    # CROSS JOIN keeps the blocks as the outer loop, so each one is a lookup in the zip_number index
+    rows = conn.execute(f'SELECT {", ".join(f"h.{col}" for col in columns)} FROM temp.blocks AS b '
+                        f'CROSS JOIN "{TABLE_NAME}" AS h '
+                        f'ON h.adrs_zip = b.adrs_zip AND h.adrs_number = b.adrs_number').fetchall()
+    conn.execute("DELETE FROM temp.blocks")
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _page_sql(columns: str, limit: int, after: str = None, before: str = None, start: str = None,
+              zip_code: str = None) -> tuple[str, list]:
+    """
+    Builds the keyset query for one page of households. See fetch_page
+    :param columns: select list of the query
+    :return: (sql, list of parameters)
+    """
+    conditions = []
+    params = []
+    if zip_code is not None:
+        conditions.append("adrs_zip = ?")
+        params.append(zip_code)
+    order = "ASC"
+    if before is not None:
+        conditions.append("address < ?")
+        params.append(before)
+        order = "DESC"  # read backwards from the given address, then flip the page around
+    elif after is not None:
+        conditions.append("address > ?")
+        params.append(after)
+    elif start:
+        conditions.append("address >= ?")
+        params.append(start)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f'SELECT {columns} FROM "{TABLE_NAME}" {where} ORDER BY address {order} LIMIT ?', params + [limit]
+
+
+def fetch_page(conn: sqlite3.Connection, limit: int, after: str = None, before: str = None, start: str = None,
+               zip_code: str = None) -> pd.DataFrame:
+    """
+    Reads one page of households in address order. Pages are found by the address they come after or
+    before (keyset pagination), so only the rows on the page are ever read no matter how deep into the
+    table it is
+    :param conn: open database connection
+    :param limit: max number of households on the page
+    :param after: give the page that comes after this address
+    :param before: give the page that comes before this address
+    :param start: give the page that starts at this address, or the first one after it
+    :param zip_code: only include households in this zip code
+    :return: dataframe of the households on the page
+    """
+    import pandas as pd
+
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    rows = conn.execute(*_page_sql(col_list, limit, after, before, start, zip_code)).fetchall()
+    if before is not None:
+        rows.reverse()
+    return pd.DataFrame([record_from_row(row) for row in rows], columns=hh.COLUMNS)
+
+
+def fetch_page_addresses(conn: sqlite3.Connection, limit: int, after: str = None, before: str = None,
+                         start: str = None, zip_code: str = None) -> list[str]:
+    """
+    Reads just the addresses of one page of households, which is much quicker than the whole rows when
+    most of them are going to be skipped. Takes the same arguments as fetch_page
+    :return: list of the addresses on the page, in address order
+    """
+    addresses = [row[0] for row in conn.execute(*_page_sql("address", limit, after, before, start, zip_code))]
+    if before is not None:
+        addresses.reverse()
+    return addresses
+
+
+def fetch_rollups(conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Reads the saved totals of every zip code and city pair. This reads one row per pair, not one per household
+    :param conn: open database connection
+    :return: dataframe with the rollups.KEY_COLUMNS and rollups.TOTAL_COLUMNS
+    """
+    import pandas as pd
+
+    cols = rollups.KEY_COLUMNS + rollups.TOTAL_COLUMNS
+    rows = conn.execute(f'SELECT {", ".join(cols)} FROM "{ROLLUP_TABLE_NAME}"').fetchall()
+    return pd.DataFrame(rows, columns=cols)
+
+
+def search_households(conn: sqlite3.Connection, text: str, limit: int = None) -> pd.DataFrame:
+    """
+    Finds the saved households where every word of the search text appears somewhere in the address
+    (which includes the street, city and zip), email or phone. Case does not matter and words can be parts
+    of words, like the end of a phone number. Words of 3 or more characters are looked up in the full text
+    index; shorter ones can't be, so they are checked on just the households the longer words matched (or
+    on every household if there are no longer words)
+    :param conn: open database connection
+    :param text: words to search for
+    :param limit: max number of households to return. All of them if not given
+    :return: dataframe of the matching households, in address order
+    """
+    import pandas as pd
+
+    words = text.split()
+    indexed = [word for word in words if len(word) >= SEARCH_MIN_LENGTH] if search_available(conn) else []
+    conditions = []
+    params = []
+    if indexed:  # each word is quoted so FTS5 treats it as plain text rather than query syntax
+        conditions.append(f'id IN (SELECT rowid FROM "{SEARCH_TABLE_NAME}" WHERE "{SEARCH_TABLE_NAME}" MATCH ?)')
+        params.append(" AND ".join('"' + word.replace('"', '""') + '"' for word in indexed))
+    for word in words:
+        if word in indexed:
+            continue
+        pattern = "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        conditions.append("(" + " OR ".join(f"{col} LIKE ? ESCAPE '\\'" for col in SEARCH_COLUMNS) + ")")
+        params += [pattern] * len(SEARCH_COLUMNS)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    sql = f'SELECT {col_list} FROM "{TABLE_NAME}" {where} ORDER BY address'
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    rows = conn.execute(sql, params).fetchall()
+    return pd.DataFrame([record_from_row(row) for row in rows], columns=hh.COLUMNS)
+
+
+def fetch_ranked(conn: sqlite3.Connection, condition: str, params: list, score: str,
+                 limit: int = None) -> tuple[pd.DataFrame, list]:
+    """
+    Reads the households matching a condition, highest score first. Ties are in address order
+    :param conn: open database connection
+    :param condition: sql condition over the households table, with ? for each parameter
+    :param params: list of values for the condition parameters
+    :param score: sql expression that scores a household
+    :param limit: max number of households to read. All of them if not given
+    :return: (dataframe of the households, list of their scores)
+    """
+    import pandas as pd
+
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    sql = f'SELECT {col_list}, {score} AS score FROM "{TABLE_NAME}" WHERE {condition} ORDER BY score DESC, address'
+    params = list(params)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    rows = conn.execute(sql, params).fetchall()
+    df = pd.DataFrame([record_from_row(row[:-1]) for row in rows], columns=hh.COLUMNS)
+    return df, [row[-1] for row in rows]
+
+
+def fetch_chunks(conn: sqlite3.Connection, condition: str = "1", params=(), chunk_size: int = 50000,
+                 limit: int = None):
+    """
+    Reads the households matching a condition a chunk at a time, in the order the rows were first saved.
+    Nothing is sorted, so only one chunk is ever held in memory
+    :param conn: open database connection
+    :param condition: sql condition over the households table, with ? for each parameter
+    :param params: values for the condition parameters
+    :param chunk_size: max number of households in each chunk
+    :param limit: max number of households to read. All of them if not given
+    :return: iterator of lists of tuples with the values in flags.PACKED_COLUMNS order
+    """
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    sql = f'SELECT {col_list} FROM "{TABLE_NAME}" WHERE {condition}'
+    params = list(params)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cursor = conn.execute(sql, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+# ------------------
+# Writing
+# ------------------
+
+def _insert_sql(conflict: str) -> str:
+    """
+    :param conflict: sql conflict clause to add after INSERT, such as "OR IGNORE"
+    :return: insert statement taking the values of every column in flags.PACKED_COLUMNS order
+    """
+    col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+    value_list = ", ".join("?" for _ in flags.PACKED_COLUMNS)
+    return f'INSERT {conflict} INTO "{TABLE_NAME}" ({col_list}) VALUES ({value_list})'
+
+
+def insert_new_rows(conn: sqlite3.Connection, rows) -> int:
+    """
+    Inserts rows whose address is not already saved. Rows with an address that is already saved are skipped.
+    Does not commit, so the caller controls the transaction
+    :param conn: open database connection
+    :param rows: iterable of tuples with the values in flags.PACKED_COLUMNS order
+    :return: number of rows inserted
+    """
+    with search_triggers_paused(conn) as update_search:
+        last_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{TABLE_NAME}"').fetchone()[0]
+        cursor = conn.executemany(_insert_sql("OR IGNORE"), rows)
+        if update_search:
+            _index_after(conn, last_id)
+    return max(cursor.rowcount, 0)
+
+
+def delete_all(conn: sqlite3.Connection) -> None:
+    """
+    Deletes every saved household, and with them every rollup. Does not commit, so the caller controls
+    the transaction
+    :param conn: open database connection
+    """
+    with triggers_paused(conn):  # one row at a time through the triggers is much slower than a plain delete
+        conn.execute(f'DELETE FROM "{TABLE_NAME}"')
+
+
+def write_changes(conn: sqlite3.Connection, removed: list, rows: list, replace_all: bool = False) -> None:
+    """
+    Deletes and writes households. Writing the same changes twice gives the same result, so a write that
+    may or may not have finished can safely be done again. Does not commit, so the caller controls the
+    transaction
+    :param conn: open database connection
+    :param removed: list of addresses to delete
+    :param rows: list of tuples with the values in flags.PACKED_COLUMNS order, to be inserted or to update the
+        saved household with the same address
+    :param replace_all: true to delete every saved household first, so the rows become the whole table
+    """
+    set_list = ", ".join(f'"{col}" = excluded."{col}"' for col in flags.PACKED_COLUMNS[1:])
+    # an insert of an address that is somehow already saved just updates it instead of failing the save
+    upsert_sql = _insert_sql("") + f' ON CONFLICT(address) DO UPDATE SET {set_list}'
+    delete_sql = f'DELETE FROM "{TABLE_NAME}" WHERE address = ?'
+
+    if replace_all:  # the data was overwritten so the old rows all have to go
+        with triggers_paused(conn):
+            delete_all(conn)
+            conn.executemany(upsert_sql, rows)
+        return
+    with search_triggers_paused(conn) as update_search:
+        if update_search:  # a written address can be saved already, so every change is taken out
+            _unindex(conn, list(removed) + [row[0] for row in rows])
+        conn.executemany(delete_sql, ((address,) for address in removed))
+        conn.executemany(upsert_sql, rows)
+        if update_search:
+            _index(conn, [row[0] for row in rows])
+
+
+def save_changes(conn: sqlite3.Connection, store) -> None:
+    """
+    Writes the households that changed since the last save. Everything is done in one transaction
+    :param conn: open database connection
+    :param store: HouseholdStore to save
+    """
+    with conn:  # commits on success, rolls back everything on error
+        if store.replace_all:
+            write_changes(conn, [], store.packed_rows(), replace_all=True)
+        else:
+            write_changes(conn, store.removed_addresses(), store.changed_rows(EDITED) + store.changed_rows(ADDED))
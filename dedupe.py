@@ -0,0 +1,191 @@
+"""
+dedupe.py
+Author: Russell Johnson
+Date 7 Dec 2025
+SER416 Final Project
+Finds households that are probably the same place written two different ways, like "1001 Oak Street" and
+"1001 Oak St" in the same zip code. Households are grouped by zip code and house number, so an address is
+only ever compared with the few households that share both, never with every stored household
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import re
+from functools import lru_cache
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ------------------
+# Constants
+# ------------------
+
+# street words and the abbreviation they are compared as
+STREET_WORDS = {
+    "street": "st", "str": "st", "avenue": "ave", "av": "ave", "road": "rd", "drive": "dr", "dv": "dr",
+    "lane": "ln", "boulevard": "blvd", "court": "ct", "place": "pl", "terrace": "ter", "terr": "ter",
+    "circle": "cir", "parkway": "pkwy", "highway": "hwy", "way": "wy", "trail": "trl", "loop": "lp",
+    "square": "sq", "crossing": "xing", "mountain": "mtn", "mount": "mt", "point": "pt", "saint": "st",
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+    "apartment": "apt", "suite": "ste", "unit": "unit", "number": "no",
+}
+
+# how alike two streets must be (0 to 1) for households with the same number and zip code to be reported
+SIMILARITY_THRESHOLD = 0.6
+
+# columns of a possible duplicates report
+REPORT_COLUMNS = ["address", "possible_duplicate", "similarity", "reason"]
+SAME_ADDRESS = "same address once spelling of street words and punctuation is ignored"
+SIMILAR_STREET = "same house number and zip code, similar street"
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+# ------------------
+# Comparing addresses
+# ------------------
+
+def normalize_number(number: str) -> str:
+    """
+    :param number: house number as entered
+    :return: house number in lowercase without spaces, punctuation or leading zeros
+    """
+    return ''.join(_WORD_PATTERN.findall(str(number).lower())).lstrip('0')
+
+
+@lru_cache(maxsize=65536)  # most households share a street with others, so the same few are seen over and over
+def normalize_street(street: str) -> str:
+    """
+    Puts a street in one standard form so small differences in how it was typed do not matter
+    :param street: street as entered
+    :return: lowercase street words, with punctuation removed and common words abbreviated
+    """
+    return ' '.join(STREET_WORDS.get(word, word) for word in _WORD_PATTERN.findall(street.lower()))
+
+
+def trigrams(text: str) -> set:
+    """
+    :param text: text to split
+    :return: set of every run of 3 characters in the text, with the start and end marked by spaces
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(street_a: str, street_b: str) -> float:
+    """
+    Compares two normalized streets by how many runs of 3 characters they share (the Dice coefficient)
+    :param street_a: normalized street
+    :param street_b: normalized street
+    :return: 1 for the same street, down to 0 for streets with nothing in common
+    """
+    if street_a == street_b:
+        return 1.0
+    grams_a = trigrams(street_a)
+    grams_b = trigrams(street_b)
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+# ------------------
+# DuplicateIndex class
+# ------------------
+
+class DuplicateIndex:
+    """
+    Groups households by zip code and normalized house number. Looking for possible duplicates of an
+    address is a single dictionary lookup plus a comparison with each household in its group, and the
+    groups are nearly always just one or two households
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD) -> None:
+        """
+        Initialize an empty index
+        :param threshold: how alike two streets must be to be reported, from 0 to 1
+        """
+        self.threshold = threshold
+        self._blocks = {}  # (zip code, normalized number) -> list of (address, normalized street)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, address: str, number: str, street: str, zip_code: str) -> None:
+        """
+        Adds a household. Adding an address that is already in the index does nothing
+        :param address: full address string of the household
+        :param number: house number
+        :param street: street
+        :param zip_code: zip code
+        """
+        block = self._blocks.setdefault((zip_code, normalize_number(number)), [])
+        if all(stored != address for stored, _ in block):
+            block.append((address, normalize_street(street)))
+            self._size += 1
+
+    def discard(self, address: str, number: str, zip_code: str) -> None:
+        """
+        Removes a household if it is in the index
+        :param address: full address string of the household
+        :param number: house number
+        :param zip_code: zip code
+        """
+        key = (zip_code, normalize_number(number))
+        block = self._blocks.get(key, [])
+        for i, (stored, _) in enumerate(block):
+            if stored == address:
+                del block[i]
+                self._size -= 1
+                if not block:
+                    del self._blocks[key]
+                return
+
+    def matches(self, address: str, number: str, street: str, zip_code: str) -> list[tuple]:
+        """
+        Finds stored households that are probably the same place as an address. The address itself is
+        never reported
+        :param address: full address string
+        :param number: house number
+        :param street: street
+        :param zip_code: zip code
+        :return: list of (stored address, similarity, reason), most alike first
+        """
+        street = normalize_street(street)
+        found = []
+        for stored, stored_street in self._blocks.get((zip_code, normalize_number(number)), ()):
+            if stored == address:
+                continue
+            score = similarity(street, stored_street)
+            if score >= self.threshold:
+                found.append((stored, round(score, 3), SAME_ADDRESS if score == 1.0 else SIMILAR_STREET))
+        found.sort(key=lambda match: -match[1])
+        return found
+
+    def add_frame(self, df: pd.DataFrame) -> None:
+        """
+        Adds every household in a dataframe
+        :param df: dataframe with address, adrs_number, adrs_street and adrs_zip columns
+        """
+        for address, number, street, zip_code in zip(df['address'].tolist(), df['adrs_number'].tolist(),
+                                                     df['adrs_street'].tolist(), df['adrs_zip'].tolist()):
+            self.add(address, number, street, zip_code)
+
+    def check_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Finds possible duplicates for every household in a dataframe, then adds them to the index so later
+        rows (and later dataframes) are checked against them too. Addresses already in the index are exact
+        duplicates, which are skipped on import anyway, so they are not reported
+        :param df: dataframe with address, adrs_number, adrs_street and adrs_zip columns
+        :return: possible duplicates report with the columns in REPORT_COLUMNS
+        """
+        import pandas as pd
+
+        report = []
+        for address, number, street, zip_code in zip(df['address'].tolist(), df['adrs_number'].tolist(),
+                                                     df['adrs_street'].tolist(), df['adrs_zip'].tolist()):
+            block = self._blocks.get((zip_code, normalize_number(number)), ())
+            if any(stored == address for stored, _ in block):
+                continue
+            for stored, score, reason in self.matches(address, number, street, zip_code):
+                report.append((address, stored, score, reason))
+            self.add(address, number, street, zip_code)
+        return pd.DataFrame(report, columns=REPORT_COLUMNS)
@@ -0,0 +1,149 @@
+"""
+flags.py
+Author: Russell Johnson
+Date 4 Dec 2025
+SER416 Final Project
+Packs the yes/no/unanswered household questions into a pair of integers. Bit i of the value bits is set if
+flag i is 't', and bit i of the known bits is set if flag i was answered at all, so 'n/a' is a 0 in both.
+This is how the flags are kept in memory and in the database. Checks like "special_needs and gas_line"
+become a single bitwise and over an array of integers
+"""
+import household as hh
+from cli_utils import NA
+
+# ------------------
+# Constants
+# ------------------
+
+# the order of this list decides each flag's bit, so only ever add to the end of it
+FLAG_COLUMNS = [
+    "pets", "dogs", "crit_meds", "ref_meds", "special_needs", "gas_tank", "gas_line",
+    "med_training", "know_nbr", "key_nbr", "news_ltr", "contact"
+]
+FLAG_BITS = {col: 1 << i for i, col in enumerate(FLAG_COLUMNS)}
+
+# household columns that are not flags, and the layout of a household once its flags are packed
+PLAIN_COLUMNS = [col for col in hh.COLUMNS if col not in FLAG_BITS]
+PACKED_COLUMNS = PLAIN_COLUMNS + ["flag_values", "flag_known"]
+
+
+# ------------------
+# Single households
+# ------------------
+
+def mask(*names: str) -> int:
+    """
+    :param names: flag column names
+    :return: integer with the bits of all the named flags set
+    """
+    bits = 0
+    for name in names:
+        bits |= FLAG_BITS[name]
+    return bits
+
+
+def pack(record) -> tuple[int, int]:
+    """
+    Packs the flags of one household
+    :param record: dict (or pandas series) with a 't', 'f' or 'n/a' value for each flag column
+    :return: (value bits, known bits)
+    """
+    values = 0
+    known = 0
+    for col, bit in FLAG_BITS.items():
+        answer = record[col]
+        if answer == NA:
+            continue
+        answer = answer.lower() if isinstance(answer, str) else answer
+        if answer == 't':
+            values |= bit
+        elif answer != 'f':
+            raise ValueError(f"flag {col} must be t, f, or {NA}, not {answer!r}")
+        known |= bit
+    return values, known
+
+
+def unpack(values: int, known: int) -> dict:
+    """
+    Unpacks the flags of one household
+    :param values: value bits
+    :param known: known bits
+    :return: dict of flag column name to 't', 'f' or 'n/a'
+    """
+    return {col: ('t' if values & bit else 'f') if known & bit else NA for col, bit in FLAG_BITS.items()}
+
+
+# ------------------
+# Whole columns
+# ------------------
+
+def pack_frame(df):
+    """
+    Packs the flags of every row of a dataframe at once
+    :param df: dataframe of household data
+    :return: (value bits, known bits) as numpy uint16 arrays
+    """
+    import numpy as np
+
+    values = np.zeros(len(df), dtype=np.uint16)
+    known = np.zeros(len(df), dtype=np.uint16)
+    for col, bit in FLAG_BITS.items():
+        is_true = df[col].isin(['t', 'T']).to_numpy()
+        is_false = df[col].isin(['f', 'F']).to_numpy()
+        if not (is_true | is_false | df[col].eq(NA).to_numpy()).all():
+            raise ValueError(f"flag {col} must only hold t, f, or {NA}")
+        values[is_true] |= bit
+        known[is_true | is_false] |= bit
+    return values, known
+
+
+def unpack_frame(values, known) -> dict:
+    """
+    Unpacks the flags of many households at once
+    :param values: array of value bits
+    :param known: array of known bits
+    :return: dict of flag column name to numpy array of 't', 'f' or 'n/a'
+    """
+    import numpy as np
+
+    values = np.asarray(values)
+    known = np.asarray(known)
+    columns = {}
+    for col, bit in FLAG_BITS.items():
+        answers = np.full(len(values), NA, dtype=object)
+        answered = (known & bit) != 0
+        answers[answered] = 'f'
+        answers[answered & ((values & bit) != 0)] = 't'
+        columns[col] = answers
+    return columns
+
+
+def packed_rows(df):
+    """
+    Packs every row of a dataframe of household data
+    :param df: dataframe of household data
+    :return: iterator of tuples with the values in PACKED_COLUMNS order
+    """
+    values, known = pack_frame(df)
+    return zip(*[df[col].tolist() for col in PLAIN_COLUMNS], values.tolist(), known.tolist())
+
+
+def all_set(values, names) -> object:
+    """
+    Checks which households have every named flag set to 't'
+    :param values: numpy array of value bits
+    :param names: flag column names
+    :return: numpy array of true/false
+    """
+    bits = mask(*names)
+    return (values & bits) == bits
+
+
+def any_set(values, names) -> object:
+    """
+    Checks which households have at least one of the named flags set to 't'
+    :param values: numpy array of value bits
+    :param names: flag column names
+    :return: numpy array of true/false
+    """
+    return (values & mask(*names)) != 0
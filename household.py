@@ -5,15 +5,27 @@ SER416 Final Project
 household.py
 This class maintains all the data of a single household
 """
-
-import pandas as pd
+from __future__ import annotations
+from typing import TYPE_CHECKING
 import cli_utils as cli
 import sys
-import numpy as np
 from cli_utils import NA
 
+if TYPE_CHECKING:  # for type hints only. Importing pandas takes longer than the rest of startup
+    import pandas as pd
+
 
 #NA = "n/a"
+
+# column headers used for household data in dataframes, csv files, and the database
+COLUMNS = [
+    "address", "adults", "children", "pets", "dogs", "crit_meds", "ref_meds",
+    "special_needs", "gas_tank", "gas_line", "adrs_number", "adrs_street",
+    "adrs_city", "adrs_state", "adrs_zip", "med_training", "email", "phone",
+    "know_nbr", "key_nbr", "news_ltr", "contact"
+]
+
+
 # ------------------
 # Static functions
 # ------------------
@@ -22,13 +34,9 @@ def empty_dataframe() -> pd.DataFrame:
     Makes a dataframe with just the correct column headers to hold household object data
     :return: empty dataframe
     """
-    columns = [
-        "address", "adults", "children", "pets", "dogs", "crit_meds", "ref_meds",
-        "special_needs", "gas_tank", "gas_line", "adrs_number", "adrs_street",
-        "adrs_city", "adrs_state", "adrs_zip", "med_training", "email", "phone",
-        "know_nbr", "key_nbr", "news_ltr", "contact"
-    ]
-    return pd.DataFrame(columns=columns)
+    import pandas as pd
+
+    return pd.DataFrame(columns=COLUMNS)
 
 def is_valid_optional_string(x, length=None):
     """
@@ -107,6 +115,160 @@ def is_valid_bool(x):
             return True
     return False
 
+# columns the address string is built from, in order
+ADDRESS_COLUMNS = ["adrs_number", "adrs_street", "adrs_city", "adrs_state", "adrs_zip"]
+
+# validation rule for each column as (check function, keyword arguments). Household.validate_data checks a
+# household with these and validate_dataframe checks whole columns with them, in this order
+FIELD_RULES = {
+    "adults": (is_valid_numeric, {}),
+    "children": (is_valid_numeric, {}),
+    "pets": (is_valid_bool, {}),
+    "dogs": (is_valid_bool, {}),
+    "crit_meds": (is_valid_bool, {}),
+    "ref_meds": (is_valid_bool, {}),
+    "special_needs": (is_valid_bool, {}),
+    "gas_tank": (is_valid_bool, {}),
+    "gas_line": (is_valid_bool, {}),
+    "adrs_number": (is_valid_string, {}),
+    "adrs_street": (is_valid_string, {}),
+    "adrs_city": (is_valid_string, {}),
+    "adrs_state": (is_valid_string, {"length": 2}),
+    "adrs_zip": (is_valid_string, {"length": 5}),
+    "med_training": (is_valid_optional_bool, {}),
+    "email": (is_valid_optional_string, {}),
+    "phone": (is_valid_optional_numeric, {"length": 10}),
+    "know_nbr": (is_valid_optional_bool, {}),
+    "key_nbr": (is_valid_optional_bool, {}),
+    "news_ltr": (is_valid_optional_bool, {}),
+    "contact": (is_valid_optional_bool, {}),
+}
+
+# ------------------
+# Whole dataframe validation
+# ------------------
+# These apply the same rules as the is_valid_* functions above to entire columns at once
+
+def _as_strings(column: pd.Series) -> pd.Series:
+    """
+    Makes sure the .str methods can be used on a column. A column with no strings at all has every value
+    replaced with None so that all of the checks fail, the same as they would for non-string values
+    :param column: column to check
+    :return: column that supports the .str methods
+    """
+    import pandas as pd
+
+    try:
+        column.str  # raises if there are no strings in the column
+    except AttributeError:
+        return pd.Series(None, index=column.index, dtype=object)
+    return column
+
+
+def _is_string(column: pd.Series, length=None) -> pd.Series:
+    """
+    :return: series of true where the value is a string of the required length
+    """
+    lengths = column.str.len()
+    return lengths.notna() if length is None else lengths.eq(length)
+
+
+def _valid_optional_string(column: pd.Series, length=None) -> pd.Series:
+    return _is_string(column, length)
+
+
+def _valid_optional_numeric(column: pd.Series, length=None) -> pd.Series:
+    return column.eq(NA) | _valid_numeric(column, length)
+
+
+def _valid_optional_bool(column: pd.Series) -> pd.Series:
+    return column.isin(['t', 'f', 'T', 'F', NA])
+
+
+def _valid_string(column: pd.Series, length=None) -> pd.Series:
+    return column.ne(NA) & _is_string(column, length)
+
+
+def _valid_numeric(column: pd.Series, length=None) -> pd.Series:
+    return column.str.isdigit().eq(True) & _is_string(column, length)
+
+
+def _valid_bool(column: pd.Series) -> pd.Series:
+    return column.isin(['t', 'f', 'T', 'F'])
+
+
+# the whole column version of each is_valid_* function
+_COLUMN_CHECKS = {
+    is_valid_optional_string: _valid_optional_string,
+    is_valid_optional_numeric: _valid_optional_numeric,
+    is_valid_optional_bool: _valid_optional_bool,
+    is_valid_string: _valid_string,
+    is_valid_numeric: _valid_numeric,
+    is_valid_bool: _valid_bool,
+}
+
+
+def build_address(df: pd.DataFrame) -> pd.Series:
+    """
+    Builds the address string of every row the same way Household.validate_data does
+    :param df: dataframe of household data
+    :return: series of address strings
+    """
+    import pandas as pd
+
+    # joining plain python strings is a lot faster than adding pandas string columns together.
+    # Any non-string values end up converted, but those rows fail validation anyway
+    columns = [df[col].tolist() for col in ADDRESS_COLUMNS]
+    addresses = [f"{number} {street},{city},{state} {zip_code}"
+                 for number, street, city, state, zip_code in zip(*columns)]
+    return pd.Series(addresses, index=df.index, dtype=object)
+
+
+def validate_dataframe(df: pd.DataFrame, check_address=True) -> tuple[pd.DataFrame, dict]:
+    """
+    Checks every row of a dataframe with the same rules Household.validate_data uses, but a column at a
+    time instead of a row at a time. Unlike validate_data it does not stop at the first error
+    :param df: dataframe of household data
+    :param check_address: also require the address column to match the one built from the address fields
+    :return: (error mask, summary). The mask has a column for each checked field that is true where the
+        value is invalid. The summary is a dict with the number of 'rows', 'invalid_rows', and
+        'errors' (dict of column name to number of invalid values)
+    """
+    import pandas as pd
+
+    errors = pd.DataFrame(index=df.index)
+    for col, (check, kwargs) in FIELD_RULES.items():
+        if col not in df.columns:  # a missing column is invalid for every row
+            errors[col] = True
+            continue
+        errors[col] = ~_COLUMN_CHECKS[check](_as_strings(df[col]), **kwargs)
+    if check_address:
+        if all(col in df.columns for col in ['address'] + ADDRESS_COLUMNS):
+            errors['address'] = ~build_address(df).eq(df['address']).eq(True)
+        else:
+            errors['address'] = True
+
+    invalid_rows = errors.any(axis=1)
+    summary = {
+        'rows': len(df),
+        'invalid_rows': int(invalid_rows.sum()),
+        'errors': {col: int(count) for col, count in errors.sum().items() if count > 0},
+    }
+    return errors, summary
+
+
+def split_valid(df: pd.DataFrame, check_address=True) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Separates the valid rows of a dataframe from the invalid ones
+    :param df: dataframe of household data
+    :param check_address: also require the address column to match the one built from the address fields
+    :return: (valid rows, invalid rows)
+    """
+    errors, summary = validate_dataframe(df, check_address)
+    invalid = errors.any(axis=1)
+    return df[~invalid], df[invalid]
+
+
 # ------------------
 # Household class
 # ------------------
@@ -169,71 +331,13 @@ class Household:
         Checks the types of all data to make sure required data is input and optional data is no wrong type
         :return:
         """
-        # Required data must be the correct type
-        if not is_valid_numeric(self.adults):
-            print(f"Validation Error: adults {self.adults}", file=sys.stderr)
-            return False
-        if not is_valid_numeric(self.children):
-            print(f"Validation Error: children {self.children}", file=sys.stderr)
-            return False
-        if not is_valid_bool(self.pets):
-            print(f"Validation Error: pets {self.pets}", file=sys.stderr)
-            return False
-        if not is_valid_bool(self.dogs):
-            print(f"Validation Error: dogs {self.dogs}", file=sys.stderr)
-            return False
-        if not is_valid_bool(self.crit_meds):
-            print(f"Validation Error: crit_meds {self.crit_meds}", file=sys.stderr)
-            return False
-        if not is_valid_bool(self.ref_meds):
-            print(f"Validation Error: ref_meds {self.ref_meds}", file=sys.stderr)
-            return False
-        if not is_valid_bool(self.special_needs):
-            print(f"Validation Error: special_needs {self.special_needs}", file=sys.stderr)
-            return False
-        if not is_valid_bool(self.gas_tank):
-            print(f"Validation Error: gas_tank {self.gas_tank}", file=sys.stderr)
-            return False
-        if not is_valid_bool(self.gas_line):
-            print(f"Validation Error: gas_line {self.gas_line}", file=sys.stderr)
-            return False
-        if not is_valid_string(self.adrs_number):
-            print(f"Validation Error: adrs_number {self.adrs_number}", file=sys.stderr)
-            return False
-        if not is_valid_string(self.adrs_street):
-            print(f"Validation Error: adrs_street {self.adrs_street}", file=sys.stderr)
-            return False
-        if not is_valid_string(self.adrs_city):
-            print(f"Validation Error: adrs_city {self.adrs_city}", file=sys.stderr)
-            return False
-        if not is_valid_string(self.adrs_state, length=2):
-            print(f"Validation Error: adrs_state {self.adrs_state} type", file=sys.stderr)
-            return False
-        if not is_valid_string(self.adrs_zip, length=5):
-            print(f"Validation Error: adrs_zip {self.adrs_zip} type", file=sys.stderr)
-            return False
-        # optional data can also be NA
-        if not is_valid_optional_bool(self.med_training):
-            print(f"Validation Error: med_training {self.med_training}", file=sys.stderr)
-            return False
-        if not is_valid_optional_string(self.email):
-            print(f"Validation Error: email {self.email}", file=sys.stderr)
-            return False
-        if not is_valid_optional_numeric(self.phone, length=10):
-            print(f"Validation Error: phone {self.phone}", file=sys.stderr)
-            return False
-        if not is_valid_optional_bool(self.know_nbr):
-            print(f"Validation Error: know_nbr {self.know_nbr}", file=sys.stderr)
-            return False
-        if not is_valid_optional_bool(self.key_nbr):
-            print(f"Validation Error: key_nbr {self.key_nbr}", file=sys.stderr)
-            return False
-        if not is_valid_optional_bool(self.news_ltr):
-            print(f"Validation Error: news_ltr {self.news_ltr}", file=sys.stderr)
-            return False
-        if not is_valid_optional_bool(self.contact):
-            print(f"Validation Error: contact {self.contact}", file=sys.stderr)
-            return False
+        # required data must be the correct type, optional data can also be NA. The rules are the ones
+        # validate_dataframe checks whole columns with, so a household and an imported row always agree
+        for col, (check, kwargs) in FIELD_RULES.items():
+            value = getattr(self, col)
+            if not check(value, **kwargs):
+                print(f"Validation Error: {col} {value}", file=sys.stderr)
+                return False
 
         # If all checks pass update the address string and return true
         self.adrs = f"{self.adrs_number} {self.adrs_street},{self.adrs_city},{self.adrs_state} {self.adrs_zip}"
@@ -245,7 +349,7 @@ class Household:
     def load_data(self, series: pd.Series) -> bool:
         """
         Populates data from a single row from a dataframe. Returns false if data is invalid or multi-line
-        :param series: series of data from a pandas dataframe
+        :param series: series of data from a pandas dataframe, or a dict with the same keys
         :return: true if valid, false if invalid
         """
 
@@ -255,7 +359,7 @@ class Household:
             'gas_tank', 'gas_line', 'adrs_number', 'adrs_street', 'adrs_city', 'adrs_state',
             'adrs_zip', 'med_training', 'email', 'phone', 'know_nbr', 'key_nbr', 'news_ltr', 'contact'
         ]
-        if not all(col in series.index for col in required_columns):
+        if not all(col in series for col in required_columns):
             print("Error: load_data given series without all required data", file=sys.stderr)
             return False
 
@@ -390,15 +494,15 @@ class Household:
             "to active emergencies and natural disasters?",
             header=opt, input_format="y/n", row_limit=scr_w, required=False)
 
-    def to_dataframe(self) -> pd.DataFrame:
+    def to_record(self) -> dict:
         """
-        Creates a panda's dataframe row of this object if it is valid. Otherwise, it returns none.
-        :return: dataframe row
+        Creates a dict of column name to value for this object if it is valid. Otherwise, it returns none.
+        :return: dict with the same keys as the dataframe columns
         """
         if not self.validate_data():
             print("Error: Household object not valid")
             return None
-        dict = {
+        return {
             "address": self.adrs,
             "adults": self.adults,
             "children": self.children,
@@ -422,7 +526,18 @@ class Household:
             "news_ltr": self.news_ltr,
             "contact": self.contact,
         }
-        df = pd.DataFrame([dict])
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Creates a panda's dataframe row of this object if it is valid. Otherwise, it returns none.
+        :return: dataframe row
+        """
+        import pandas as pd
+
+        record = self.to_record()
+        if record is None:
+            return None
+        df = pd.DataFrame([record])
         return df
 
 
@@ -434,6 +549,8 @@ def main():
     """
     This function is just used for dev demoing
     """
+    import pandas as pd
+
 
     print("Running in dev mode")
 
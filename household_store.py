@@ -0,0 +1,692 @@
+"""
+household_store.py
+Author: Russell Johnson
+Date 1 Dec 2025
+SER416 Final Project
+Holds the households loaded in the program and keeps track of which ones changed since the last save
+so that only those rows need to be written back to the database
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+import cli_utils as cli
+import household as hh
+import flags
+from dedupe import DuplicateIndex
+import rollups
+from rollups import Rollups
+from household import Household
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ------------------
+# Constants
+# ------------------
+
+# states a household can be in since the last save
+ADDED = "added"
+EDITED = "edited"
+REMOVED = "removed"
+
+# smallest number of slots allocated for the column buffers
+MIN_CAPACITY = 16
+
+# array type code for the packed flag buffers. 16 bits holds every flag in flags.FLAG_COLUMNS
+FLAG_TYPECODE = 'H'
+
+
+def _flag_buffer(count: int) -> array:
+    """
+    :param count: number of slots
+    :return: packed flag buffer filled with zeros
+    """
+    return array(FLAG_TYPECODE, bytes(array(FLAG_TYPECODE).itemsize * count))
+
+
+# ------------------
+# HouseholdStore class
+# ------------------
+
+class HouseholdStore:
+    """
+    Stores households column by column. Each column is a list with spare slots at the end so adding a
+    household only writes one value per column, and the lists double in size when they run out of room.
+    The flags are not stored as strings, they are packed into two integer arrays (see flags.py).
+    Removed households leave an empty slot behind that is cleaned out once more than half the used
+    slots are empty.
+    The saved data can also be read lazily. Single households are fetched when they are asked for, and the
+    rest are only read in when something needs every household
+    """
+
+    def __init__(self, df: pd.DataFrame = None, load_saved=None, fetch_saved=None, fetch_block=None,
+                 list_saved=None) -> None:
+        """
+        Initialize the store. Data given here is treated as already saved
+        :param df: optional dataframe of household data to start with
+        :param load_saved: optional function that returns a dataframe of every saved household. If given,
+            it is not called until every household is needed
+        :param fetch_saved: optional function that takes an address and returns a dict of that saved
+            household, or None if there is no saved household with that address
+        :param fetch_block: optional function that takes a zip code and house number and returns a list of
+            dicts of the saved households with both. Used to look for possible duplicates without reading
+            in every saved household
+        :param list_saved: optional function that returns a list of the addresses of every saved household.
+            Used to build the search index without reading in every saved household
+        """
+        self.changes = {}  # address -> ADDED, EDITED or REMOVED
+        self.replace_all = False  # true if the whole table has to be rewritten on the next save
+        self.unsaved_totals = Rollups()  # how the zip code and city totals changed since the last save
+        # changes handed off to be saved in the background (see take_changes) stay in self.changes until
+        # they are confirmed, so everything that reads the store still sees them in the meantime
+        self._unsent = set()  # addresses changed since the last hand off
+        self._replace_unsent = False  # true if the data was overwritten since the last hand off
+        self._sent = {}  # batch number -> (addresses, Rollups of the batch) for batches not confirmed yet
+        self._latest = {}  # address -> number of the last batch it was handed off in
+        self._replace_batch = None  # number of the batch that overwrites the saved data, until confirmed
+        self._load_saved = load_saved
+        self._fetch_saved = fetch_saved
+        self._fetch_block = fetch_block
+        self._list_saved = list_saved
+        self._sorted = None  # cached sorted list of addresses, used for paging
+        self._search = None  # cli.PrefixIndex of the addresses, built the first time it is needed
+        self._duplicates = None  # DuplicateIndex of the addresses, built the first time it is needed
+        self._load(df)
+
+    def _load(self, df: pd.DataFrame = None) -> None:
+        """
+        Replaces the stored data and rebuilds the address index
+        :param df: dataframe of household data. Empties the store if not given, without needing pandas
+        """
+        if df is not None:
+            # addresses are unique, so only the first copy of a repeated address is kept
+            df = df.drop_duplicates(subset='address')
+        self._size = 0 if df is None else len(df)  # number of slots used, including removed ones
+        self._capacity = max(self._size, MIN_CAPACITY)
+        spare = self._capacity - self._size
+        if df is None:
+            self._columns = {col: [None] * spare for col in flags.PLAIN_COLUMNS}
+            self._flag_values = _flag_buffer(spare)
+            self._flag_known = _flag_buffer(spare)
+        else:
+            self._columns = {col: df[col].tolist() + [None] * spare for col in flags.PLAIN_COLUMNS}
+            values, known = flags.pack_frame(df)
+            self._flag_values = array(FLAG_TYPECODE, values.tobytes()) + _flag_buffer(spare)
+            self._flag_known = array(FLAG_TYPECODE, known.tobytes()) + _flag_buffer(spare)
+        self._live = bytearray([1]) * self._size + bytearray(spare)  # 1 for slots holding a household
+        self._removed = 0  # number of used slots that were emptied by a remove
+        # address -> slot the household is stored in
+        self._index = {address: slot for slot, address in enumerate(self._columns['address'][:self._size])}
+        self._sorted = None
+        self._search = None
+        self._duplicates = None
+
+    @property
+    def is_loaded(self) -> bool:
+        """
+        :return: true if every saved household has been read in
+        """
+        return self._load_saved is None
+
+    def _ensure_loaded(self) -> None:
+        """
+        Reads in every saved household that is not already stored and was not removed. Households added
+        or edited since the last save are kept as they are
+        """
+        import pandas as pd
+
+        if self._load_saved is None:
+            return
+        load_saved = self._load_saved
+        self._load_saved = None
+        saved = load_saved()
+        skip = set(self._index).union(self.removed_addresses())
+        saved = saved[~saved['address'].isin(skip)]
+        current = self.to_dataframe()
+        self._load(pd.concat([saved, current], ignore_index=True) if len(current) > 0 else saved)
+
+    def _reserve(self, count: int) -> None:
+        """
+        Makes sure there are at least count free slots at the end of the buffers
+        :param count: number of slots needed
+        """
+        needed = self._size + count
+        if needed <= self._capacity:
+            return
+        new_capacity = max(needed, self._capacity * 2)
+        spare = new_capacity - self._capacity
+        for values in self._columns.values():
+            values.extend([None] * spare)
+        self._flag_values.extend(_flag_buffer(spare))
+        self._flag_known.extend(_flag_buffer(spare))
+        self._live.extend(bytearray(spare))
+        self._capacity = new_capacity
+
+    def _append(self, record: dict) -> None:
+        """
+        Writes a household into the next free slot. Does not check for duplicates
+        :param record: dict of column name to value
+        """
+        self._reserve(1)
+        slot = self._size
+        for col, values in self._columns.items():
+            values[slot] = record[col]
+        self._flag_values[slot], self._flag_known[slot] = flags.pack(record)
+        self._live[slot] = 1
+        self._index[record['address']] = slot
+        self._size += 1
+        self._sorted = None
+        if self._search is not None:
+            self._search.add(record['address'])
+        if self._duplicates is not None:
+            self._duplicates.add(record['address'], record['adrs_number'], record['adrs_street'],
+                                 record['adrs_zip'])
+
+    def compact(self) -> None:
+        """
+        Moves the stored households together to get rid of the slots left behind by removes
+        """
+        if self._removed == 0:
+            return
+        keep = [slot for slot in range(self._size) if self._live[slot]]
+        self._size = len(keep)
+        spare = self._capacity - self._size
+        for col, values in self._columns.items():
+            self._columns[col] = [values[slot] for slot in keep] + [None] * spare
+        self._flag_values = array(FLAG_TYPECODE, [self._flag_values[slot] for slot in keep]) + _flag_buffer(spare)
+        self._flag_known = array(FLAG_TYPECODE, [self._flag_known[slot] for slot in keep]) + _flag_buffer(spare)
+        self._live = bytearray([1]) * self._size + bytearray(spare)
+        self._removed = 0
+        self._index = {address: slot for slot, address in enumerate(self._columns['address'][:self._size])}
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._index)
+
+    def __contains__(self, address: str) -> bool:
+        """
+        Checks if a household is stored. If the saved data has not been read in yet, just that household
+        is fetched
+        :param address: address string to look for
+        :return: true if it is stored
+        """
+        if address in self._index:
+            return True
+        if self.is_loaded or self._fetch_saved is None or self.changes.get(address) == REMOVED:
+            return False
+        record = self._fetch_saved(address)
+        if record is None:
+            return False
+        self._append(record)  # keep it so the next lookup is just a dict lookup
+        return True
+
+    def __iter__(self):
+        """
+        Goes through the stored households in the order they were added
+        :return: generator of dicts of column name to value
+        """
+        for row in self.rows():
+            yield dict(zip(hh.COLUMNS, row))
+
+    def rows(self):
+        """
+        Goes through the stored households in the order they were added
+        :return: generator of tuples with the values in hh.COLUMNS order
+        """
+        self._ensure_loaded()
+        for slot in range(self._size):
+            if self._live[slot]:
+                record = self._record(slot)
+                yield tuple(record[col] for col in hh.COLUMNS)
+
+    def packed_rows(self):
+        """
+        Goes through the stored households in the order they were added, without unpacking the flags
+        :return: generator of tuples with the values in flags.PACKED_COLUMNS order
+        """
+        self._ensure_loaded()
+        for slot in range(self._size):
+            if self._live[slot]:
+                yield self._packed_row(slot)
+
+    def _record(self, slot: int) -> dict:
+        """
+        :param slot: slot holding a household
+        :return: dict of column name to value
+        """
+        record = {col: values[slot] for col, values in self._columns.items()}
+        record.update(flags.unpack(self._flag_values[slot], self._flag_known[slot]))
+        return record
+
+    def _packed_row(self, slot: int) -> tuple:
+        """
+        :param slot: slot holding a household
+        :return: tuple with the values in flags.PACKED_COLUMNS order
+        """
+        return (tuple(self._columns[col][slot] for col in flags.PLAIN_COLUMNS) +
+                (self._flag_values[slot], self._flag_known[slot]))
+
+    def _track_add(self, address: str) -> None:
+        """
+        Records that a household was added
+        :param address: address string of the household
+        """
+        if self.changes.get(address) == REMOVED:  # removed then added again is an edit of the saved row
+            self.changes[address] = EDITED
+        elif address not in self.changes:
+            self.changes[address] = ADDED
+        self._unsent.add(address)
+
+    def _track_remove(self, address: str) -> None:
+        """
+        Records that a household was removed
+        :param address: address string of the household
+        """
+        if self.changes.get(address) == ADDED:  # never saved, so the database never has to hear about it
+            del self.changes[address]
+        else:
+            self.changes[address] = REMOVED
+        self._unsent.add(address)
+
+    def add(self, household: Household) -> bool:
+        """
+        Adds a household if there is no household with the same address already stored
+        :param household: the Household object to add
+        :return: true if added
+        """
+        record = household.to_record()
+        if record is None:
+            print("Error: HouseholdStore.add given an invalid Household object", file=sys.stderr)
+            return False
+        if record['address'] in self:
+            print("Error: HouseholdStore.add given duplicate address", file=sys.stderr)
+            return False
+        self._append(record)
+        self._track_add(record['address'])
+        self.unsaved_totals.add_record(record)
+        return True
+
+    def get(self, address: str) -> Household:
+        """
+        Finds the household with a matching address
+        :param address: "[street number] [street name],[city],[2 letter state] [5 number zip]"
+        :return: if match found: household object, if no match: None
+        """
+        if address not in self:
+            print("Error: HouseholdStore.get given address not in store", file=sys.stderr)
+            return None
+        household = Household()
+        household.load_data(self._record(self._index[address]))
+        return household
+
+    def remove(self, address: str) -> bool:
+        """
+        Removes the household with a matching address
+        :param address: "[street number] [street name],[city],[2 letter state] [5 number zip]"
+        :return: if match found: true, if no match: false
+        """
+        if address not in self:
+            print("Error: HouseholdStore.remove given address not in store", file=sys.stderr)
+            return False
+        slot = self._index.pop(address)
+        self._sorted = None
+        self.unsaved_totals.add(self._columns['adrs_zip'][slot], self._columns['adrs_city'][slot],
+                                self._columns['adults'][slot], self._columns['children'][slot],
+                                self._flag_values[slot], sign=-1)
+        if self._search is not None:
+            self._search.discard(address)
+        if self._duplicates is not None:
+            self._duplicates.discard(address, self._columns['adrs_number'][slot], self._columns['adrs_zip'][slot])
+        self._live[slot] = 0
+        for values in self._columns.values():
+            values[slot] = None  # let go of the old values
+        self._flag_values[slot] = 0
+        self._flag_known[slot] = 0
+        self._removed += 1
+        self._track_remove(address)
+        # once most of the used slots are empty, squeezing them out is cheaper than skipping them
+        if self._removed > MIN_CAPACITY and self._removed * 2 > self._size:
+            self.compact()
+        return True
+
+    def merge(self, df_new: pd.DataFrame) -> int:
+        """
+        Adds every row of a dataframe whose address is not already stored. Does not validate data
+        :param df_new: dataframe to be merged
+        :return: number of households added
+        """
+        self._ensure_loaded()
+        is_new = ~df_new['address'].map(self._index.__contains__).astype(bool)
+        new_rows = df_new.loc[is_new, hh.COLUMNS].drop_duplicates(subset='address')
+        count = len(new_rows)
+        values, known = flags.pack_frame(new_rows)
+        self._reserve(count)
+        start = self._size
+        for col, buffer in self._columns.items():
+            buffer[start:start + count] = new_rows[col].tolist()
+        self._flag_values[start:start + count] = array(FLAG_TYPECODE, values.tobytes())
+        self._flag_known[start:start + count] = array(FLAG_TYPECODE, known.tobytes())
+        self._live[start:start + count] = bytearray([1]) * count
+        for slot, address in enumerate(new_rows['address'], start):
+            self._index[address] = slot
+            self._track_add(address)
+        self._size += count
+        self._sorted = None
+        self.unsaved_totals.add_frame(new_rows)
+        if self._duplicates is not None:
+            self._duplicates.add_frame(new_rows)
+        if self._search is not None:
+            if count > cli.PENDING_LIMIT:  # cheaper to build the search index again when it is next needed
+                self._search = None
+            else:
+                for address in new_rows['address']:
+                    self._search.add(address)
+        return count
+
+    def overwrite(self, df_new: pd.DataFrame) -> None:
+        """
+        Replaces all stored households with the rows of a dataframe
+        :param df_new: dataframe to replace the current data with
+        """
+        self._load_saved = None  # the saved data is being replaced, so it never needs to be read in
+        self._load(df_new)
+        self.changes = {}
+        self.replace_all = True
+        self.unsaved_totals = Rollups()  # nothing saved is kept, so the totals start from zero
+        self.unsaved_totals.add_frame(df_new.drop_duplicates(subset='address'))
+        # batches already handed off are replaced along with everything else
+        self._unsent = set()
+        self._replace_unsent = True
+        self._sent = {number: (addresses, Rollups()) for number, (addresses, _) in self._sent.items()}
+        self._latest = {}
+
+    def search_index(self) -> cli.PrefixIndex:
+        """
+        Gets an index for searching the stored addresses by the start of their words. It is built the first
+        time it is asked for and kept up to date after that. If the saved households have not been read in,
+        it is built from the saved addresses and the changes since the last save instead
+        :return: PrefixIndex of every stored address
+        """
+        if self._search is None:
+            if self.is_loaded or self._list_saved is None:
+                self._ensure_loaded()
+                self._search = cli.PrefixIndex(self._index)
+            else:
+                removed = set(self.removed_addresses())
+                addresses = [address for address in self._list_saved() if address not in removed]
+                addresses += [address for address, change in self.changes.items() if change != REMOVED]
+                self._search = cli.PrefixIndex(addresses)
+        return self._search
+
+    def duplicate_index(self) -> DuplicateIndex:
+        """
+        Gets an index for finding households that are probably the same place as an address. It is built
+        the first time it is asked for and kept up to date after that
+        :return: DuplicateIndex of every stored household
+        """
+        import pandas as pd
+
+        self._ensure_loaded()
+        if self._duplicates is None:
+            self.compact()
+            self._duplicates = DuplicateIndex()
+            self._duplicates.add_frame(pd.DataFrame({col: self._columns[col][:self._size]
+                                                     for col in ("address", "adrs_number", "adrs_street",
+                                                                 "adrs_zip")}))
+        return self._duplicates
+
+    def possible_duplicates(self, record: dict) -> list[tuple]:
+        """
+        Finds stored households that are probably the same place as a household. If the saved data has
+        not been read in yet, only the saved households with the same zip code and house number are fetched
+        :param record: dict of household column name to value
+        :return: list of (stored address, similarity, reason), most alike first
+        """
+        if self.is_loaded or self._fetch_block is None:
+            return self.duplicate_index().matches(record['address'], record['adrs_number'],
+                                                  record['adrs_street'], record['adrs_zip'])
+        for saved in self._fetch_block(record['adrs_zip'], record['adrs_number']):
+            if saved['address'] not in self._index and self.changes.get(saved['address']) != REMOVED:
+                self._append(saved)  # keep it, like a household fetched by address
+        # without the saved data, the store only holds the households fetched or changed this session
+        block = DuplicateIndex()
+        numbers = self._columns['adrs_number']
+        zips = self._columns['adrs_zip']
+        for slot in range(self._size):
+            if self._live[slot] and zips[slot] == record['adrs_zip']:
+                block.add(self._columns['address'][slot], numbers[slot], self._columns['adrs_street'][slot],
+                          zips[slot])
+        return block.matches(record['address'], record['adrs_number'], record['adrs_street'], record['adrs_zip'])
+
+    def addresses(self) -> list[str]:
+        """
+        :return: list of the address strings of every stored household
+        """
+        self._ensure_loaded()
+        return list(self._index)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Builds a dataframe of every stored household. This copies the data, so it is only done on demand
+        :return: dataframe of every stored household
+        """
+        import pandas as pd
+
+        self._ensure_loaded()
+        self.compact()
+        data = {col: values[:self._size] for col, values in self._columns.items()}
+        data.update(flags.unpack_frame(self._flag_values[:self._size], self._flag_known[:self._size]))
+        return pd.DataFrame(data, columns=hh.COLUMNS)
+
+    def flag_arrays(self) -> tuple:
+        """
+        Copies the packed flags of every stored household into numpy arrays for bitwise checks
+        :return: (addresses, value bits, known bits). Addresses is a list in the same order as the arrays
+        """
+        import numpy as np
+
+        self._ensure_loaded()
+        self.compact()
+        values = np.array(self._flag_values[:self._size], dtype=np.uint16)
+        known = np.array(self._flag_known[:self._size], dtype=np.uint16)
+        return self._columns['address'][:self._size], values, known
+
+    def column_values(self, col: str) -> list:
+        """
+        Copies one column of every stored household, in the same order as flag_arrays
+        :param col: household column that is not a flag
+        :return: list of values
+        """
+        self._ensure_loaded()
+        self.compact()
+        return self._columns[col][:self._size]
+
+    def frame(self, addresses) -> pd.DataFrame:
+        """
+        :param addresses: addresses of stored households
+        :return: dataframe of those households, in the same order
+        """
+        import pandas as pd
+
+        if not all(address in self._index for address in addresses):
+            self._ensure_loaded()  # some are only saved, not read in yet
+        return pd.DataFrame([self._record(self._index[address]) for address in addresses], columns=hh.COLUMNS)
+
+    def find(self, all_of=(), any_of=()) -> list[str]:
+        """
+        Finds the households whose flags are 't' for all of one list of flags and any of another
+        :param all_of: flag column names that must all be 't'
+        :param any_of: flag column names where at least one must be 't'
+        :return: list of matching addresses
+        """
+        addresses, values, known = self.flag_arrays()
+        matches = flags.all_set(values, all_of)
+        if any_of:
+            matches &= flags.any_set(values, any_of)
+        return [addresses[slot] for slot in matches.nonzero()[0]]
+
+    def _page_of(self, ordered: list[str], limit: int, after: str = None, before: str = None, start: str = None,
+                 zip_code: str = None) -> pd.DataFrame:
+        """
+        Gets one page of households out of a sorted list of stored addresses
+        :param ordered: sorted list of addresses, all of them in the store
+        :param limit: max number of households on the page
+        :param after: give the page that comes after this address
+        :param before: give the page that comes before this address
+        :param start: give the page that starts at this address, or the first one after it
+        :param zip_code: only include households in this zip code
+        :return: dataframe of the households on the page
+        """
+        import pandas as pd
+
+        if before is not None:  # walk backwards from just before the given address
+            positions = range(bisect_left(ordered, before) - 1, -1, -1)
+        elif after is not None:
+            positions = range(bisect_right(ordered, after), len(ordered))
+        else:
+            positions = range(bisect_left(ordered, start) if start else 0, len(ordered))
+
+        zips = self._columns['adrs_zip']
+        slots = []
+        for position in positions:
+            slot = self._index[ordered[position]]
+            if zip_code is None or zips[slot] == zip_code:
+                slots.append(slot)
+                if len(slots) == limit:
+                    break
+        if before is not None:
+            slots.reverse()
+        return pd.DataFrame([self._record(slot) for slot in slots], columns=hh.COLUMNS)
+
+    def page(self, limit: int, after: str = None, before: str = None, start: str = None,
+             zip_code: str = None) -> pd.DataFrame:
+        """
+        Gets one page of households in address order. Pages are found by the address they come after or
+        before, so the caller only has to remember the first and last address of the current page
+        :param limit: max number of households on the page
+        :param after: give the page that comes after this address
+        :param before: give the page that comes before this address
+        :param start: give the page that starts at this address, or the first one after it
+        :param zip_code: only include households in this zip code
+        :return: dataframe of the households on the page
+        """
+        self._ensure_loaded()
+        if self._sorted is None:
+            self._sorted = sorted(self._index)
+        return self._page_of(self._sorted, limit, after, before, start, zip_code)
+
+    def changed_page(self, limit: int, after: str = None, before: str = None, start: str = None,
+                     zip_code: str = None) -> pd.DataFrame:
+        """
+        Gets one page of the households added or edited since the last save, in address order, without
+        loading the saved ones. Laid over a page of saved households it gives the page as it is now
+        :param limit: max number of households on the page
+        :param after: give the page that comes after this address
+        :param before: give the page that comes before this address
+        :param start: give the page that starts at this address, or the first one after it
+        :param zip_code: only include households in this zip code
+        :return: dataframe of the changed households on the page
+        """
+        ordered = sorted(address for address, change in self.changes.items() if change != REMOVED)
+        return self._page_of(ordered, limit, after, before, start, zip_code)
+
+    def rollups(self, saved: pd.DataFrame) -> pd.DataFrame:
+        """
+        Gets the totals for each zip code and city pair, including changes that are not saved yet
+        :param saved: dataframe of the saved totals, such as from database.fetch_rollups. Ignored if the
+            saved data was overwritten
+        :return: dataframe with the rollups.KEY_COLUMNS and rollups.TOTAL_COLUMNS
+        """
+        if self.replace_all:
+            saved = saved.iloc[0:0]
+        unsaved = Rollups()
+        unsaved.add_rollups(self.unsaved_totals)
+        for _, totals in self._sent.values():
+            unsaved.add_rollups(totals)
+        return rollups.combine(saved, unsaved)
+
+    def has_changes(self) -> bool:
+        """
+        :return: true if there is anything that has not been saved
+        """
+        return self.replace_all or len(self.changes) > 0
+
+    def changed_rows(self, state: str) -> list[tuple]:
+        """
+        Gets the stored rows of households that are in a given change state
+        :param state: ADDED or EDITED
+        :return: list of tuples with the values in flags.PACKED_COLUMNS order
+        """
+        return [self._packed_row(self._index[address]) for address, change in self.changes.items()
+                if change == state]
+
+    def removed_addresses(self) -> list[str]:
+        """
+        :return: list of addresses removed since the last save
+        """
+        return [address for address, change in self.changes.items() if change == REMOVED]
+
+    def take_changes(self, number: int) -> dict:
+        """
+        Hands off everything that changed since the last hand off so it can be saved in the background.
+        The changes are still tracked until confirm is called, so lookups, pages and totals see them
+        until the database does
+        :param number: batch number to give the changes, higher than any batch handed off before
+        :return: dict with the batch number, replace_all, a list of removed addresses and a list of rows
+            to write as tuples in flags.PACKED_COLUMNS order. None if nothing changed
+        """
+        if not self._unsent and not self._replace_unsent:
+            return None
+        # an address added then removed before the hand off has no change left to save
+        changes = {address: self.changes[address] for address in self._unsent if address in self.changes}
+        batch = {'batch': number, 'replace_all': self._replace_unsent, 'removed': [], 'rows': []}
+        if self._replace_unsent:
+            batch['rows'] = list(self.packed_rows())
+            self._replace_batch = number
+        else:
+            for address, change in changes.items():
+                if change == REMOVED:
+                    batch['removed'].append(address)
+                else:
+                    batch['rows'].append(self._packed_row(self._index[address]))
+        for address, change in changes.items():
+            if change == ADDED:  # on its way to the database, so a remove now has to be saved too
+                self.changes[address] = EDITED
+            self._latest[address] = number
+        self._sent[number] = (list(changes), self.unsaved_totals)
+        self.unsaved_totals = Rollups()
+        self._unsent = set()
+        self._replace_unsent = False
+        return batch
+
+    def confirm(self, number: int) -> None:
+        """
+        Stops tracking the changes of a batch from take_changes once it is in the database. Households
+        that changed again since then are still tracked
+        :param number: batch number that was saved
+        """
+        addresses, _ = self._sent.pop(number, (None, None))
+        if addresses is None:
+            return
+        for address in addresses:
+            if self._latest.get(address) == number and address not in self._unsent:
+                del self._latest[address]
+                self.changes.pop(address, None)
+        if self._replace_batch == number:
+            self._replace_batch = None
+            self.replace_all = self._replace_unsent
+
+    def mark_saved(self) -> None:
+        """
+        Clears the change tracking after a successful save
+        """
+        self.changes = {}
+        self.replace_all = False
+        self.unsaved_totals = Rollups()
+        self._unsent = set()
+        self._replace_unsent = False
+        self._sent = {}
+        self._latest = {}
+        self._replace_batch = None
@@ -5,103 +5,165 @@ Date 22 Nov 2025
 SER416 Final Project
 This is the main file of the CERT household tracker project.
 """
+from __future__ import annotations
+from typing import TYPE_CHECKING
 import sqlite3
 import os
-import pandas as pd
 import cli_utils as cli
 from cli_utils import NA
 import household as hh
 from household import Household
+from household_store import HouseholdStore, REMOVED
+import database
+import csv_import
+import csv_export
+import columnar_io
+import autosave
+import pager
+import triage
+import rollups
+from dedupe import DuplicateIndex
+from repository import HouseholdRepository, matches_text
 import sys
 import csv
+from concurrent.futures import ThreadPoolExecutor
+
+if TYPE_CHECKING:  # pandas is only imported by the functions that use it, so startup does not wait on it
+    import pandas as pd
 
 # ------------------
 # Constants
 # ------------------
 
 SQLITE_FILENAME = "cert.db"
-TABLE_NAME = "households"
+JOURNAL_FILENAME = "cert_journal.jsonl"  # changes waiting to be written to the database by autosave
+# true to have autosave switch cert.db to write-ahead logging so reads never wait on a write. It stays switched
+# for good and keeps cert.db-wal and cert.db-shm files next to it, so it is off unless asked for
+AUTOSAVE_WAL = False
+QUARANTINE_FILENAME = "cert_quarantine.csv"  # invalid households found in the database
+IMPORT_CHUNK_SIZE = 50000  # rows read at a time when streaming a CSV import
 TERMINAL_WIDTH = 60
+SCAN_SUBFOLDERS = False  # true to also list the CSV files in folders under the current one when importing
+SCAN_WORKERS = 8  # CSV files opened at the same time when checking their headers
+CSV_HEADERS = set(hh.COLUMNS)  # a CSV file needs every one of these headers to be imported
+# files listed for import. Parquet and Arrow files are only listed if pyarrow is installed
+IMPORT_EXTENSIONS = ('.csv',) + (tuple(columnar_io.FORMATS) if columnar_io.available() else ())
+TRIAGE_SHOWN = 50  # highest priority households listed on screen by the triage search
+
+# rollup columns shown in the summary table, and their labels. A single zip code or city shows every column
+SUMMARY_LABELS = {'households': "Homes", 'adults': "Adults", 'children': "Kids", 'pets': "Pets", 'dogs': "Dogs",
+                  'special_needs': "SpNeed", 'crit_meds': "CrMeds", 'ref_meds': "RfMeds", 'gas_tank': "GasTnk",
+                  'gas_line': "GasLn"}
+
+
+# ways a CSV file can be imported
+IMPORT_MODES = [
+    "Preview the data, then merge or overwrite",
+    "Stream it into the current data in chunks",
+    "Stream it straight into the database in chunks",
+]
 
 
 # ------------------
 # Helper functions
 # ------------------
 
+# columns shown by display_dataframe and the max width allowed for each
+DISPLAY_WIDTHS = {'address': 30,
+                  'email': 15,
+                  'phone': 10,
+                  'adults': 2,
+                  'children': 2,
+                  'pets': 1,
+                  'dogs': 1,
+                  'crit_meds': 1,
+                  'ref_meds': 1,
+                  'special_needs': 1,
+                  'gas_tank': 1,
+                  'gas_line': 1,
+                  'med_training': 1,
+                  'know_nbr': 1,
+                  'key_nbr': 1,
+                  'news_ltr': 1,
+                  'contact': 1}
+
+# hardcoded header
+DISPLAY_LABELS = (
+        "                                                         " +
+        "                         Crt Ref Spc Gas Gas Med Knw Key Nws Con\n" +
+        " address                         email             phone        " +
+        "Adlt Kids Pts Dog Med Med Nds Tnk Ln  Tng Nbr Nbr Ltr tct "
+)
+DISPLAY_ROWS_PER_HEADER = 10  # the column labels are repeated every this many households
+
+
+def format_display_column(values: list, width_limit: int) -> tuple:
+    """
+    Formats a whole column for display_dataframe at once
+    :param values: the values of the column
+    :param width_limit: max number of characters shown on the first line
+    :return: (list of first line cells, list of second line cells, numpy array of true where the value
+        needs the second line)
+    """
+    import pandas as pd
+
+    import numpy as np
+
+    contents = pd.Series([str(value) for value in values], dtype=object)  # cast everything to a string
+    blank = f" {'': <{width_limit}} |"  # what goes on the second line when nothing overflows
+    is_na = (contents == NA).to_numpy()
+    is_true = (contents == 't').to_numpy()
+    overflow = (contents.str.len() > width_limit).to_numpy() & ~is_na & ~is_true
+
+    first = (" " + contents.str.ljust(width_limit) + " |").to_numpy(dtype=object, copy=True)
+    # if the element was unanswered, write n/a. Small columns do not use left & right whitespace
+    first[is_na] = f"{'n/a': <{width_limit + 1}}|" if width_limit == 1 else f" {'n/a': <{width_limit + 1}}|"
+    first[is_true] = f" {'T': <{width_limit}} |"  # to make the trues stand out use capitols
+    second = np.full(len(contents), blank, dtype=object)
+    if overflow.any():  # cut the long ones and carry the rest on to the second line
+        long_contents = contents[overflow]
+        first[overflow] = (" " + long_contents.str[:width_limit] + "-|").to_numpy()
+        second[overflow] = ("  " + long_contents.str[width_limit:width_limit * 2 - 1].str.ljust(width_limit) +
+                            "|").to_numpy()
+    return first.tolist(), second.tolist(), overflow
+
+
 def display_dataframe(df: pd.DataFrame) -> None:
     """
-    Displays a dataframe of household object. Allows some elements to use a second row if space is needed
+    Displays a dataframe of household object. Allows some elements to use a second row if space is needed.
+    Each column is formatted all at once and each screen of rows is written out in a single write
     :param df: dataframe to display
     """
-    # hardcoded header
-    col_labels = (
-            "                                                         " +
-            "                         Crt Ref Spc Gas Gas Med Knw Key Nws Con\n" +
-            " address                         email             phone        " +
-            "Adlt Kids Pts Dog Med Med Nds Tnk Ln  Tng Nbr Nbr Ltr tct "
-    )
     row_count, col_count = df.shape
     # exit early if no data is in the dataframe
     if (row_count == 0):
-        print(col_labels)
+        print(DISPLAY_LABELS)
         print("\n*** No data loaded ***\n")
         return
 
-    # create dict of data labels and max allowed lengths
-    col_dict = {'address': 30,
-                'email': 15,
-                'phone': 10,
-                'adults': 2,
-                'children': 2,
-                'pets': 1,
-                'dogs': 1,
-                'crit_meds': 1,
-                'ref_meds': 1,
-                'special_needs': 1,
-                'gas_tank': 1,
-                'gas_line': 1,
-                'med_training': 1,
-                'know_nbr': 1,
-                'key_nbr': 1,
-                'news_ltr': 1,
-                'contact': 1}
-    # iterate through each entry in the dataframe
+    first_cells = []
+    second_cells = []
+    use_second_line = None
+    for col_name, width_limit in DISPLAY_WIDTHS.items():
+        first, second, overflow = format_display_column(df[col_name].tolist(), width_limit)
+        first_cells.append(first)
+        second_cells.append(second)
+        use_second_line = overflow if use_second_line is None else use_second_line | overflow
+    first_lines = ["".join(cells) for cells in zip(*first_cells)]
+    second_lines = ["".join(cells) for cells in zip(*second_cells)]
+
     print("*** Displaying Currently Loaded Data *** \n")
-    for row_index in range(row_count):
+    for start in range(0, row_count, DISPLAY_ROWS_PER_HEADER):
         # show the col headers every 10 lines
-        if row_index % 10 == 0:
-            print(col_labels)
-        # create empty strings to build the first and possible second line of this row
-        first_line = ""
-        second_line = ""
-        use_second_line = False
-        # go through each column. Note, not all columns will be displayed, this gets a little complicated
-        for col_name in col_dict.keys():
-            # cast the contents of that element to a string
-            contents = str(df.iloc[row_index, df.columns.get_loc(col_name)])
-            width_limit = col_dict[col_name]  # create new variable for readability
-            if contents == NA:  # if the element was unanswered, write n/a
-                if width_limit == 1:  # for small columns do not use left & right whitespace
-                    first_line += f"{'n/a': <{width_limit + 1}}|"
-                    second_line += f" {'': <{width_limit}} |"  # put a blank on the second line
-                else:  # for all other columns use right whitespace
-                    first_line += f" {'n/a': <{width_limit + 1}}|"
-                    second_line += f" {'': <{width_limit}} |"  # put a blank on the second line
-            elif contents == 't':  # to make the trues stand out use capitols
-                first_line += f" {'T': <{width_limit}} |"
-                second_line += f" {'': <{width_limit}} |"  # put a blank on the second line
-            elif len(contents) <= width_limit:  # if it fits in the width limit
-                first_line += f" {contents: <{width_limit}} |"
-                second_line += f" {'': <{width_limit}} |"  # put a blank on the second line
-            else:  # if the second line is needed
-                use_second_line = True
-                first_line += f" {contents[:width_limit]: <{width_limit}}-|"
-                second_line += f"  {contents[width_limit:width_limit * 2 - 1]: <{width_limit}}|"
-            pass
-        print(first_line)
-        if use_second_line:
-            print(second_line)
+        screen = [DISPLAY_LABELS]
+        for row_index in range(start, min(start + DISPLAY_ROWS_PER_HEADER, row_count)):
+            screen.append(first_lines[row_index])
+            if use_second_line[row_index]:
+                screen.append(second_lines[row_index])
+        screen.append("")
+        sys.stdout.write("\n".join(screen))
     print()  # do a line break for readability
+    sys.stdout.flush()
 
 
 def df_to_options(df: pd.DataFrame) -> list[str]:
@@ -121,6 +183,8 @@ def add_household_to_df(household: Household, df: pd.DataFrame) -> pd.DataFrame:
     :param df: the Dataframe to add it too
     :return: updated dataframe or original dataframe if there was an error
     """
+    import pandas as pd
+
     # Convert the household to a DataFrame
     new_row = household.to_dataframe()
 
@@ -190,6 +254,8 @@ def merge_dataframes(df_original: pd.DataFrame, df_new: pd.DataFrame) -> pd.Data
     :param df_new: dataframe to be merged
     :return: merged dataframe
     """
+    import pandas as pd
+
     # Filter df_new to only include rows with addresses not in frame_old
     new_rows = df_new[~df_new['address'].isin(df_original['address'])]
 
@@ -198,128 +264,370 @@ def merge_dataframes(df_original: pd.DataFrame, df_new: pd.DataFrame) -> pd.Data
     return merged
 
 
-def save_to_sql(df: pd.DataFrame) -> bool:
+def save_to_sql(store: HouseholdStore, saver: autosave.AutoSaver = None) -> bool:
     """
-    Saves household dataframe to sqlite database on hard drive
-    :param df: dataframe to save
+    Writes the households that changed since the last save to the sqlite database on hard drive
+    :param store: household store to save
+    :param saver: optional autosave writer the store's changes are handed to. If given, this waits for it
+        to write everything instead of writing the changes itself
     :return: true if save successful
     """
+    if not store.has_changes():
+        print("FILE OPERATION: No changes to save")
+        return True
+
+    if saver is not None:
+        print("FILE OPERATION: Waiting for autosave to finish writing")
+        if saver.save(store):
+            print("FILE OPERATION: Database Write Complete")
+            return True
+        print(f"Error: could not complete write operation - {saver.error}", file=sys.stderr)
+        return False
+
     print("FILE OPERATION: Opening Database")
+    db_conn = None
     try:
         # connect to sqlite database
-        db_conn = sqlite3.connect(SQLITE_FILENAME)
-        # create a table
+        db_conn = database.open_database(SQLITE_FILENAME)
         print("FILE OPERATION: Writing to Database")
-        df.to_sql(TABLE_NAME, db_conn, if_exists="replace", index=False)
-        db_conn.close()
+        database.save_changes(db_conn, store)
+        store.mark_saved()
         print("FILE OPERATION: Database Write Complete")
         return True
     except sqlite3.Error as e:
         print(f"Error: could not complete write operation - {e}", file=sys.stderr)
-        db_conn.close()
         return False
+    finally:
+        if db_conn is not None:
+            db_conn.close()
 
 
-def scan_for_csv() -> list[str]:
+# (path, size, modified time) -> true if the file has the CSV_HEADERS. Filled in by scan_for_csv
+_header_cache = {}
+
+
+def _has_household_headers(path: str) -> bool:
     """
-    Scans the directory the program is in for CSV file. Checks each file for the correct headers.
-    Returns a list of valid filenames
-    :return: list of valid filenames
+    Reads the first line of a CSV file, or the column names of a Parquet or Arrow file, to see if it holds
+    household data
+    :param path: path of the file
+    :return: true if every household column is in the header
     """
-    # Define headers
-    correct_headers = {
-        'address', 'adults', 'children', 'pets', 'dogs', 'crit_meds',
-        'ref_meds', 'special_needs', 'gas_tank', 'gas_line', 'adrs_number',
-        'adrs_street', 'adrs_city', 'adrs_state', 'adrs_zip', 'med_training',
-        'email', 'phone', 'know_nbr', 'key_nbr', 'news_ltr', 'contact'
-    }
+    if columnar_io.is_columnar(path):
+        return columnar_io.has_household_columns(path)
+    try:
+        with open(path, 'r', newline='', encoding='utf-8') as file:
+            headers = next(csv.reader(file), None)
+    except (IOError, csv.Error, ValueError):  # a file that is not text raises a ValueError when decoded
+        # not an error worth reporting to the user
+        return False
+    # Check if headers exist and match
+    return bool(headers) and CSV_HEADERS.issubset(header.strip() for header in headers)
 
-    valid_csvs = []
 
-    # Get all files in current directory
-    current_dir = os.getcwd()
-    for filename in os.listdir(current_dir):
-        # filter for file type
-        if filename.endswith('.csv'):
-            file_path = os.path.join(current_dir, filename)
-            # Check for valid headers
-            try:
-                with open(file_path, 'r', newline='', encoding='utf-8') as file:
-                    reader = csv.reader(file)
-                    headers = next(reader, None)
-                    # Check if headers exist and match
-                    if headers:
-                        header_set = {header.strip() for header in headers}
-                        if correct_headers.issubset(header_set):
-                            valid_csvs.append(filename)
-
-            except (IOError, csv.Error):
-                # not an error worth reporting to the user
-                continue
-    return valid_csvs
+def _list_csv_files(folder: str, recursive: bool) -> list:
+    """
+    :param folder: folder to look in
+    :param recursive: also look in every folder under it
+    :return: list of os.DirEntry of the files ending in one of the IMPORT_EXTENSIONS. The files imports set
+        rows aside in are left out, so their rows are never imported again
+    """
+    found = []
+    try:
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if csv_import.is_report(entry.name) or entry.name == QUARANTINE_FILENAME:
+                    continue
+                if entry.name.lower().endswith(IMPORT_EXTENSIONS) and entry.is_file():
+                    found.append(entry)
+                elif recursive and entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+                    found += _list_csv_files(entry.path, recursive)
+    except OSError:  # a folder that can't be read is skipped, the same as a file that can't be read
+        pass
+    return found
+
+
+def scan_for_csv(recursive: bool = SCAN_SUBFOLDERS) -> list[str]:
+    """
+    Scans the directory the program is in for CSV files, and Parquet and Arrow files if pyarrow is
+    installed. Checks each file for the correct headers.
+    Returns a list of valid filenames.
+    Header checks are cached by path, size and modified time, so a file is only opened again if it
+    changed. Files not in the cache are opened several at a time, since most of the wait is the disk
+    :param recursive: also scan the folders under the current one
+    :return: list of valid filenames, relative to the current folder and sorted
+    """
+    entries = _list_csv_files(".", recursive)
+    checked = {}
+    unchecked = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except OSError:  # deleted or renamed since the folder was listed
+            continue
+        key = (entry.path, stat.st_size, stat.st_mtime_ns)
+        if key in _header_cache:
+            checked[key] = _header_cache[key]
+        else:
+            unchecked.append(key)
+    if unchecked:
+        with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+            checked.update(zip(unchecked, pool.map(_has_household_headers, (key[0] for key in unchecked))))
+    # only keep the files seen this time, so deleted and changed files drop out of the cache
+    _header_cache.clear()
+    _header_cache.update(checked)
+    return sorted(os.path.relpath(path) for (path, _, _), valid in checked.items() if valid)
+
+
+def load_saved_households(db_conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Reads every saved household. Invalid households are left in the database but set aside so the rest
+    of the program never sees them
+    :param db_conn: open database connection
+    :return: dataframe of the valid saved households
+    """
+    print("FILE OPERATION: Loading all households from database")
+    household_df, invalid_df = hh.split_valid(database.load_dataframe(db_conn))
+    if len(invalid_df) > 0:
+        invalid_df.to_csv(QUARANTINE_FILENAME, index=False)  # replaced each time so it only lists current rows
+        print(f"FILE OPERATION: {len(invalid_df)} invalid households copied to {QUARANTINE_FILENAME}")
+    return household_df
+
+
+def write_quarantined(db_conn: sqlite3.Connection) -> int:
+    """
+    Copies the households an upgrade of the database set aside as invalid to the quarantine file, so they
+    can be fixed and imported again. They stay in the database as well, so nothing is lost
+    :param db_conn: open database connection
+    :return: number of households in the file, 0 if there were none and no file was written
+    """
+    quarantined = database.fetch_quarantined(db_conn)
+    if quarantined:
+        with open(QUARANTINE_FILENAME, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=hh.COLUMNS, lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(quarantined)
+    return len(quarantined)
+
+
+def open_store(repo: HouseholdRepository) -> HouseholdStore:
+    """
+    Creates a household store that reads the saved households lazily. Single households are fetched by
+    address as needed, and the whole table is only read once something needs every household
+    :param repo: repository of the saved households
+    :return: empty household store backed by the database
+    """
+    return HouseholdStore(load_saved=lambda: load_saved_households(repo.conn), fetch_saved=repo.record,
+                          fetch_block=repo.block, list_saved=repo.options)
+
+
+def page_source(store: HouseholdStore, repo: HouseholdRepository):
+    """
+    Gives a function that reads pages of households. Pages are read straight from the database, then the
+    households changed since the last save are laid over them, so the whole table is never loaded
+    :param store: household store
+    :param repo: repository of the saved households
+    :return: function(limit, after=, before=, start=, zip_code=) that returns a page of households
+    """
+    import pandas as pd
+
+    def fetch_page(limit: int, after: str = None, before: str = None, start: str = None,
+                   zip_code: str = None) -> pd.DataFrame:
+        if store.replace_all:  # nothing saved is kept, so the store has every household
+            return store.page(limit, after=after, before=before, start=start, zip_code=zip_code)
+        # changed households are left out of the saved pages, so keep reading until there are enough others.
+        # Only the addresses are read until the page is known, and each read is twice as big as the last, so
+        # a long run of changed households that are already in the database is skipped quickly
+        addresses = []
+        size = limit
+        read_after, read_before, read_start = after, before, start
+        while len(addresses) < limit:
+            page = repo.page_addresses(size, after=read_after, before=read_before, start=read_start,
+                                       zip_code=zip_code)
+            addresses += [address for address in page if address not in store.changes]
+            if len(page) < size:
+                break
+            if before is not None:
+                read_before = page[0]
+            else:
+                read_after, read_start = page[-1], None
+            size *= 2
+        addresses = sorted(addresses)
+        addresses = addresses[-limit:] if before is not None else addresses[:limit]
+        saved = pd.DataFrame([repo.record(address) for address in addresses], columns=hh.COLUMNS)
+        changed = store.changed_page(limit, after=after, before=before, start=start, zip_code=zip_code)
+        found = pd.concat([saved, changed], ignore_index=True).sort_values('address', ignore_index=True)
+        return found[-limit:].reset_index(drop=True) if before is not None else found[:limit]
+
+    return fetch_page
+
+
+def rank_households(store: HouseholdStore, repo: HouseholdRepository, node: tuple, weights: dict,
+                    zip_code: str = None, city: str = None, limit: int = None) -> pd.DataFrame:
+    """
+    Finds and ranks households for triage. The saved households are ranked by the database, then the
+    households changed since the last save are ranked in memory and merged in, the same way search works
+    :param store: household store
+    :param repo: repository of the saved households
+    :param node: parsed triage filter
+    :param weights: dict of flag or count column name to priority weight
+    :param zip_code: only include households in this zip code
+    :param city: only include households in this city
+    :param limit: max number of households to return. All of them if not given
+    :return: dataframe of household data plus a priority column, highest priority first
+    """
+    import pandas as pd
+
+    if store.replace_all:  # nothing saved is kept, so only the store can answer
+        return triage.rank_store(store, node, weights, zip_code=zip_code, city=city, limit=limit)
+    # changed households can push saved ones off the end, so ask for enough extra to make up for them
+    saved = triage.rank_database(repo.conn, node, weights, zip_code=zip_code, city=city,
+                                 limit=None if limit is None else limit + len(store.changes))
+    saved = saved[~saved['address'].isin(store.changes)]
+    changed = HouseholdStore(store.frame([address for address, change in store.changes.items() if change != REMOVED]))
+    current = triage.rank_store(changed, node, weights, zip_code=zip_code, city=city, limit=limit)
+    ranked = pd.concat([saved, current], ignore_index=True)
+    return ranked.sort_values([triage.PRIORITY_COLUMN, 'address'], ascending=[False, True], ignore_index=True)[:limit]
+
+
+def search_households(store: HouseholdStore, repo: HouseholdRepository, text: str,
+                      limit: int = None) -> pd.DataFrame:
+    """
+    Finds households by any words of their address, email or phone. The saved households are searched
+    with the database's full text index, then households changed since the last save are checked in memory
+    so removed ones are left out and added or edited ones are found
+    :param store: household store
+    :param repo: repository of the saved households
+    :param text: words to search for
+    :param limit: max number of households to return. All of them if not given
+    :return: dataframe of matching households, in address order
+    """
+    import pandas as pd
+
+    if store.replace_all:  # nothing saved is kept, so only the store can answer
+        found = store.to_dataframe()
+        return found[matches_text(found, text)].sort_values('address', ignore_index=True)[:limit]
+    changed = list(store.changes)
+    # changed households can push saved matches off the end, so ask for enough extra to make up for them
+    saved = repo.search(text, None if limit is None else limit + len(changed))
+    saved = saved[~saved['address'].isin(store.changes)]
+    current = store.frame([address for address, change in store.changes.items() if change != REMOVED])
+    found = pd.concat([saved, current[matches_text(current, text)]], ignore_index=True)
+    return found.sort_values('address', ignore_index=True)[:limit]
+
+
+def display_ranked(df: pd.DataFrame, weights: dict) -> None:
+    """
+    Displays a triage ranking in a single write, with the reasons each household scored what it did
+    :param df: dataframe from rank_households
+    :param weights: the weights the households were scored with
+    """
+    lines = [f"{'Priority':>8}  {'Address':<40}Reasons"]
+    for record in df.to_dict('records'):
+        reasons = [name if name not in triage.COUNT_COLUMNS else f"{record[name]} {name}"
+                   for name, weight in weights.items()
+                   if weight and (record[name] == 't' if name not in triage.COUNT_COLUMNS else record[name] != '0')]
+        lines.append(f"{record[triage.PRIORITY_COLUMN]:>8}  {record['address'][:38]:<40}{', '.join(reasons)}")
+    if len(df) == 0:
+        lines.append("\n*** No households match ***\n")
+    cli.write("\n".join(lines) + "\n")
+
+
+def display_summary(df: pd.DataFrame, column: str) -> None:
+    """
+    Displays zip code or city totals in a single write. A single zip code or city is shown with every total
+    on its own line, more than one as a table with a total row at the bottom
+    :param df: dataframe from rollups.summarize
+    :param column: the column the totals are grouped by
+    """
+    if len(df) == 0:
+        lines = ["\n*** No households found ***\n"]
+    elif len(df) == 1:
+        record = df.iloc[0]
+        lines = [f"Totals for {record[column]}"]
+        lines += [f"  {col.replace('_', ' '):<16}{record[col]:>8}" for col in rollups.TOTAL_COLUMNS]
+    else:
+        lines = [f"{'':<16}" + "".join(f"{label:>7}" for label in SUMMARY_LABELS.values())]
+        for record in df.to_dict('records'):
+            lines.append(f"{str(record[column])[:15]:<16}" + "".join(f"{record[col]:>7}" for col in SUMMARY_LABELS))
+        lines.append(f"{'Total':<16}" + "".join(f"{df[col].sum():>7}" for col in SUMMARY_LABELS))
+    cli.write("\n".join(lines) + "\n")
+
+
+def show_page(store: HouseholdStore, repo: HouseholdRepository, start: str = None) -> None:
+    """
+    Displays a single page of households
+    :param store: household store
+    :param repo: repository of the saved households
+    :param start: optional address to start the page at
+    """
+    display_dataframe(page_source(store, repo)(pager.PAGE_SIZE, start=start))
 
 
 # ------------------
 # Main program
 # ------------------
 def main():
-    empty_df = hh.empty_dataframe()  # DEBUG
-
-    # create properly headered empty dataframe to hold data in the program
-    household_df = hh.empty_dataframe()
-
     # check to see if database exists
-    if os.path.exists(SQLITE_FILENAME):  # if the db exists
-        print("Starting Up: Database Found")  # debug
-        db_connection = sqlite3.connect(SQLITE_FILENAME)
-
-        # check if table exists in database
-        try:
-            cursor = db_connection.cursor()
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name=?
-            """, (TABLE_NAME,))
-            result = cursor.fetchone()
-
-            if result:
-                print("Starting Up: Database Table Found")
-                # Use pd.read_sql instead of pd.read_sql_table for SQLite
-                household_df = pd.read_sql(f'SELECT * FROM "{TABLE_NAME}"', db_connection)
-                print("Starting Up: Data Loaded")
-            else:
-                print("Starting Up: Database Table NOT Found")
-                print("Starting Up: Creating Database Table")
-                household_df.to_sql(TABLE_NAME, db_connection, if_exists='replace', index=False)
-                print("Starting Up: Database Table Created")
-        except sqlite3.Error as e:
-            print(f"Error checking table existence: {e}")
-            db_connection.close()
-        finally:
-            db_connection.close()
-
-    else:  # create it if it does not
+    if os.path.exists(SQLITE_FILENAME):
+        print("Starting Up: Database Found")
+    else:
         print("Starting Up: Database NOT Found")
-        db_connection = sqlite3.connect(SQLITE_FILENAME)
-        household_df.to_sql(TABLE_NAME, db_connection, if_exists='replace', index=False)
-        print("Starting Up: Database Created")
-        db_connection.close()
+    # open the database, creating or upgrading the households table if needed.
+    # The households themselves are not read until they are needed
+    try:
+        db_connection = database.open_database(SQLITE_FILENAME)
+        print("Starting Up: Database Ready")
+    except sqlite3.Error as e:
+        print(f"Error: could not load database - {e}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        quarantined = write_quarantined(db_connection)
+    except OSError as e:
+        print(f"Error: could not write {QUARANTINE_FILENAME} - {e}", file=sys.stderr)
+        quarantined = 0
+    if quarantined > 0:
+        print(f"Starting Up: {quarantined} invalid households are set aside in {QUARANTINE_FILENAME}")
+
+    # changes still in the journal did not make it into the database before the program last stopped
+    try:
+        recovered = autosave.replay(db_connection, JOURNAL_FILENAME)
+    except (sqlite3.Error, ValueError, KeyError) as e:
+        print(f"Error: could not recover unsaved changes from {JOURNAL_FILENAME} - {e}", file=sys.stderr)
+        sys.exit(1)
+    if recovered > 0:
+        print(f"Starting Up: Recovered {recovered} sets of changes that were not saved last time")
+    # from here on every change is saved in the background as it is made
+    saver = autosave.AutoSaver(SQLITE_FILENAME, JOURNAL_FILENAME, wal=AUTOSAVE_WAL)
+
+    # reads of the saved households go through the repository, so only the rows needed are read
+    repository = HouseholdRepository(db_connection)
+    # everything the user does from here is tracked so saving only writes what changed
+    store = open_store(repository)
 
     # ------------------
     # Main Loop
     # ------------------
     while True:
+        # stop tracking the changes autosave has finished writing
+        saver.settle(store)
+        if saver.error is not None:
+            print(f"Error: autosave could not write to the database - {saver.error}. Changes are kept in "
+                  f"{JOURNAL_FILENAME} and will be tried again.", file=sys.stderr)
+
         # main screen
         main_menu_options = [
             "View households",
+            "Search households",
             "Add a household",
             "Remove a household",
             "Edit a household",
             "Import CSV file",
             "Export CSV file",
+            "Triage households",
+            "Summary by zip code or city",
             "Save Changes to Database",
-            "Save & Exit",
-            "Exit & Discard all changes"
+            "Save & Exit"
         ]
 
         # prompt the user to make a main menu selection
@@ -328,50 +636,77 @@ def main():
 
         # handle main menu options
         if main_menu_choice == "View households":
+            pager.page_households(page_source(store, repository), display_dataframe)
+
+        elif main_menu_choice == "Search households":
+            text = cli.prompt_user("Enter any part of a street, city, address, email or phone number. "
+                                   "Every word must match.", header="Search households")
+            found = search_households(store, repository, text, limit=pager.PAGE_SIZE)
             cli.clear_screen()
-            display_dataframe(household_df)
-            input(f"Press enter to continue")
+            display_dataframe(found)
+            if len(found) == pager.PAGE_SIZE:
+                print(f"Showing the first {pager.PAGE_SIZE} matches. Add more words to narrow the search.")
+            input("Press enter to continue.")
 
         if main_menu_choice == "Add a household":
             # create a new household object and prompt the user to fill it out
             new_hh = Household()
             new_hh.ask_questions(TERMINAL_WIDTH)
-            # add that household to the active dataframe
-            household_df = add_household_to_df(new_hh, household_df)
-            # show updated active dataframe to user
-            cli.clear_screen()
-            display_dataframe(household_df)
-            input(f"Added {new_hh.get_adrs_str()}. Press enter to continue")
+            # check it is not already stored under a slightly different address
+            record = new_hh.to_record()
+            matches = store.possible_duplicates(record) if record is not None else []
+            if matches and cli.prompt_user(
+                    "This looks like a household that is already stored: " +
+                    "; ".join(address for address, _, _ in matches) + ". Add it anyway?",
+                    input_format="y/n", header=new_hh.get_adrs_str()) != 't':
+                input("Add Canceled. Press enter to continue.")
+            else:
+                # add that household to the active data
+                store.add(new_hh)
+                saver.submit(store)
+                # show updated active data to user
+                cli.clear_screen()
+                show_page(store, repository, start=new_hh.get_adrs_str())
+                input(f"Added {new_hh.get_adrs_str()}. Press enter to continue")
 
         elif main_menu_choice == "Remove a household":
             # ask user which household to delete
-            delete_options = df_to_options(household_df)
-            user_delete_choice = cli.prompt_user("Pick one to remove:", user_options=delete_options)
+            user_delete_choice = cli.pick_option("Pick one to remove:", store.search_index())
             # confirm user wants to delete household
-            if cli.prompt_user("Delete Selected Entry?", input_format="y/n", header=user_delete_choice):
-                household_df = remove_household_from_df(user_delete_choice, household_df)
-                # show updated active dataframe to user
+            if user_delete_choice is None:
+                input("Deletion Canceled. Press enter to continue.")
+            elif cli.prompt_user("Delete Selected Entry? It is saved right away and cannot be undone.",
+                                 input_format="y/n", header=user_delete_choice) == 't':
+                repository.remove(store, user_delete_choice)
+                saver.submit(store)
+                # show updated active data to user
                 cli.clear_screen()
-                display_dataframe(household_df)
+                show_page(store, repository, start=user_delete_choice)
                 input(f"Removed {user_delete_choice}. Press enter to continue")
             else:
                 input("Deletion Canceled. Press enter to continue.")
 
         elif main_menu_choice == "Edit a household":
             # ask user which household to edit
-            edit_options = df_to_options(household_df)
-            user_delete_choice = cli.prompt_user("Pick one to Edit:", user_options=edit_options)
+            user_delete_choice = cli.pick_option("Pick one to Edit:", store.search_index())
             # confirm user wants to edit household
-            if cli.prompt_user("Edit Selected Entry?", input_format="y/n", header=user_delete_choice):
-                # delete old old household
-                household_df = remove_household_from_df(user_delete_choice, household_df)
+            if user_delete_choice is None:
+                input("Edit Canceled. Press enter to continue.")
+            elif cli.prompt_user("Edit Selected Entry?", input_format="y/n", header=user_delete_choice) == 't':
                 # get edited household
                 new_hh = Household()
                 new_hh.ask_questions(TERMINAL_WIDTH)
-                household_df = add_household_to_df(new_hh, household_df)
-                # show updated active dataframe to user
+                # swap the old household for the new one. Changes are saved as they are made, so if the new one
+                # can't be added (its address belongs to another household) the old one is put back first
+                old_hh = repository.remove(store, user_delete_choice)
+                if not store.add(new_hh):
+                    store.add(old_hh)
+                    input(f"Could not update {user_delete_choice}, it was left as it was. Press enter to continue")
+                    continue
+                saver.submit(store)
+                # show updated active data to user
                 cli.clear_screen()
-                display_dataframe(household_df)
+                show_page(store, repository, start=new_hh.get_adrs_str())
                 input(
                     f"Updated {user_delete_choice} with new record for {new_hh.get_adrs_str()}. Press enter to continue")
             else:
@@ -380,72 +715,219 @@ def main():
         elif main_menu_choice == "Import CSV file":
             import_options = scan_for_csv()
             # back out if there are no valid files
-            print(len(import_options))  # debug
-
             if len(import_options) == 0:
                 input("No valid files in this directory. Press enter to continue")
             else:
-                # create a new dataframe to hold the imported data
-                new_df = hh.empty_dataframe()
-                # prompt user for which file to read
-                user_import_choice = cli.prompt_user("Select a file", user_options=import_options, header="Import CSV")
-                new_df = pd.read_csv(user_import_choice, keep_default_na=False,
-                                     na_filter=False)  # supress converting "n/a" from a string
-
-                # let user determine to merge or overwrite data
-                cli.clear_screen()
-                print("Data imported from CSV:")
-                display_dataframe(new_df)
-                merge = input("Merge new data with current data or"
-                              " overwrite current data with new data? [Enter \"Merge\" or \"Overwrite\"]")
-
-                # clear console for readability
-                cli.clear_screen()
-
-                # if the user entered O then overwrite
-                if len(merge) > 0:  # check that the user entered something
-                    if merge[0].lower() == 'o':  # drop the old data and replace it with new
-                        household_df = new_df
-                        print(f"FILE OPERATION: Data overwritten")
-                    else:
-                        household_df = merge_dataframes(household_df, new_df)
-                        print(f"FILE OPERATION: Data Merged")
-                else:  # if no input then just cancel the import
-                    print(f"FILE OPERATION: Import Canceled")
-                display_dataframe(household_df)
+                # prompt user for which file to read. Several files can also be read at the same time, one per CPU
+                all_files = f"All {len(import_options)} files at once"
+                file_options = import_options + [all_files] if len(import_options) > 1 else import_options
+                user_import_choice = cli.prompt_user("Select a file", user_options=file_options, header="Import CSV")
+                if user_import_choice == all_files:
+                    cli.clear_screen()
+                    totals = csv_import.import_many(import_options, store)
+                    saver.submit(store)
+                    print(f"FILE OPERATION: Data Merged - {totals['added']} of {totals['rows']} rows from "
+                          f"{len(import_options)} files added, {totals['duplicates']} duplicates, "
+                          f"{totals['rejected']} rejected, in {totals['seconds']:.1f}s "
+                          f"({totals['rows_per_second']:,.0f} rows/s)")
+                    if totals['rejected'] > 0:
+                        print(f"FILE OPERATION: Rejected rows moved to the *{csv_import.QUARANTINE_SUFFIX} file of "
+                              f"each file")
+                    if totals['possible_duplicates'] > 0:
+                        print(f"FILE OPERATION: {totals['possible_duplicates']} possible duplicates listed in the "
+                              f"*{csv_import.DUPLICATE_SUFFIX} file of each file")
+                    input(f"Press enter to continue")
+                    continue
+                import_mode = cli.prompt_user("How should the file be imported?", user_options=IMPORT_MODES,
+                                              header=f"Import {user_import_choice}")
+
+                # rows that fail validation are set aside in their own file instead of being imported
+                quarantine_file = csv_import.quarantine_filename(user_import_choice)
+                # rows that are probably already stored under a slightly different address are listed here
+                duplicate_file = csv_import.duplicate_filename(user_import_choice)
+
+                if import_mode == "Preview the data, then merge or overwrite":
+                    new_df = csv_import.read_file(user_import_choice)
+                    new_df, rejected_df = hh.split_valid(new_df)
+                    csv_import.remove_report(quarantine_file)
+                    if len(rejected_df) > 0:
+                        csv_import.quarantine_rows(rejected_df, quarantine_file)
+                        print(f"FILE OPERATION: {len(rejected_df)} invalid rows moved to {quarantine_file}")
+
+                    # let user determine to merge or overwrite data
+                    cli.clear_screen()
+                    print("Data imported from CSV:")
+                    display_dataframe(new_df)
+                    merge = input("Merge new data with current data or"
+                                  " overwrite current data with new data? [Enter \"Merge\" or \"Overwrite\"]")
+
+                    # clear console for readability
+                    cli.clear_screen()
+
+                    # changes are saved as they are made, so an overwrite has to be confirmed before it happens
+                    if merge[:1].lower() == 'o' and cli.prompt_user(
+                            "Overwrite deletes every saved household and replaces them with the ones in this file. "
+                            "It is saved right away and cannot be undone. Overwrite?", input_format="y/n",
+                            header=f"Import {user_import_choice}") != 't':
+                        merge = ""  # backing out cancels the import
+                        cli.clear_screen()
+
+                    # if the user entered O then overwrite
+                    if len(merge) > 0:  # check that the user entered something
+                        if merge[0].lower() == 'o':  # drop the old data and replace it with new
+                            report = DuplicateIndex().check_frame(new_df)
+                            store.overwrite(new_df)
+                            print(f"FILE OPERATION: Data overwritten")
+                        else:
+                            report = store.duplicate_index().check_frame(new_df)
+                            store.merge(new_df)
+                            print(f"FILE OPERATION: Data Merged")
+                        saver.submit(store)
+                        if len(report) > 0:
+                            report.to_csv(duplicate_file, index=False)
+                            print(f"FILE OPERATION: {len(report)} possible duplicates listed in {duplicate_file}")
+                    else:  # if no input then just cancel the import
+                        print(f"FILE OPERATION: Import Canceled")
+                    show_page(store, repository)
+
+                elif import_mode == "Stream it into the current data in chunks":
+                    cli.clear_screen()
+                    totals = csv_import.import_csv(user_import_choice, store=store, chunk_size=IMPORT_CHUNK_SIZE,
+                                                   quarantine_file=quarantine_file, duplicate_file=duplicate_file)
+                    saver.submit(store)
+                    print(f"FILE OPERATION: Data Merged - {totals['added']} of {totals['rows']} rows added, "
+                          f"{totals['duplicates']} duplicates, {totals['rejected']} rejected")
+                    if totals['rejected'] > 0:
+                        print(f"FILE OPERATION: Rejected rows moved to {quarantine_file}")
+                    if totals['possible_duplicates'] > 0:
+                        print(f"FILE OPERATION: {totals['possible_duplicates']} possible duplicates listed in "
+                              f"{duplicate_file}")
+
+                else:  # stream it straight into the database
+                    # the database is reloaded afterwards, so autosave has to finish writing first
+                    if save_to_sql(store, saver):
+                        cli.clear_screen()
+                        try:
+                            totals = csv_import.import_csv(user_import_choice, db_conn=db_connection,
+                                                           chunk_size=IMPORT_CHUNK_SIZE,
+                                                           quarantine_file=quarantine_file,
+                                                           duplicate_file=duplicate_file)
+                            print(f"FILE OPERATION: Data written to database - {totals['added']} of "
+                                  f"{totals['rows']} rows added, {totals['duplicates']} duplicates, "
+                                  f"{totals['rejected']} rejected")
+                            if totals['rejected'] > 0:
+                                print(f"FILE OPERATION: Rejected rows moved to {quarantine_file}")
+                            if totals['possible_duplicates'] > 0:
+                                print(f"FILE OPERATION: {totals['possible_duplicates']} possible duplicates "
+                                      f"listed in {duplicate_file}")
+                            store = open_store(repository)  # start over from what is now saved
+                        except (sqlite3.Error, ValueError) as e:
+                            print(f"Error: could not complete import - {e}", file=sys.stderr)
                 input(f"Press enter to continue")
 
         elif main_menu_choice == "Export CSV file":
             #Prompt user for export filename
             raw_name = cli.prompt_user("Enter the name of the file without the file extension. Use only letters and "
                                        "numbers. No spaces or symbols.", header="Export to CSV file")
+            # CSV files are streamed from the database, so they can be filtered and compressed. Parquet and Arrow
+            # keep the column types and are compressed, but need pyarrow to write
+            formats = {name: ext for ext, name in csv_export.formats().items()}
+            if columnar_io.available():
+                formats.update({name: ext for ext, name in columnar_io.FORMATS.items()})
+            extension = formats[cli.prompt_user("Select a file format", user_options=list(formats),
+                                                header="Export to CSV file")]
             # remove any symbols so the filename is usable
-            stripped_name = ''.join(filter(str.isalnum, raw_name)) + ".csv"
+            stripped_name = ''.join(filter(str.isalnum, raw_name)) + extension
+            node = zip_code = city = None
+            if not columnar_io.is_columnar(stripped_name):
+                filter_text = cli.prompt_user("Only export households matching a filter, using flag names with "
+                                              "and/or/not and adults/children compared to numbers, such as "
+                                              "\"contact and news_ltr\". Blank for every household.",
+                                              header="Export to CSV file", required=False)
+                scope = cli.prompt_user("Zip code or city to export. Blank for everywhere.",
+                                        header="Export to CSV file", required=False)
+                try:
+                    node = triage.parse("" if filter_text == NA else filter_text)
+                except triage.TriageError as e:
+                    input(f"Could not export: {e}. Press enter to continue.")
+                    continue
+                zip_code = scope if scope != NA and scope.isdigit() else None
+                city = scope if scope != NA and not scope.isdigit() else None
             # ask the user if that name is acceptable
             if cli.prompt_user(f"Confirm: export to file {stripped_name}",
                                header="Export to CSV file", input_format='y/n') == 't':
-                household_df.to_csv(stripped_name, index=False)
-                print(f"FILE OPERATION: Data exported to {stripped_name}")
+                if columnar_io.is_columnar(stripped_name):
+                    columnar_io.write_store(store, stripped_name)
+                    print(f"FILE OPERATION: Data exported to {stripped_name}")
+                # the rows are read from the database, so autosave has to finish writing first
+                elif save_to_sql(store, saver):
+                    try:
+                        count = csv_export.export_csv(db_connection, stripped_name, node, zip_code=zip_code,
+                                                      city=city)
+                        print(f"FILE OPERATION: {count} households exported to {stripped_name}")
+                    except (sqlite3.Error, OSError) as e:
+                        print(f"Error: could not complete export - {e}", file=sys.stderr)
             else:
                 print(f"FILE OPERATION: Export Canceled")
             input(f"Press enter to continue")
 
+        elif main_menu_choice == "Triage households":
+            # ask what to look for, where, and what matters most
+            filter_text = cli.prompt_user("Filter, using flag names with and/or/not and adults/children "
+                                          "compared to numbers. Blank for anyone with special needs, meds or gas.",
+                                          header="Triage households", required=False)
+            scope = cli.prompt_user("Zip code or city to search. Blank for everywhere.",
+                                    header="Triage households", required=False)
+            weights_text = cli.prompt_user("Priority weights as name=weight, separated by commas. Blank for "
+                                           "the defaults.", header="Triage households", required=False)
+            try:
+                node = triage.parse(triage.DEFAULT_FILTER if filter_text == NA else filter_text)
+                weights = triage.parse_weights("" if weights_text == NA else weights_text)
+            except triage.TriageError as e:
+                input(f"Could not search: {e}. Press enter to continue.")
+                continue
+            zip_code = scope if scope != NA and scope.isdigit() else None
+            city = scope if scope != NA and not scope.isdigit() else None
+            ranked = rank_households(store, repository, node, weights, zip_code=zip_code, city=city,
+                                     limit=TRIAGE_SHOWN)
+            cli.clear_screen()
+            display_ranked(ranked, weights)
+            input("Press enter to continue.")
+            # the list on screen is cut short, so offer the whole thing as a file
+            if len(ranked) == TRIAGE_SHOWN and cli.prompt_user(
+                    f"Only the top {TRIAGE_SHOWN} were shown. Export the full ranked list to "
+                    f"{triage.EXPORT_FILENAME}?", input_format="y/n", header="Triage households") == 't':
+                rank_households(store, repository, node, weights, zip_code=zip_code,
+                                city=city).to_csv(triage.EXPORT_FILENAME, index=False)
+                input(f"FILE OPERATION: Ranked list exported to {triage.EXPORT_FILENAME}. Press enter to continue.")
+
+        elif main_menu_choice == "Summary by zip code or city":
+            by = cli.prompt_user("Group the totals by", user_options=["zip", "city"], header="Summary")
+            value = cli.prompt_user(f"Which {by}? Blank for every {by}.", header="Summary", required=False)
+            # read from the totals table, so this costs the number of zip codes, not the number of households
+            with saver.settled(store):  # so a batch being written is not counted twice
+                totals = store.rollups(repository.rollups())
+            cli.clear_screen()
+            display_summary(rollups.summarize(totals, by, None if value == NA else value), rollups.GROUPINGS[by])
+            input("Press enter to continue.")
+
         elif main_menu_choice == "Save Changes to Database":
-            save_to_sql(household_df)
+            save_to_sql(store, saver)
             input("Press enter to continue.")
 
         elif main_menu_choice == "Save & Exit":
-            if save_to_sql(household_df):
+            if save_to_sql(store, saver):
                 print("Changes saved to database.")
-                print("Goodbye.")
-                sys.exit(0)
             else:
-                input("Error: Could not save. Try again or exit without saving. Push enter to continue.")
-
-        elif main_menu_choice == "Exit & Discard all changes":
-            print("Discarding all unsaved changes and exiting. Goodbye.")
+                print(f"Changes that could not be saved are kept in {JOURNAL_FILENAME} and will be written "
+                      f"the next time the program starts.")
+            saver.close()
+            print("Goodbye.")
             sys.exit(0)
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:  # a command on the command line runs without the menus, see batch.py
+        import batch
+        sys.exit(batch.main_batch(sys.argv[1:]))
     main()
@@ -0,0 +1,77 @@
+"""
+pager.py
+Author: Russell Johnson
+Date 5 Dec 2025
+SER416 Final Project
+Lets the user page through households one screen at a time. Only the rows on the current screen are
+fetched, so viewing works the same on a handful of households or a million
+"""
+import cli_utils as cli
+
+# ------------------
+# Constants
+# ------------------
+
+PAGE_SIZE = 20  # households shown on each screen
+COMMANDS = "[Enter] next | p previous | j <address> jump | z <zip> filter by zip | z clear filter | q quit"
+
+
+# ------------------
+# Functions
+# ------------------
+
+def page_households(fetch_page, display, page_size: int = PAGE_SIZE, start: str = None) -> None:
+    """
+    Shows households a page at a time until the user quits
+    :param fetch_page: function(limit, after=, before=, start=, zip_code=) that returns a dataframe of
+        the households on a page, in address order. See database.fetch_page
+    :param display: function that displays a dataframe of households
+    :param page_size: households on each page
+    :param start: optional address to start at
+    """
+    zip_code = None
+    page = fetch_page(page_size, start=start)
+    status = ""
+    while True:
+        cli.clear_screen()
+        display(page)
+        if zip_code:
+            print(f"Showing zip code {zip_code} only")
+        if status:
+            print(status)
+            status = ""
+        print(COMMANDS)
+        command = input().strip()
+        action = command[:1].lower()
+        argument = command[1:].strip()
+
+        if action == 'q':
+            return
+        elif action in ('', 'n'):
+            if len(page) == 0:
+                status = "No households to show."
+                continue
+            next_page = fetch_page(page_size, after=page['address'].iloc[-1], zip_code=zip_code)
+            if len(next_page) == 0:
+                status = "Already at the last page."
+            else:
+                page = next_page
+        elif action == 'p':
+            if len(page) == 0:
+                status = "No households to show."
+                continue
+            previous_page = fetch_page(page_size, before=page['address'].iloc[0], zip_code=zip_code)
+            if len(previous_page) == 0:
+                status = "Already at the first page."
+            else:
+                page = previous_page
+        elif action == 'j':
+            page = fetch_page(page_size, start=argument, zip_code=zip_code)
+            if len(page) == 0:  # jumped past the end, so show the last page instead
+                status = f"No households after {argument}."
+                page = fetch_page(page_size, before=chr(0x10FFFF), zip_code=zip_code)
+        elif action == 'z':
+            zip_code = argument or None
+            page = fetch_page(page_size, zip_code=zip_code)
+        else:
+            status = f"Unknown command {command}"
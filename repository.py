@@ -0,0 +1,269 @@
+"""
+repository.py
+Author: Russell Johnson
+Date 10 Dec 2025
+SER416 Final Project
+Reads the saved households straight from the database. Every lookup, filter, count, search and page is a
+parameterized SQL query that only returns the rows that were asked for, so memory use depends on the size
+of the answer instead of the size of the database. These are the database versions of the dataframe
+helpers in main.py (get_household_from_df, remove_household_from_df and df_to_options). Changes are never
+written here, they go through a HouseholdStore so its change tracking and autosave see them
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import sqlite3
+import sys
+import household as hh
+import flags
+import database
+import triage
+from household import Household
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from household_store import HouseholdStore
+
+# ------------------
+# Constants
+# ------------------
+
+# the filters a query can use. Each one adds a fixed piece of SQL, so the same filters always give the same
+# statement text and sqlite3 reuses the statement it already prepared instead of parsing it again
+FILTER_SQL = {
+    'zip_code': "adrs_zip = ?",
+    'city': "adrs_city = ? COLLATE NOCASE",
+    'all_of': "(flag_values & ?) = ?",
+    'any_of': "(flag_values & ?) != 0",
+}
+
+
+# ------------------
+# Functions
+# ------------------
+
+def matches_text(df: pd.DataFrame, text: str) -> pd.Series:
+    """
+    Checks households in memory the same way HouseholdRepository.search checks saved ones
+    :param df: dataframe of household data
+    :param text: words to search for
+    :return: series of true/false, true where every word appears in one of database.SEARCH_COLUMNS
+    """
+    import pandas as pd
+
+    combined = df[database.SEARCH_COLUMNS[0]].astype(str)
+    for col in database.SEARCH_COLUMNS[1:]:
+        combined = combined + "\n" + df[col].astype(str)
+    combined = combined.str.lower()
+    matches = pd.Series(True, index=df.index)
+    for word in text.lower().split():
+        matches &= combined.str.contains(word, regex=False)
+    return matches
+
+
+# ------------------
+# HouseholdRepository class
+# ------------------
+
+class HouseholdRepository:
+    """
+    Queries the households table of an open database. Nothing is cached, so results always match what
+    is saved
+    """
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        """
+        :param conn: open database connection, such as from database.open_database
+        """
+        self.conn = conn
+
+    # ------------------
+    # Single households
+    # ------------------
+
+    def exists(self, address: str) -> bool:
+        """
+        :param address: address string to look for
+        :return: true if there is a saved household with that address
+        """
+        return database.address_exists(self.conn, address)
+
+    def record(self, address: str) -> dict:
+        """
+        :param address: address string to look for
+        :return: dict of column name to value, None if there is no match
+        """
+        return database.fetch_record(self.conn, address)
+
+    def get(self, address: str) -> Household:
+        """
+        Reads a single saved household. Database version of main.get_household_from_df
+        :param address: "[street number] [street name],[city],[2 letter state] [5 number zip]"
+        :return: if match found: household object, if no match: None
+        """
+        record = self.record(address)
+        if record is None:
+            print("Error: HouseholdRepository.get given address not in database", file=sys.stderr)
+            return None
+        household = Household()
+        household.load_data(record)
+        return household
+
+    def remove(self, store: HouseholdStore, address: str) -> Household:
+        """
+        Removes a saved household through the store, so the removal is tracked and saved like any other
+        change. Database version of main.remove_household_from_df
+        :param store: HouseholdStore opened on this repository, such as from main.open_store
+        :param address: "[street number] [street name],[city],[2 letter state] [5 number zip]"
+        :return: if match found: the household that was removed, if no match: None
+        """
+        household = store.get(address)
+        if household is None:
+            return None
+        store.remove(address)
+        return household
+
+    def block(self, zip_code: str, number: str) -> list[dict]:
+        """
+        :param zip_code: zip code to look for
+        :param number: house number to look for
+        :return: list of dicts of the saved households with both
+        """
+        return database.fetch_block(self.conn, zip_code, number)
+
+    # ------------------
+    # Many households
+    # ------------------
+
+    @staticmethod
+    def _where(zip_code: str = None, city: str = None, all_of=(), any_of=(), node: tuple = None) -> tuple[str, list]:
+        """
+        Builds the sql condition for a set of filters
+        :param zip_code: only include households in this zip code
+        :param city: only include households in this city. Case does not matter
+        :param all_of: flag column names that must all be 't'
+        :param any_of: flag column names where at least one must be 't'
+        :param node: optional parsed filter from triage.parse
+        :return: (sql condition, "1" if there are no filters, list of parameters)
+        """
+        conditions = []
+        params = []
+        if zip_code:
+            conditions.append(FILTER_SQL['zip_code'])
+            params.append(zip_code)
+        if city:
+            conditions.append(FILTER_SQL['city'])
+            params.append(city)
+        if all_of:
+            conditions.append(FILTER_SQL['all_of'])
+            params += [flags.mask(*all_of)] * 2
+        if any_of:
+            conditions.append(FILTER_SQL['any_of'])
+            params.append(flags.mask(*any_of))
+        if node is not None and node[0] != 'all':
+            condition, node_params = triage.to_sql(node)
+            conditions.append(f"({condition})")
+            params += node_params
+        return " AND ".join(conditions) or "1", params
+
+    def count(self, zip_code: str = None, city: str = None, all_of=(), any_of=(), node: tuple = None) -> int:
+        """
+        Counts the saved households that match the filters, without reading them
+        :param zip_code: only count households in this zip code
+        :param city: only count households in this city. Case does not matter
+        :param all_of: flag column names that must all be 't'
+        :param any_of: flag column names where at least one must be 't'
+        :param node: optional parsed filter from triage.parse
+        :return: number of matching households
+        """
+        where, params = self._where(zip_code, city, all_of, any_of, node)
+        return self.conn.execute(f'SELECT COUNT(*) FROM "{database.TABLE_NAME}" WHERE {where}',
+                                 params).fetchone()[0]
+
+    def options(self, zip_code: str = None, city: str = None, all_of=(), any_of=(), node: tuple = None,
+                limit: int = None, after: str = None) -> list[str]:
+        """
+        Lists the addresses of the saved households that match the filters, in address order, without reading
+        the rest of each household. Database version of main.df_to_options
+        :param zip_code: only include households in this zip code
+        :param city: only include households in this city. Case does not matter
+        :param all_of: flag column names that must all be 't'
+        :param any_of: flag column names where at least one must be 't'
+        :param node: optional parsed filter from triage.parse
+        :param limit: max number of addresses. All of them if not given
+        :param after: only include addresses that come after this one, to read the list a piece at a time
+        :return: list of address strings
+        """
+        where, params = self._where(zip_code, city, all_of, any_of, node)
+        if after is not None:
+            where += " AND address > ?"
+            params.append(after)
+        sql = f'SELECT address FROM "{database.TABLE_NAME}" WHERE {where} ORDER BY address'
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [row[0] for row in self.conn.execute(sql, params)]
+
+    def find(self, zip_code: str = None, city: str = None, all_of=(), any_of=(), node: tuple = None,
+             limit: int = None) -> pd.DataFrame:
+        """
+        Reads the saved households that match the filters, in address order
+        :param zip_code: only include households in this zip code
+        :param city: only include households in this city. Case does not matter
+        :param all_of: flag column names that must all be 't'
+        :param any_of: flag column names where at least one must be 't'
+        :param node: optional parsed filter from triage.parse
+        :param limit: max number of households. All of them if not given
+        :return: dataframe of household data
+        """
+        import pandas as pd
+
+        where, params = self._where(zip_code, city, all_of, any_of, node)
+        col_list = ", ".join(f'"{col}"' for col in flags.PACKED_COLUMNS)
+        sql = f'SELECT {col_list} FROM "{database.TABLE_NAME}" WHERE {where} ORDER BY address'
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        records = [database.record_from_row(row) for row in self.conn.execute(sql, params)]
+        return pd.DataFrame(records, columns=hh.COLUMNS)
+
+    def chunks(self, zip_code: str = None, city: str = None, all_of=(), any_of=(), node: tuple = None,
+               chunk_size: int = 50000, limit: int = None):
+        """
+        Reads the saved households that match the filters a chunk at a time, unsorted, so only one chunk is
+        ever held in memory. See database.fetch_chunks
+        :param zip_code: only include households in this zip code
+        :param city: only include households in this city. Case does not matter
+        :param all_of: flag column names that must all be 't'
+        :param any_of: flag column names where at least one must be 't'
+        :param node: optional parsed filter from triage.parse
+        :param chunk_size: max number of households in each chunk
+        :param limit: max number of households to read. All of them if not given
+        :return: iterator of lists of tuples with the values in flags.PACKED_COLUMNS order
+        """
+        where, params = self._where(zip_code, city, all_of, any_of, node)
+        return database.fetch_chunks(self.conn, where, params, chunk_size, limit)
+
+    def search(self, text: str, limit: int = None) -> pd.DataFrame:
+        """
+        Finds the saved households where every word of the search text appears in the address, email or
+        phone. See database.search_households
+        :param text: words to search for
+        :param limit: max number of households. All of them if not given
+        :return: dataframe of household data, in address order
+        """
+        return database.search_households(self.conn, text, limit)
+
+    def page_addresses(self, limit: int, after: str = None, before: str = None, start: str = None,
+                       zip_code: str = None) -> list[str]:
+        """
+        Reads just the addresses of one page of households. See database.fetch_page_addresses
+        :return: list of the addresses on the page, in address order
+        """
+        return database.fetch_page_addresses(self.conn, limit, after=after, before=before, start=start,
+                                             zip_code=zip_code)
+
+    def rollups(self) -> pd.DataFrame:
+        """
+        :return: dataframe of the saved totals of every zip code and city pair. See database.fetch_rollups
+        """
+        return database.fetch_rollups(self.conn)
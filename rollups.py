@@ -0,0 +1,144 @@
+"""
+rollups.py
+Author: Russell Johnson
+Date 9 Dec 2025
+SER416 Final Project
+Running totals of households, adults, children and each yes/no flag for every zip code and city pair.
+The saved totals live in the rollups table of the database and are kept up to date by triggers (see
+database.py). The totals here track the changes that have not been saved yet, so a summary is the saved
+totals plus these, and costs the number of zip codes instead of the number of households
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import flags
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ------------------
+# Constants
+# ------------------
+
+KEY_COLUMNS = ["adrs_zip", "adrs_city"]
+# households is the number of households, adults and children are the number of people, and each flag
+# column is the number of households that answered yes to it
+TOTAL_COLUMNS = ["households", "adults", "children"] + flags.FLAG_COLUMNS
+GROUPINGS = {"zip": "adrs_zip", "city": "adrs_city"}
+
+
+# ------------------
+# Rollups class
+# ------------------
+
+class Rollups:
+    """
+    Totals for each (zip code, city) pair. Amounts can be negative, since removing a saved household takes
+    it away from the saved totals
+    """
+
+    def __init__(self) -> None:
+        self.totals = {}  # (zip code, city) -> list of amounts in TOTAL_COLUMNS order
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+    def add(self, zip_code: str, city: str, adults, children, flag_values: int, sign: int = 1) -> None:
+        """
+        Adds (or with a sign of -1 takes away) one household
+        :param zip_code: zip code of the household
+        :param city: city of the household
+        :param adults: number of adults, as a number or digit string
+        :param children: number of children, as a number or digit string
+        :param flag_values: packed flag value bits of the household
+        :param sign: 1 to add the household, -1 to take it away
+        """
+        amounts = self.totals.setdefault((zip_code, city), [0] * len(TOTAL_COLUMNS))
+        amounts[0] += sign
+        amounts[1] += sign * int(adults)
+        amounts[2] += sign * int(children)
+        for i, bit in enumerate(flags.FLAG_BITS.values(), 3):
+            if flag_values & bit:
+                amounts[i] += sign
+
+    def add_record(self, record: dict, sign: int = 1) -> None:
+        """
+        Adds (or with a sign of -1 takes away) one household
+        :param record: dict of household column name to value
+        :param sign: 1 to add the household, -1 to take it away
+        """
+        self.add(record['adrs_zip'], record['adrs_city'], record['adults'], record['children'],
+                 flags.pack(record)[0], sign)
+
+    def add_frame(self, df: pd.DataFrame) -> None:
+        """
+        Adds every household in a dataframe, totalling each zip code and city pair all at once
+        :param df: dataframe of household data
+        """
+        import pandas as pd
+
+        if len(df) == 0:
+            return
+        values, _ = flags.pack_frame(df)
+        columns = {col: df[col].tolist() for col in KEY_COLUMNS}
+        columns["households"] = 1
+        columns["adults"] = pd.to_numeric(df['adults']).to_numpy()
+        columns["children"] = pd.to_numeric(df['children']).to_numpy()
+        for col, bit in flags.FLAG_BITS.items():
+            columns[col] = (values & bit) != 0
+        grouped = pd.DataFrame(columns).groupby(KEY_COLUMNS, sort=False)[TOTAL_COLUMNS].sum()
+        for key, amounts in zip(grouped.index.tolist(), grouped.to_numpy().tolist()):
+            current = self.totals.get(key)
+            self.totals[key] = amounts if current is None else [a + b for a, b in zip(current, amounts)]
+
+    def add_rollups(self, other: "Rollups") -> None:
+        """
+        Adds every total of another set of rollups to these
+        :param other: rollups to add
+        """
+        for key, amounts in other.totals.items():
+            current = self.totals.get(key)
+            self.totals[key] = list(amounts) if current is None else [a + b for a, b in zip(current, amounts)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        :return: dataframe with the KEY_COLUMNS and TOTAL_COLUMNS of each zip code and city pair
+        """
+        import pandas as pd
+
+        return pd.DataFrame([key + tuple(amounts) for key, amounts in self.totals.items()],
+                            columns=KEY_COLUMNS + TOTAL_COLUMNS)
+
+
+# ------------------
+# Reports
+# ------------------
+
+def combine(saved: pd.DataFrame, unsaved: Rollups) -> pd.DataFrame:
+    """
+    Adds unsaved changes to saved totals
+    :param saved: dataframe of saved totals, such as from database.fetch_rollups
+    :param unsaved: totals of the changes that are not saved yet
+    :return: dataframe of totals for each zip code and city pair that still has households
+    """
+    import pandas as pd
+
+    if len(unsaved) == 0:
+        return saved
+    both = pd.concat([saved, unsaved.to_dataframe()], ignore_index=True)
+    totals = both.groupby(KEY_COLUMNS, as_index=False)[TOTAL_COLUMNS].sum()
+    return totals[totals['households'] > 0].reset_index(drop=True)
+
+
+def summarize(totals: pd.DataFrame, by: str = "zip", value: str = None) -> pd.DataFrame:
+    """
+    Totals zip code and city pairs up by zip code or by city
+    :param totals: dataframe of totals for each zip code and city pair, such as from combine
+    :param by: "zip" or "city"
+    :param value: optional zip code or city to only include. Case does not matter for cities
+    :return: dataframe with the grouping column and TOTAL_COLUMNS, sorted by the grouping column
+    """
+    column = GROUPINGS[by]
+    if value:
+        keys = totals[column]
+        totals = totals[keys.str.lower() == value.lower() if by == "city" else keys == value]
+    return totals.groupby(column, as_index=False)[TOTAL_COLUMNS].sum().sort_values(column, ignore_index=True)
@@ -0,0 +1,349 @@
+"""
+triage.py
+Author: Russell Johnson
+Date 8 Dec 2025
+SER416 Final Project
+Finds and ranks the households that need help first during an incident. A filter is written as a short
+expression such as "special_needs or (ref_meds and children > 0)", and the households that match are
+ordered by a priority score made from weighted flags and household sizes. The filter and score are turned
+into a single SQL query when the households are read from the database, or into numpy array math over the
+packed flags when they are in memory, so ranking a whole county never loops over households in python
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+import operator
+import re
+import sqlite3
+import flags
+import database
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# ------------------
+# Constants
+# ------------------
+
+# household size columns that can be compared and weighted. Flags are every name in flags.FLAG_COLUMNS
+COUNT_COLUMNS = ["adults", "children"]
+COMPARISONS = {"=": "=", "==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+OPERATORS = {"=": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt,
+             ">=": operator.ge}
+
+# used when the user does not give their own filter or weights
+DEFAULT_FILTER = "special_needs or crit_meds or ref_meds or gas_tank or gas_line"
+DEFAULT_WEIGHTS = {
+    "special_needs": 8,
+    "crit_meds": 6,
+    "ref_meds": 4,
+    "gas_line": 2,
+    "gas_tank": 2,
+    "children": 1,  # per child
+}
+
+PRIORITY_COLUMN = "priority"
+EXPORT_FILENAME = "triage_list.csv"  # where the full ranking is written when it is too long to show
+
+_TOKEN_PATTERN = re.compile(r"\s*(?:(\d+)|([A-Za-z_]+)|(==|!=|<=|>=|[=<>()]))")
+
+
+class TriageError(ValueError):
+    """
+    A filter or weight list that could not be understood. The message says what is wrong with it
+    """
+
+
+# ------------------
+# Parsing filters
+# ------------------
+
+def _tokenize(text: str) -> list[str]:
+    """
+    :param text: filter expression
+    :return: list of numbers, words and symbols in the expression. Words are lowercase
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise TriageError(f"can't understand {text[position:].strip()!r}")
+        tokens.append(match.group(match.lastindex).lower())
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent parser for filter expressions. "not" binds tighter than "and", which binds tighter
+    than "or". Parsed filters are nested tuples:
+        ('flag', name)  ('count', column, operator, number)  ('not', filter)
+        ('and', filter, filter)  ('or', filter, filter)  ('all',)
+    """
+
+    def __init__(self, text: str) -> None:
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def _peek(self) -> str:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _take(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise TriageError("filter ends too soon")
+        self.position += 1
+        return token
+
+    def parse(self) -> tuple:
+        if not self.tokens:
+            return ('all',)
+        node = self._or()
+        if self._peek() is not None:
+            raise TriageError(f"unexpected {self._peek()!r}")
+        return node
+
+    def _or(self) -> tuple:
+        node = self._and()
+        while self._peek() == "or":
+            self._take()
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self) -> tuple:
+        node = self._not()
+        while self._peek() == "and":
+            self._take()
+            node = ('and', node, self._not())
+        return node
+
+    def _not(self) -> tuple:
+        if self._peek() == "not":
+            self._take()
+            return ('not', self._not())
+        return self._atom()
+
+    def _atom(self) -> tuple:
+        token = self._take()
+        if token == "(":
+            node = self._or()
+            if self._take() != ")":
+                raise TriageError("missing )")
+            return node
+        if token in flags.FLAG_BITS:
+            return ('flag', token)
+        if token in COUNT_COLUMNS:
+            comparison = self._take()
+            if comparison not in COMPARISONS:
+                raise TriageError(f"{token} must be compared to a number, like {token} > 0")
+            number = self._take()
+            if not number.isdigit():
+                raise TriageError(f"{token} must be compared to a number, not {number!r}")
+            return ('count', token, COMPARISONS[comparison], int(number))
+        raise TriageError(f"unknown field {token!r}. Use one of: "
+                          f"{', '.join(flags.FLAG_COLUMNS + COUNT_COLUMNS)}")
+
+
+def parse(text: str) -> tuple:
+    """
+    Parses a filter expression. Flag names match households where that flag is 't', adults and children
+    can be compared to a number, and these can be combined with and, or, not and parentheses.
+    A blank filter matches every household
+    :param text: filter expression, such as "special_needs and not gas_line"
+    :return: parsed filter
+    """
+    return _Parser(text).parse()
+
+
+def parse_weights(text: str) -> dict:
+    """
+    Parses a list of priority weights
+    :param text: comma separated name=weight pairs, such as "special_needs=8, children=1". Blank gives
+        DEFAULT_WEIGHTS
+    :return: dict of flag or count column name to integer weight
+    """
+    if not text.strip():
+        return dict(DEFAULT_WEIGHTS)
+    weights = {}
+    for pair in text.split(","):
+        name, _, weight = pair.partition("=")
+        name = name.strip().lower()
+        weight = weight.strip()
+        if name not in flags.FLAG_BITS and name not in COUNT_COLUMNS:
+            raise TriageError(f"unknown field {name!r} in weights")
+        if not weight.lstrip("-").isdigit():
+            raise TriageError(f"weight for {name} must be a whole number, like {name}=5")
+        weights[name] = int(weight)
+    return weights
+
+
+# ------------------
+# SQL
+# ------------------
+
+def to_sql(node: tuple) -> tuple[str, list]:
+    """
+    Turns a parsed filter into a SQL condition over the packed flag columns
+    :param node: parsed filter
+    :return: (sql condition, list of parameters)
+    """
+    kind = node[0]
+    if kind == 'all':
+        return "1", []
+    if kind == 'flag':
+        return f"(flag_values & {flags.FLAG_BITS[node[1]]}) != 0", []
+    if kind == 'count':
+        return f'"{node[1]}" {node[2]} ?', [node[3]]
+    if kind == 'not':
+        sql, params = to_sql(node[1])
+        return f"NOT ({sql})", params
+    left_sql, left_params = to_sql(node[1])
+    right_sql, right_params = to_sql(node[2])
+    return f"({left_sql}) {kind.upper()} ({right_sql})", left_params + right_params
+
+
+def score_sql(weights: dict) -> str:
+    """
+    :param weights: dict of flag or count column name to weight
+    :return: SQL expression for the priority score of a household
+    """
+    terms = [f"((flag_values & {flags.FLAG_BITS[name]}) != 0) * {weight}" if name in flags.FLAG_BITS
+             else f'"{name}" * {weight}' for name, weight in weights.items()]
+    return " + ".join(terms) if terms else "0"
+
+
+def scope_sql(zip_code: str = None, city: str = None) -> tuple[str, list]:
+    """
+    :return: (sql condition, list of parameters) limiting the households to a zip code and/or city
+    """
+    conditions = []
+    params = []
+    if zip_code:
+        conditions.append("adrs_zip = ?")
+        params.append(zip_code)
+    if city:
+        conditions.append("adrs_city = ? COLLATE NOCASE")
+        params.append(city)
+    return " AND ".join(conditions) or "1", params
+
+
+def rank_database(conn: sqlite3.Connection, node: tuple, weights: dict = None, zip_code: str = None,
+                  city: str = None, limit: int = None) -> pd.DataFrame:
+    """
+    Finds and ranks matching households with a single query, without reading the rest of the table.
+    Scoping by zip code uses the zip/flags index
+    :param conn: open database connection
+    :param node: parsed filter
+    :param weights: dict of flag or count column name to weight. Defaults to DEFAULT_WEIGHTS
+    :param zip_code: only include households in this zip code
+    :param city: only include households in this city. Case does not matter
+    :param limit: max number of households to return. All of them if not given
+    :return: dataframe of household data plus a priority column, highest priority first
+    """
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    filter_sql, filter_params = to_sql(node)
+    scope, scope_params = scope_sql(zip_code, city)
+    df, priorities = database.fetch_ranked(conn, f"({scope}) AND ({filter_sql})", scope_params + filter_params,
+                                           score_sql(weights), limit)
+    df[PRIORITY_COLUMN] = priorities
+    return df
+
+
+# ------------------
+# Numpy
+# ------------------
+
+def evaluate(node: tuple, columns: dict) -> object:
+    """
+    Runs a parsed filter over whole columns at once
+    :param node: parsed filter
+    :param columns: dict with a numpy array for flag_values and for each name in COUNT_COLUMNS
+    :return: numpy array of true/false, one per household
+    """
+    import numpy as np
+
+    kind = node[0]
+    if kind == 'all':
+        return np.ones(len(columns['flag_values']), dtype=bool)
+    if kind == 'flag':
+        return (columns['flag_values'] & flags.FLAG_BITS[node[1]]) != 0
+    if kind == 'count':
+        return OPERATORS[node[2]](columns[node[1]], node[3])
+    if kind == 'not':
+        return ~evaluate(node[1], columns)
+    if kind == 'and':
+        return evaluate(node[1], columns) & evaluate(node[2], columns)
+    return evaluate(node[1], columns) | evaluate(node[2], columns)
+
+
+def score(weights: dict, columns: dict) -> object:
+    """
+    :param weights: dict of flag or count column name to weight
+    :param columns: dict with a numpy array for flag_values and for each name in COUNT_COLUMNS
+    :return: numpy array with the priority score of each household
+    """
+    import numpy as np
+
+    total = np.zeros(len(columns['flag_values']), dtype=np.int64)
+    for name, weight in weights.items():
+        if name in flags.FLAG_BITS:
+            total += ((columns['flag_values'] & flags.FLAG_BITS[name]) != 0) * weight
+        else:
+            total += columns[name] * weight
+    return total
+
+
+def _convert_distinct(values: list, convert, dtype) -> object:
+    """
+    Converts a column to a numpy array, calling convert only once for each different value. Columns like
+    household size or city hold a million values but only a handful of different ones
+    :param values: list of values
+    :param convert: function that converts one value
+    :param dtype: numpy type of the converted values
+    :return: numpy array of converted values
+    """
+    import numpy as np
+
+    converted = {value: convert(value) for value in set(values)}
+    return np.fromiter(map(converted.__getitem__, values), dtype=dtype, count=len(values))
+
+
+def rank_store(store, node: tuple, weights: dict = None, zip_code: str = None, city: str = None,
+               limit: int = None) -> pd.DataFrame:
+    """
+    Finds and ranks matching households in a household store, including changes that are not saved yet
+    :param store: HouseholdStore
+    :param node: parsed filter
+    :param weights: dict of flag or count column name to weight. Defaults to DEFAULT_WEIGHTS
+    :param zip_code: only include households in this zip code
+    :param city: only include households in this city. Case does not matter
+    :param limit: max number of households to return. All of them if not given
+    :return: dataframe of household data plus a priority column, highest priority first
+    """
+    import numpy as np
+
+    weights = DEFAULT_WEIGHTS if weights is None else weights
+    addresses, values, _ = store.flag_arrays()
+    columns = {'flag_values': values}
+    for col in COUNT_COLUMNS:  # sizes are stored as the digit strings the user typed
+        columns[col] = _convert_distinct(store.column_values(col), int, np.int64)
+    matches = evaluate(node, columns)
+    if zip_code:
+        matches &= _convert_distinct(store.column_values('adrs_zip'), lambda value: value == zip_code, bool)
+    if city:
+        city = city.lower()
+        matches &= _convert_distinct(store.column_values('adrs_city'), lambda value: value.lower() == city, bool)
+
+    slots = matches.nonzero()[0]
+    scores = score(weights, columns)[slots]
+    if limit is not None and limit < len(slots):
+        # only the households scoring at least as high as the limit-th best can make the list
+        cutoff = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+        keep = scores >= cutoff
+        slots = slots[keep]
+        scores = scores[keep]
+    ranked = sorted(zip((-scores).tolist(), [addresses[slot] for slot in slots]))[:limit]
+    df = store.frame([address for _, address in ranked])
+    df[PRIORITY_COLUMN] = np.array([-negative for negative, _ in ranked], dtype=np.int64)
+    return df